@@ -2,7 +2,7 @@ from logging.config import fileConfig
 from os import getenv
 
 from alembic import context
-from app.db import base
+from app.db import base, partitions
 from sqlalchemy import engine_from_config, pool
 
 # this is the Alembic Config object, which provides
@@ -45,6 +45,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=partitions.include_object,
     )
 
     with context.begin_transaction():
@@ -66,7 +67,9 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=partitions.include_object,
         )
 
         with context.begin_transaction():
@@ -1,13 +1,17 @@
-from typing import Annotated, Generator
+from functools import partial
+from typing import Annotated, Generator, Optional
+from uuid import UUID
 
 from app.core.config import settings
 from app.core.security import ALGORITHM
 from app.crud import user
-from app.db.session import SessionLocal
+from app.db.last_writes import last_writes
+from app.db.session import SessionLocal, replicas
 from app.models import User
 from app.schemas import TokenPayload
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.security.utils import get_authorization_scheme_param
 from jose import jwt
 from jose.exceptions import JWTError
 from pydantic import ValidationError
@@ -18,29 +22,74 @@ reusable_oauth2 = OAuth2PasswordBearer(
 )
 
 
-def get_db() -> Generator:
+def read_token(token: str) -> Optional[TokenPayload]:
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[ALGORITHM]
+        )
+        return TokenPayload(**payload)
+    except (JWTError, ValidationError):
+        return None
+
+
+def token_user_id(request: Request) -> Optional[UUID]:
+    """
+    The user of the bearer token of the request, if it has a valid one.
+    """
+    scheme, token = get_authorization_scheme_param(
+        request.headers.get("Authorization")
+    )
+    if scheme.lower() != "bearer":
+        return None
+    token_data = read_token(token)
+    return token_data.sub if token_data is not None else None
+
+
+def read_session(user_id: Optional[UUID]) -> Session:
+    """
+    Read-only session that sees the last write of the user.
+    """
+    min_lsn = last_writes.get(user_id) if replicas and user_id else 0
+    return SessionLocal(info={"read_only": True, "min_lsn": min_lsn})
+
+
+def get_db(request: Request) -> Generator:
     try:
         db = SessionLocal()
+        user_id = token_user_id(request)
+        if replicas and user_id is not None:
+            db.info["on_commit"] = partial(last_writes.remember, user_id)
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request) -> Generator:
+    try:
+        db = read_session(token_user_id(request))
         yield db
     finally:
         db.close()
 
 
 async def get_current_user(
-    db: Annotated[Session, Depends(get_db)],
     token: Annotated[str, Depends(reusable_oauth2)],
 ) -> User:
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-    except (JWTError, ValidationError):
+    token_data = read_token(token)
+    if token_data is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user_obj = user.get(db, id=token_data.sub)
+    # A session of its own, closed before the endpoint runs, so that write
+    # endpoints only hold the connection of `get_db`
+    with read_session(token_data.sub) as db:
+        user_obj = user.get(db, id=token_data.sub)
+    if not user_obj and replicas:
+        # Registering is not tied to a token, so replicas may not have
+        # replayed it yet
+        with SessionLocal() as db:
+            user_obj = user.get(db, id=token_data.sub)
     if not user_obj:
         raise HTTPException(status_code=404, detail="User not found")
     return user_obj
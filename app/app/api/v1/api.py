@@ -1,5 +1,7 @@
 from app.api.v1.endpoints.answer import router as answer_router
 from app.api.v1.endpoints.attempt import router as attempt_router
+from app.api.v1.endpoints.event import router as event_router
+from app.api.v1.endpoints.live import router as live_router
 from app.api.v1.endpoints.question import router as question_router
 from app.api.v1.endpoints.quiz import router as quiz_router
 from app.api.v1.endpoints.solution import router as solution_router
@@ -11,6 +13,8 @@ from fastapi import APIRouter
 api_router = APIRouter()
 api_router.include_router(answer_router, prefix="/answer", tags=["answer"])
 api_router.include_router(attempt_router, prefix="/attempt", tags=["attempt"])
+api_router.include_router(event_router, prefix="/event", tags=["event"])
+api_router.include_router(live_router, prefix="/live", tags=["live"])
 api_router.include_router(
     question_router, prefix="/question", tags=["question"]
 )
@@ -52,15 +52,38 @@ async def add(
             status_code=400,
             detail="Cannot add answer to question of published quiz",
         )
-    answer = answer_crud.create_with_question_and_adjust_point(
+    answer = answer_crud.create_with_question(
         db=db, obj_in=answer_in, question_id=question_id
     )
     return answer
 
 
+@router.put("/quiz/{quiz_id}/point", response_model=list[AnswerSchema])
+async def adjust_points(
+    db: Annotated[Session, Depends(deps.get_db)],
+    quiz_id: UUID,
+    current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+) -> list[AnswerModel]:
+    quiz = quiz_crud.get(db, quiz_id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    if quiz.author_id != current_user.id:
+        raise HTTPException(
+            status_code=403,
+            detail="Only the author of the quiz can adjust its answer points",
+        )
+    if quiz.published:
+        raise HTTPException(
+            status_code=400,
+            detail="Answer points of published quiz cannot be adjusted",
+        )
+    answers = answer_crud.adjust_points_by_quiz(db, quiz_id=quiz_id)
+    return answers
+
+
 @router.get("/{id}", response_model=AnswerSchema)
 async def read(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> AnswerModel:
@@ -83,7 +106,7 @@ async def read(
 
 @router.get("/question/{question_id}", response_model=list[AnswerSchema])
 async def read_by_question(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     question_id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> AnswerModel:
@@ -121,13 +144,21 @@ async def edit(
         raise HTTPException(
             status_code=403, detail="Only the author can edit this answer"
         )
-    if quiz.published:
+    # Correcting the key of a published quiz is allowed, the author then
+    # regrades its submissions
+    if quiz.published and answer_in.dict(exclude_unset=True).keys() - {
+        "is_correct"
+    }:
         raise HTTPException(
             status_code=400,
-            detail="Answer of question on published quiz cannot be edited",
+            detail="Only the correctness of an answer of question on "
+            "published quiz can be edited",
         )
-    answer = answer_crud.update(db=db, db_obj=answer, obj_in=answer_in)
-    return answer
+    if quiz.published:
+        return answer_crud.update_and_adjust_points(
+            db, db_obj=answer, obj_in=answer_in, quiz_id=quiz.id
+        )
+    return answer_crud.update(db=db, db_obj=answer, obj_in=answer_in)
 
 
 @router.delete("/{id}", response_model=AnswerSchema)
@@ -5,8 +5,8 @@ from app.api import deps
 from app.crud import attempt as attempt_crud
 from app.crud import question as question_crud
 from app.crud import quiz as quiz_crud
-from app.crud import solution as solution_crud
 from app.crud import submission as submission_crud
+from app.db import archive
 from app.models import Attempt as AttemptModel
 from app.models import User as UserModel
 from app.schemas import Attempt as AttemptSchema
@@ -45,13 +45,6 @@ async def draft(
             detail="You cannot attempt to question "
             "of other people unpublished quiz",
         )
-    attempt = attempt_crud.get_by_submission_question(
-        db=db, question_id=question_id, submission_id=submission_id
-    )
-    if attempt:
-        raise HTTPException(
-            status_code=403, detail="You already attempt to this question"
-        )
     obj_in = {
         "time_remaining": str(question.duration) if question.duration else None
     }
@@ -60,28 +53,35 @@ async def draft(
         obj_in=obj_in,
         question_id=question_id,
         submission_id=submission_id,
+        quiz_id=submission.quiz_id,
+        user_id=submission.user_id,
     )
+    if not attempt:
+        raise HTTPException(
+            status_code=403, detail="You already attempt to this question"
+        )
     return attempt
 
 
 @router.get("/{id}", response_model=AttemptSchema)
 async def read(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> AttemptModel:
     attempt = attempt_crud.get(db, id=id)
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
-    submission = submission_crud.get(db, attempt.submission_id)
-    question = question_crud.get(db, attempt.question_id)
-    quiz = quiz_crud.get(db, question.quiz_id)
-    if current_user.id not in {submission.user_id, quiz.author_id}:
+    if current_user.id == attempt.user_id:
+        return attempt
+    quiz = quiz_crud.get(db, attempt.quiz_id)
+    if current_user.id != quiz.author_id:
         raise HTTPException(
             status_code=403,
             detail="You don't have permission to see this attempt",
         )
-    if current_user.id != submission.user_id and submission.draft:
+    submission = submission_crud.get(db, attempt.submission_id)
+    if submission.draft:
         raise HTTPException(
             status_code=403, detail="This attempt is still in draft"
         )
@@ -90,7 +90,7 @@ async def read(
 
 @router.get("/submission/{submission_id}", response_model=list[AttemptSchema])
 async def read_by_submission(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     submission_id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> list[AttemptModel]:
@@ -107,6 +107,8 @@ async def read_by_submission(
         raise HTTPException(
             status_code=403, detail="This attempt is still in draft"
         )
+    if submission.archive:
+        return archive.read_attempts(submission.archive, submission_id)
     attempts = attempt_crud.get_multi_by_submission(
         db, submission_id=submission_id
     )
@@ -119,6 +121,9 @@ async def skip(
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> AttemptModel:
+    attempt = attempt_crud.skip(db, id=id, user_id=current_user.id)
+    if attempt:
+        return attempt
     attempt = attempt_crud.get(db=db, id=id)
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
@@ -130,8 +135,7 @@ async def skip(
         raise HTTPException(
             status_code=400, detail="This attempt already skipped"
         )
-    submission = submission_crud.get(db, attempt.submission_id)
-    if submission.user_id != current_user.id:
+    if attempt.user_id != current_user.id:
         raise HTTPException(
             status_code=400,
             detail="You don't have permission to skip the attempt",
@@ -141,8 +145,9 @@ async def skip(
         raise HTTPException(
             status_code=400, detail="This question is not resumable/skippable"
         )
-    attempt = attempt_crud.skip(db=db, db_obj=attempt)
-    return attempt
+    raise HTTPException(
+        status_code=409, detail="This attempt was changed, please retry"
+    )
 
 
 @router.put("/resume/{id}", response_model=AttemptSchema)
@@ -151,6 +156,9 @@ async def resume(
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> AttemptModel:
+    attempt = attempt_crud.resume(db, id=id, user_id=current_user.id)
+    if attempt:
+        return attempt
     attempt = attempt_crud.get(db=db, id=id)
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
@@ -162,14 +170,14 @@ async def resume(
         raise HTTPException(
             status_code=400, detail="This attempt is not skipped"
         )
-    submission = submission_crud.get(db, attempt.submission_id)
-    if submission.user_id != current_user.id:
+    if attempt.user_id != current_user.id:
         raise HTTPException(
             status_code=400,
             detail="You don't have permission to resume the attempt",
         )
-    attempt = attempt_crud.resume(db, db_obj=attempt)
-    return attempt
+    raise HTTPException(
+        status_code=409, detail="This attempt was changed, please retry"
+    )
 
 
 @router.put("/submit/{id}", response_model=AttemptSchema)
@@ -178,6 +186,9 @@ async def submit(
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> AttemptModel:
+    attempt = attempt_crud.submit(db, id=id, user_id=current_user.id)
+    if attempt:
+        return attempt
     attempt = attempt_crud.get(db=db, id=id)
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
@@ -187,12 +198,11 @@ async def submit(
         raise HTTPException(
             status_code=400, detail="Please submit before submitting"
         )
-    submission = submission_crud.get(db, attempt.submission_id)
-    if submission.user_id != current_user.id:
+    if attempt.user_id != current_user.id:
         raise HTTPException(
             status_code=403,
             detail="You have no permission to submit this draft",
         )
-    score = solution_crud.sum_point_by_attempt(db, attempt_id=id)
-    attempt = attempt_crud.submit(db, db_obj=attempt, score=score)
-    return attempt
+    raise HTTPException(
+        status_code=409, detail="This attempt was changed, please retry"
+    )
@@ -0,0 +1,32 @@
+from typing import Annotated
+
+from app.api import deps
+from app.core.config import settings
+from app.db import outbox
+from app.models import User as UserModel
+from app.schemas import OutboxPage
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+router = APIRouter()
+
+
+@router.get("/", response_model=OutboxPage)
+async def read_events(
+    db: Annotated[Session, Depends(deps.get_read_db)],
+    current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+    cursor: str = "",
+    limit: Annotated[int, Query(gt=0, le=1000)] = 100,
+) -> OutboxPage:
+    if current_user.id not in settings.OUTBOX_CONSUMERS:
+        raise HTTPException(
+            status_code=403, detail="Only consumers can read the events"
+        )
+    try:
+        events, positions = outbox.read(db, outbox.parse_cursor(cursor), limit)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    return OutboxPage(
+        events=[outbox.encode(name, event) for name, event in events],
+        cursor=outbox.format_cursor(positions),
+    )
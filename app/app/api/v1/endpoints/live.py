@@ -0,0 +1,308 @@
+from asyncio import FIRST_COMPLETED, create_task, sleep, wait
+from datetime import timedelta
+from json import JSONDecodeError
+from typing import Annotated, Any, AsyncIterator, Callable, Optional, Union
+from uuid import UUID
+
+from app.api import deps
+from app.core.config import settings
+from app.crud import answer as answer_crud
+from app.crud import attempt as attempt_crud
+from app.crud import solution as solution_crud
+from app.crud import submission as submission_crud
+from app.crud import user as user_crud
+from app.db.session import SessionLocal, shards
+from app.models import User as UserModel
+from app.schemas import (
+    LiveSubmitted,
+    LiveTime,
+    SolutionBatch,
+    SolutionBatchResult,
+    SolutionRejection,
+)
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+router = APIRouter()
+
+LiveMessage = Union[LiveTime, LiveSubmitted]
+
+
+class LiveSession:
+    def __init__(self, submission_id: UUID, quiz_id: UUID, user_id: UUID):
+        """
+        Live channel of a candidate on their submission.
+
+        The question of every attempt and the question and point of every
+        answer are cached for the lifetime of the channel, so a batch of
+        selections only reads what it has not seen before.
+        """
+        self.submission_id = submission_id
+        self.quiz_id = quiz_id
+        self.user_id = user_id
+        self._questions: dict[UUID, UUID] = {}
+        self._answers: dict[UUID, tuple[UUID, float]] = {}
+
+    @classmethod
+    def open(
+        cls, db: Session, submission_id: UUID, user: Optional[UserModel]
+    ) -> "LiveSession":
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        submission = submission_crud.get(db, submission_id)
+        if not submission:
+            raise HTTPException(status_code=404, detail="Submission not found")
+        if submission.user_id != user.id:
+            raise HTTPException(
+                status_code=403,
+                detail="You don't have permission to follow this submission",
+            )
+        return cls(submission.id, submission.quiz_id, user.id)
+
+    def tick(self, db: Session) -> LiveMessage:
+        """
+        Return the remaining time, submitting the submission on behalf of
+        the candidate once it has run out.
+        """
+        shards.use_quiz(db, self.quiz_id)
+        state = submission_crud.get_live_state(db, id=self.submission_id)
+        if (
+            state is not None
+            and state.draft
+            and not state.paused
+            and state.time_remaining is not None
+            and state.time_remaining <= timedelta(0)
+        ):
+            submission = submission_crud.submit(
+                db, id=self.submission_id, user_id=self.user_id
+            )
+            if submission:
+                return LiveSubmitted(forced=True, submission=submission)
+            state = submission_crud.get_live_state(db, id=self.submission_id)
+        if state is None or not state.draft:
+            submission = submission_crud.get(db, self.submission_id)
+            return LiveSubmitted(forced=False, submission=submission)
+        time_remaining = state.time_remaining
+        if time_remaining is not None:
+            time_remaining = max(time_remaining, timedelta(0))
+        return LiveTime(
+            server_time=state.server_time,
+            time_remaining=time_remaining,
+            paused=state.paused,
+        )
+
+    def question_of_attempt(
+        self, db: Session, attempt_id: UUID
+    ) -> Optional[UUID]:
+        if attempt_id not in self._questions:
+            attempt = attempt_crud.get(db, attempt_id)
+            if not attempt or attempt.submission_id != self.submission_id:
+                return None
+            self._questions[attempt_id] = attempt.question_id
+        return self._questions[attempt_id]
+
+    def answer(
+        self, db: Session, answer_id: UUID
+    ) -> Optional[tuple[UUID, float]]:
+        if answer_id not in self._answers:
+            answer = answer_crud.get(db, answer_id)
+            if not answer:
+                return None
+            self._answers[answer_id] = (answer.question_id, answer.point)
+        return self._answers[answer_id]
+
+    def apply(self, db: Session, batch: SolutionBatch) -> SolutionBatchResult:
+        """
+        Delete and then add the solutions of the batch, so that a batch can
+        unchoose an answer and choose it again.
+        """
+        shards.use_quiz(db, self.quiz_id)
+        state = submission_crud.get_live_state(db, id=self.submission_id)
+        if state is None or not state.draft:
+            return SolutionBatchResult(
+                rejected=[
+                    SolutionRejection(id=id, detail="Already submitted")
+                    for id in batch.delete
+                ]
+                + [
+                    SolutionRejection(
+                        **selection.dict(), detail="Already submitted"
+                    )
+                    for selection in batch.add
+                ]
+            )
+        deleted = solution_crud.delete_multi_by_user(
+            db, ids=batch.delete, user_id=self.user_id
+        )
+        rejected = [
+            SolutionRejection(id=id, detail="Solution not found")
+            for id in set(batch.delete) - set(deleted)
+        ]
+        objs_in = []
+        for selection in batch.add:
+            question_id = self.question_of_attempt(db, selection.attempt_id)
+            answer = self.answer(db, selection.answer_id)
+            if not question_id:
+                detail = "Attempt not found"
+            elif not answer:
+                detail = "Answer not found"
+            elif question_id != answer[0]:
+                detail = (
+                    "Can only solution to answer "
+                    "on the same question as the attempt"
+                )
+            else:
+                objs_in.append(
+                    {
+                        "point": answer[1],
+                        "attempt_id": selection.attempt_id,
+                        "answer_id": selection.answer_id,
+                        "quiz_id": self.quiz_id,
+                        "user_id": self.user_id,
+                    }
+                )
+                continue
+            rejected.append(
+                SolutionRejection(**selection.dict(), detail=detail)
+            )
+        added = solution_crud.create_multi(db, objs_in=objs_in)
+        created = {(s.attempt_id, s.answer_id) for s in added}
+        rejected += [
+            SolutionRejection(
+                attempt_id=obj_in["attempt_id"],
+                answer_id=obj_in["answer_id"],
+                detail="You already solution to this answer",
+            )
+            for obj_in in objs_in
+            if (obj_in["attempt_id"], obj_in["answer_id"]) not in created
+        ]
+        return SolutionBatchResult(
+            added=added, deleted=deleted, rejected=rejected
+        )
+
+
+def with_db(function: Callable[..., Any], *args: Any) -> Any:
+    # Every call takes its own session, so an idle channel holds no
+    # database connection.
+    with SessionLocal() as db:
+        return function(db, *args)
+
+
+def open_session(submission_id: UUID, token: str) -> LiveSession:
+    with SessionLocal() as db:
+        token_data = deps.read_token(token)
+        user = user_crud.get(db, id=token_data.sub) if token_data else None
+        return LiveSession.open(db, submission_id, user)
+
+
+async def ticks(session: LiveSession) -> AsyncIterator[LiveMessage]:
+    while True:
+        message = await run_in_threadpool(with_db, session.tick)
+        yield message
+        if isinstance(message, LiveSubmitted):
+            return
+        delay = settings.LIVE_TICK_SECONDS
+        if not message.paused and message.time_remaining is not None:
+            # Wake up when the time runs out to submit on time, but not more
+            # than once a second while a submit keeps losing a race.
+            delay = min(delay, max(message.time_remaining.total_seconds(), 1))
+        await sleep(delay)
+
+
+async def push_time(websocket: WebSocket, session: LiveSession) -> None:
+    async for message in ticks(session):
+        await websocket.send_json(jsonable_encoder(message))
+
+
+async def accept_solutions(websocket: WebSocket, session: LiveSession) -> None:
+    while True:
+        try:
+            batch = SolutionBatch.parse_obj(await websocket.receive_json())
+        except (JSONDecodeError, ValidationError) as e:
+            detail = e.errors() if isinstance(e, ValidationError) else str(e)
+            await websocket.send_json(
+                jsonable_encoder({"type": "error", "detail": detail})
+            )
+            continue
+        result = await run_in_threadpool(with_db, session.apply, batch)
+        await websocket.send_json(jsonable_encoder(result))
+
+
+@router.websocket("/submission/{submission_id}")
+async def live(websocket: WebSocket, submission_id: UUID, token: str) -> None:
+    """
+    Push `time` messages every `LIVE_TICK_SECONDS` and a `submitted` message
+    when the submission is submitted, after which the socket is closed.
+    Accept `SolutionBatch` messages, each answered by a `solutions` message.
+
+    Browsers cannot set headers on a WebSocket, so the access token is
+    passed as the `token` query parameter and checked once.
+    """
+    try:
+        session = await run_in_threadpool(open_session, submission_id, token)
+    except HTTPException as e:
+        await websocket.close(
+            code=status.WS_1008_POLICY_VIOLATION, reason=e.detail
+        )
+        return
+    await websocket.accept()
+    pushing = create_task(push_time(websocket, session))
+    accepting = create_task(accept_solutions(websocket, session))
+    done, pending = await wait(
+        {pushing, accepting}, return_when=FIRST_COMPLETED
+    )
+    for task in pending:
+        task.cancel()
+    for task in done:
+        error = task.exception()
+        if error is not None and not isinstance(error, WebSocketDisconnect):
+            raise error
+    if pushing in done and pushing.exception() is None:
+        await websocket.close()
+
+
+@router.get("/submission/{submission_id}")
+async def stream(submission_id: UUID, token: str) -> StreamingResponse:
+    """
+    Server-sent events fallback of the WebSocket. Selections are posted to
+    `/submission/{submission_id}/solutions` instead.
+    """
+    session = await run_in_threadpool(open_session, submission_id, token)
+
+    async def events() -> AsyncIterator[str]:
+        async for message in ticks(session):
+            yield f"event: {message.type}\ndata: {message.json()}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.post(
+    "/submission/{submission_id}/solutions",
+    response_model=SolutionBatchResult,
+)
+async def add_solutions(
+    db: Annotated[Session, Depends(deps.get_db)],
+    submission_id: UUID,
+    batch: SolutionBatch,
+    current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+) -> SolutionBatchResult:
+    session = LiveSession.open(db, submission_id, current_user)
+    return session.apply(db, batch)
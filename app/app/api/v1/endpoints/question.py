@@ -48,7 +48,7 @@ async def add(
 
 @router.get("/{id}", response_model=QuestionSchema)
 async def read(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> QuestionModel:
@@ -70,7 +70,7 @@ async def read(
 
 @router.get("/quiz/{quiz_id}", response_model=list[QuestionSchema])
 async def read_by_quiz(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     quiz_id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> QuestionModel:
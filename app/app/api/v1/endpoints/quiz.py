@@ -6,11 +6,13 @@ from app.core.config import settings
 from app.crud import answer as answer_crud
 from app.crud import question as question_crud
 from app.crud import quiz as quiz_crud
+from app.crud import submission as submission_crud
+from app.db import purge, regrade
 from app.models import Quiz as QuizModel
 from app.models import User as UserModel
 from app.schemas import Quiz as QuizSchema
-from app.schemas import QuizCreate, QuizUpdate
-from fastapi import APIRouter, Depends, HTTPException
+from app.schemas import QuizCreate, QuizRegrade, QuizScores, QuizUpdate
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 router = APIRouter()
@@ -30,7 +32,7 @@ async def create(
 
 @router.get("/{id}", response_model=QuizSchema)
 async def read(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> QuizModel:
@@ -46,7 +48,7 @@ async def read(
 
 @router.get("/", response_model=list[QuizSchema])
 async def read_quizzes(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> list[QuizModel]:
     quizzes = quiz_crud.get_multi_by_author(db, author_id=current_user.id)
@@ -55,7 +57,7 @@ async def read_quizzes(
 
 @router.get("/_/me", response_model=list[QuizSchema])
 async def read_by_author(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> list[QuizModel]:
     quizzes = quiz_crud.get_multi_by_author(db, author_id=current_user.id)
@@ -64,13 +66,85 @@ async def read_by_author(
 
 @router.get("/_/published", response_model=list[QuizSchema])
 async def read_published(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> list[QuizModel]:
     quizzes = quiz_crud.get_multi_published(db)
     return quizzes
 
 
+@router.get("/scores/{id}", response_model=QuizScores)
+async def read_scores(
+    db: Annotated[Session, Depends(deps.get_read_db)],
+    id: UUID,
+    current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+    percentiles: Annotated[list[float], Query()] = [25, 50, 75, 90, 99],
+) -> QuizScores:
+    quiz = quiz_crud.get(db, id=id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    if quiz.author_id != current_user.id:
+        raise HTTPException(
+            status_code=400,
+            detail="Only the author can see the scores of this quiz",
+        )
+    if any(not 0 <= percentile <= 100 for percentile in percentiles):
+        raise HTTPException(
+            status_code=400, detail="Percentiles must be between 0 and 100"
+        )
+    sketch = submission_crud.get_score_sketch(db, quiz_id=id)
+    return QuizScores(
+        count=sketch.count,
+        mean=sketch.mean,
+        stddev=sketch.stddev,
+        minimum=sketch.digest.quantile(0),
+        maximum=sketch.digest.quantile(1),
+        percentiles={
+            f"{percentile:g}": sketch.digest.quantile(percentile / 100)
+            for percentile in percentiles
+        },
+    )
+
+
+@router.post("/regrade/{id}", response_model=QuizRegrade)
+async def start_regrade(
+    db: Annotated[Session, Depends(deps.get_db)],
+    id: UUID,
+    current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+    background_tasks: BackgroundTasks,
+) -> QuizRegrade:
+    quiz = quiz_crud.get(db, id=id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    if quiz.author_id != current_user.id:
+        raise HTTPException(
+            status_code=400, detail="Only the author can regrade this quiz"
+        )
+    started = regrade.start(id)
+    background_tasks.add_task(regrade.regrade, started.id)
+    return QuizRegrade.from_orm(started)
+
+
+@router.get("/regrade/{id}", response_model=QuizRegrade)
+async def read_regrade(
+    db: Annotated[Session, Depends(deps.get_read_db)],
+    id: UUID,
+    current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+) -> QuizRegrade:
+    quiz = quiz_crud.get(db, id=id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    if quiz.author_id != current_user.id:
+        raise HTTPException(
+            status_code=400,
+            detail="Only the author can see the regrades of this quiz",
+        )
+    latest = regrade.get_latest(id)
+    if not latest:
+        raise HTTPException(status_code=404, detail="Regrade not found")
+    return QuizRegrade.from_orm(latest)
+
+
 @router.put("/{id}", response_model=QuizSchema)
 async def edit(
     db: Annotated[Session, Depends(deps.get_db)],
@@ -140,6 +214,7 @@ async def publish(
         )
     if quiz.published:
         raise HTTPException(status_code=400, detail="Quiz already published")
+    answer_crud.adjust_points_by_quiz_no_commit(db, quiz_id=id)
     quiz = quiz_crud.publish(db=db, db_obj=quiz)
     return quiz
 
@@ -149,6 +224,7 @@ async def delete(
     db: Annotated[Session, Depends(deps.get_db)],
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+    background_tasks: BackgroundTasks,
 ) -> QuizModel:
     quiz = quiz_crud.get(db=db, id=id)
     if not quiz:
@@ -157,5 +233,8 @@ async def delete(
         raise HTTPException(
             status_code=400, detail="Only the author can delete this quiz"
         )
-    quiz = quiz_crud.delete(db, id=id)
+    quiz = quiz_crud.soft_delete(db, id=id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    background_tasks.add_task(purge.purge_quiz, quiz.id)
     return quiz
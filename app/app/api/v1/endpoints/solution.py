@@ -4,10 +4,10 @@ from uuid import UUID
 from app.api import deps
 from app.crud import answer as answer_crud
 from app.crud import attempt as attempt_crud
-from app.crud import question as question_crud
 from app.crud import quiz as quiz_crud
 from app.crud import solution as solution_crud
 from app.crud import submission as submission_crud
+from app.db import archive
 from app.models import Solution as SolutionModel
 from app.models import User as UserModel
 from app.schemas import Solution as SolutionSchema
@@ -38,8 +38,7 @@ async def add(
             detail="Can only solution to answer "
             "on the same question as the attempt",
         )
-    question = question_crud.get(db, answer.question_id)
-    quiz = quiz_crud.get(db, question.quiz_id)
+    quiz = quiz_crud.get(db, attempt.quiz_id)
     if quiz.author_id != current_user.id and not quiz.published:
         raise HTTPException(
             status_code=403,
@@ -48,31 +47,40 @@ async def add(
         )
     obj_in = {"point": answer.point}
     solution = solution_crud.create_with_answer_attempt(
-        db=db, obj_in=obj_in, answer_id=answer_id, attempt_id=attempt_id
+        db=db,
+        obj_in=obj_in,
+        answer_id=answer_id,
+        attempt_id=attempt_id,
+        quiz_id=attempt.quiz_id,
+        user_id=attempt.user_id,
     )
+    if not solution:
+        raise HTTPException(
+            status_code=400, detail="You already solution to this answer"
+        )
     return solution
 
 
 @router.get("/{id}", response_model=SolutionSchema)
 async def read(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> SolutionModel:
     solution = solution_crud.get(db, id=id)
     if not solution:
         raise HTTPException(status_code=404, detail="Solution not found")
-    attempt = attempt_crud.get(db, solution.attempt_id)
-    answer = answer_crud.get(db, solution.answer_id)
-    question = question_crud.get(db, answer.question_id)
-    quiz = quiz_crud.get(db, question.quiz_id)
-    submission = submission_crud.get(db, attempt.submission_id)
-    if current_user.id not in {submission.user_id, quiz.author_id}:
+    if current_user.id == solution.user_id:
+        return solution
+    quiz = quiz_crud.get(db, solution.quiz_id)
+    if current_user.id != quiz.author_id:
         raise HTTPException(
             status_code=403,
             detail="You don't have permission to see this solution",
         )
-    if current_user.id != submission.user_id and submission.draft:
+    attempt = attempt_crud.get(db, solution.attempt_id)
+    submission = submission_crud.get(db, attempt.submission_id)
+    if submission.draft:
         raise HTTPException(
             status_code=403,
             detail="The submission of this solution is still in draft",
@@ -82,27 +90,55 @@ async def read(
 
 @router.get("/attempt/{attempt_id}", response_model=list[SolutionSchema])
 async def read_by_attempt(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     attempt_id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> list[SolutionModel]:
     attempt = attempt_crud.get(db, attempt_id)
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
-    question = question_crud.get(db, attempt.question_id)
-    quiz = quiz_crud.get(db, question.quiz_id)
-    submission = submission_crud.get(db, attempt.submission_id)
+    if current_user.id != attempt.user_id:
+        quiz = quiz_crud.get(db, attempt.quiz_id)
+        if current_user.id != quiz.author_id:
+            raise HTTPException(
+                status_code=403,
+                detail="You don't have permission to see this solution",
+            )
+        submission = submission_crud.get(db, attempt.submission_id)
+        if submission.draft:
+            raise HTTPException(
+                status_code=403,
+                detail="The submission of this solution is still in draft",
+            )
+    solutions = solution_crud.get_multi_by_attempt(db, attempt_id=attempt_id)
+    return solutions
+
+
+@router.get("/submission/{submission_id}", response_model=list[SolutionSchema])
+async def read_by_submission(
+    db: Annotated[Session, Depends(deps.get_read_db)],
+    submission_id: UUID,
+    current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+) -> list[SolutionModel]:
+    submission = submission_crud.get(db, submission_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    quiz = quiz_crud.get(db, submission.quiz_id)
     if current_user.id not in {submission.user_id, quiz.author_id}:
         raise HTTPException(
             status_code=403,
             detail="You don't have permission to see this solution",
         )
-    if current_user.id != submission.user_id and submission.draft:
+    if submission.draft:
         raise HTTPException(
             status_code=403,
             detail="The submission of this solution is still in draft",
         )
-    solutions = solution_crud.get_multi_by_attempt(db, attempt_id=attempt_id)
+    if submission.archive:
+        return archive.read_solutions(submission.archive, submission_id)
+    solutions = solution_crud.get_multi_by_submission(
+        db, submission_id=submission_id
+    )
     return solutions
 
 
@@ -115,11 +151,9 @@ async def delete(
     solution = solution_crud.get(db=db, id=id)
     if not solution:
         raise HTTPException(status_code=404, detail="Quiz not found")
-    attempt = attempt_crud.get(db, solution.attempt_id)
-    submission = submission_crud.get(db, attempt.submission_id)
-    if submission.user_id != current_user.id:
+    if solution.user_id != current_user.id:
         raise HTTPException(
             status_code=400, detail="Only the author can delete this solution"
         )
-    quiz = quiz_crud.delete(db, id=id)
-    return quiz
+    solution = solution_crud.delete(db, id=id)
+    return solution
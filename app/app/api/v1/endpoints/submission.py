@@ -3,9 +3,7 @@ from uuid import UUID
 
 from app.api import deps
 from app.core.config import settings
-from app.crud import attempt as attempt_crud
 from app.crud import quiz as quiz_crud
-from app.crud import solution as solution_crud
 from app.crud import submission as submission_crud
 from app.models import Submission as SubmissionModel
 from app.models import User as UserModel
@@ -21,7 +19,8 @@ async def draft(
     db: Annotated[Session, Depends(deps.get_db)],
     quiz_id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
-) -> SubmissionModel:
+    with_attempts: bool = False,
+) -> SubmissionModel | SubmissionSchema:
     quiz = quiz_crud.get(db, quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
@@ -30,25 +29,39 @@ async def draft(
             status_code=403,
             detail="You cannot submit to other people unpublished quiz",
         )
-    submission_count = submission_crud.count_by_quiz_user(
-        db=db, quiz_id=quiz_id, user_id=current_user.id
-    )
-    if submission_count >= settings.MAX_SUBMISSION_PER_QUIZ:
+    obj_in = {"time_remaining": str(quiz.duration) if quiz.duration else None}
+    if with_attempts:
+        submission, attempt_ids = submission_crud.draft_with_attempts(
+            db=db,
+            obj_in=obj_in,
+            quiz_id=quiz_id,
+            user_id=current_user.id,
+            max_submissions=settings.MAX_SUBMISSION_PER_QUIZ,
+        )
+    else:
+        submission = submission_crud.create_with_quiz_user(
+            db=db,
+            obj_in=obj_in,
+            quiz_id=quiz_id,
+            user_id=current_user.id,
+            max_submissions=settings.MAX_SUBMISSION_PER_QUIZ,
+        )
+    if not submission:
         raise HTTPException(
             status_code=403,
             detail="You cannot make a submission more than "
             f"{settings.MAX_SUBMISSION_PER_QUIZ} to this quiz",
         )
-    obj_in = {"time_remaining": str(quiz.duration) if quiz.duration else None}
-    submission = submission_crud.create_with_quiz_user(
-        db=db, obj_in=obj_in, quiz_id=quiz_id, user_id=current_user.id
-    )
+    if with_attempts:
+        return SubmissionSchema.from_orm(submission).copy(
+            update={"attempt_ids": attempt_ids}
+        )
     return submission
 
 
 @router.get("/{id}", response_model=SubmissionSchema)
 async def read(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> SubmissionModel:
@@ -70,7 +83,7 @@ async def read(
 
 @router.get("/_/me", response_model=list[SubmissionSchema])
 async def read_submissions(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> list[SubmissionModel]:
     submissions = submission_crud.get_multi_by_user(
@@ -81,7 +94,7 @@ async def read_submissions(
 
 @router.get("/quiz/{quiz_id}", response_model=list[SubmissionSchema])
 async def read_by_quiz(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     quiz_id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> list[SubmissionModel]:
@@ -90,7 +103,7 @@ async def read_by_quiz(
         raise HTTPException(status_code=404, detail="Quiz not found")
     if quiz.author_id == current_user.id:
         submissions = submission_crud.get_nondraft_multi_by_quiz(
-            db, quiz_id == quiz_id
+            db, quiz_id=quiz_id
         )
     elif not quiz.published:
         raise HTTPException(
@@ -112,6 +125,11 @@ async def pause(
     submission = submission_crud.get(db=db, id=id)
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
+    paused = submission_crud.pause(
+        db, id=id, user_id=current_user.id, quiz_id=submission.quiz_id
+    )
+    if paused:
+        return paused
     if not submission.draft:
         raise HTTPException(
             status_code=400, detail="This submission is not draft"
@@ -126,12 +144,13 @@ async def pause(
             detail="You don't have permission to pause the submission",
         )
     quiz = quiz_crud.get(db, submission.quiz_id)
-    if not quiz.resumable:
+    if quiz is None or not quiz.resumable:
         raise HTTPException(
             status_code=400, detail="This quiz is not resumable/pausable"
         )
-    submission = submission_crud.pause(db=db, db_obj=submission)
-    return submission
+    raise HTTPException(
+        status_code=409, detail="This submission was changed, please retry"
+    )
 
 
 @router.put("/resume/{id}", response_model=SubmissionSchema)
@@ -140,6 +159,9 @@ async def resume(
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> SubmissionModel:
+    submission = submission_crud.resume(db, id=id, user_id=current_user.id)
+    if submission:
+        return submission
     submission = submission_crud.get(db=db, id=id)
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
@@ -156,8 +178,9 @@ async def resume(
             status_code=400,
             detail="You don't have permission to resume the submission",
         )
-    submission = submission_crud.resume(db, db_obj=submission)
-    return submission
+    raise HTTPException(
+        status_code=409, detail="This submission was changed, please retry"
+    )
 
 
 @router.put("/submit/{id}", response_model=SubmissionSchema)
@@ -166,6 +189,9 @@ async def submit(
     id: UUID,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> SubmissionModel:
+    submission = submission_crud.submit(db, id=id, user_id=current_user.id)
+    if submission:
+        return submission
     submission = submission_crud.get(db=db, id=id)
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
@@ -180,15 +206,6 @@ async def submit(
             status_code=403,
             detail="You have no permission to submit this draft",
         )
-    attempts = attempt_crud.get_multi_draft_by_submission(db, submission_id=id)
-    scores = {}
-    for attempt in attempts:
-        scores[attempt.id] = solution_crud.sum_point_by_attempt(
-            db, attempt_id=attempt.id
-        )
-    attempt_crud.submit_multi_by_submission_no_commit(
-        db, submission_id=id, scores=scores
+    raise HTTPException(
+        status_code=409, detail="This submission was changed, please retry"
     )
-    score = attempt_crud.sum_score_by_submission(db, submission_id=id)
-    submission = submission_crud.submit(db, db_obj=submission, score=score)
-    return submission
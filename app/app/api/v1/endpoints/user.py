@@ -5,11 +5,12 @@ from app.api import deps
 from app.core import security
 from app.core.config import settings
 from app.crud import user as user_crud
+from app.db import purge
 from app.models import User as UserModel
 from app.schemas import Token
 from app.schemas import User as UserSchema
 from app.schemas import UserCreate, UserUpdate
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
@@ -21,13 +22,12 @@ async def register(
     db: Annotated[Session, Depends(deps.get_db)],
     user_in: UserCreate,
 ) -> UserModel:
-    user = user_crud.get_by_email(db, email=user_in.email)
-    if user:
+    user = user_crud.create(db, obj_in=user_in)
+    if not user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system",
         )
-    user = user_crud.create(db, obj_in=user_in)
     return user
 
 
@@ -60,13 +60,28 @@ async def update_password(
     user_in: UserUpdate,
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> UserModel:
-    user = user_crud.update_password(db, db_obj=current_user, obj_in=user_in)
+    # current_user comes from the read session, reload it for the write
+    user = user_crud.get(db, current_user.id)
+    user = user_crud.update_password(db, db_obj=user, obj_in=user_in)
     return user
 
 
 @router.get("/me", response_model=UserSchema)
 async def read_user(
-    db: Annotated[Session, Depends(deps.get_db)],
+    db: Annotated[Session, Depends(deps.get_read_db)],
     current_user: Annotated[UserModel, Depends(deps.get_current_user)],
 ) -> UserModel:
     return current_user
+
+
+@router.delete("/me", response_model=UserSchema)
+async def delete(
+    db: Annotated[Session, Depends(deps.get_db)],
+    current_user: Annotated[UserModel, Depends(deps.get_current_user)],
+    background_tasks: BackgroundTasks,
+) -> UserModel:
+    user = user_crud.soft_delete(db, id=current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    background_tasks.add_task(purge.purge_user, user.id)
+    return user
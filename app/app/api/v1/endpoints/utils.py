@@ -1,24 +1,29 @@
 from datetime import datetime, timezone
-from typing import Annotated
 
-from app.api import deps
-from app.models import User as UserModel
-from app.schemas import Health, ServerTime
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from app.db.health import database_status
+from app.schemas import Health, Readiness, ServerTime
+from fastapi import APIRouter, Response, status
 
 router = APIRouter()
 
 
 @router.get("/health", response_model=Health)
-async def healthcheck(
-    db: Annotated[Session, Depends(deps.get_db)],
-) -> UserModel:
+async def healthcheck() -> dict[str, str]:
     return {"condition": "Healthy"}
 
 
+@router.get("/health/ready", response_model=Readiness)
+def readiness(response: Response) -> dict[str, str | bool]:
+    db_status = database_status()
+    if not db_status.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "condition": "Ready" if db_status.ready else "Unavailable",
+        "database": db_status.reachable,
+        "pool_saturated": db_status.pool_saturated,
+    }
+
+
 @router.get("/time", response_model=ServerTime)
-async def server_time(
-    db: Annotated[Session, Depends(deps.get_db)],
-) -> dict[str, str]:
+async def server_time() -> dict[str, datetime]:
     return {"server_time": datetime.now(tz=timezone.utc)}
@@ -1,4 +1,5 @@
-from typing import Any, Optional
+from typing import Any, Literal, Optional
+from uuid import UUID
 
 from pydantic import BaseSettings, PostgresDsn, validator
 
@@ -20,6 +21,44 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     SQLALCHEMY_DATABASE_URI: Optional[PostgresDsn] = None
+    DB_POOL_SIZE: int = 5
+    DB_POOL_MAX_OVERFLOW: int = 10
+    DB_PREPARE_THRESHOLD: Optional[int] = None
+    DB_RAISE_ON_LAZY_LOAD: bool = False
+    READINESS_CACHE_SECONDS: float = 5
+    READINESS_CHECKOUT_SECONDS: float = 0.5
+    PURGE_CHUNK_SIZE: int = 1000
+    BACKFILL_CHUNK_SIZE: int = 1000
+    REBALANCE_CHUNK_SIZE: int = 1000
+    REGRADE_CHUNK_SIZE: int = 1000
+    ARCHIVE_DIR: Optional[str] = None
+    ARCHIVE_AFTER_DAYS: int = 365
+    ARCHIVE_CHUNK_SIZE: int = 1000
+    PARTITION_MONTHS_AHEAD: int = 3
+    AUDIT_QUEUE_SIZE: int = 100_000
+    AUDIT_OVERFLOW: Literal["drop", "block"] = "drop"
+    AUDIT_BLOCK_SECONDS: float = 1
+    AUDIT_FLUSH_SECONDS: float = 1
+    AUDIT_BATCH_SIZE: int = 5000
+    OUTBOX_CHANNEL: str = "quizar_outbox"
+    OUTBOX_RELAY_SECONDS: float = 0.2
+    OUTBOX_BATCH_SIZE: int = 1000
+    OUTBOX_RETENTION_DAYS: int = 7
+    OUTBOX_CONSUMERS: list[UUID] = []
+    DRAFT_STORE_URL: Optional[str] = None
+    DRAFT_CHECKPOINT_SECONDS: float = 5
+    DRAFT_CHECKPOINT_CHUNK_SIZE: int = 100
+    LIVE_TICK_SECONDS: float = 5
+    SCORE_SKETCH_STRIPES: int = 4
+    SCORE_SKETCH_BUFFER: int = 64
+    SQLALCHEMY_REPLICA_URIS: list[PostgresDsn] = []
+    REPLICA_MAX_LAG_SECONDS: float = 5
+    REPLICA_LAG_CHECK_SECONDS: float = 1
+    LAST_WRITE_STORE_URL: str = "memory://"
+    SQLALCHEMY_SHARD_URIS: dict[str, PostgresDsn] = {}
+    SHARD_OVERRIDES: dict[UUID, str] = {}
+
+    PROMETHEUS_MULTIPROC_DIR: Optional[str] = None
 
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     def assemble_db_connection(
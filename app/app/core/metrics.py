@@ -0,0 +1,152 @@
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable
+
+from app.core.config import settings
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_LATENCY = Histogram(
+    "quizar_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+)
+REQUEST_IN_PROGRESS = Gauge(
+    "quizar_http_requests_in_progress",
+    "HTTP requests currently being served",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+RESPONSE_COUNT = Counter(
+    "quizar_http_responses",
+    "HTTP responses by route template and status code",
+    ["method", "route", "status"],
+)
+CRUD_LATENCY = Histogram(
+    "quizar_crud_duration_seconds",
+    "CRUD method latency",
+    ["crud", "method"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "quizar_db_pool_checked_out",
+    "Connections currently checked out from the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "quizar_db_pool_connections",
+    "Connections currently opened by the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUTS = Counter(
+    "quizar_db_pool_checkouts",
+    "Connections checked out from the pool",
+    ["engine"],
+)
+AUDIT_EVENTS_DROPPED = Counter(
+    "quizar_audit_events_dropped",
+    "Audit events dropped because the queue was full or writing them failed",
+    ["reason"],
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if settings.PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    connections = DB_POOL_CONNECTIONS.labels(name)
+    checkouts = DB_POOL_CHECKOUTS.labels(name)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+        connections.inc()
+
+    @event.listens_for(engine, "close")
+    def on_close(dbapi_connection: Any, connection_record: Any) -> None:
+        connections.dec()
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(
+        dbapi_connection: Any, connection_record: Any, connection_proxy: Any
+    ) -> None:
+        checked_out.inc()
+        checkouts.inc()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection: Any, connection_record: Any) -> None:
+        checked_out.dec()
+
+
+def timed_crud(crud: str, method: str, func: Callable) -> Callable:
+    histogram = CRUD_LATENCY.labels(crud, method)
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(perf_counter() - start)
+
+    return wrapper
+
+
+class PrometheusMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    def route_template(self, scope: Scope) -> str:
+        router = scope["app"].router
+        for route in router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return UNMATCHED_ROUTE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = self.route_template(scope)
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUEST_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_LATENCY.labels(method, route).observe(
+                perf_counter() - start
+            )
+            RESPONSE_COUNT.labels(method, route, str(status_code)).inc()
+            in_progress.dec()
@@ -0,0 +1,194 @@
+"""
+Vectorized scoring of attempts.
+
+A quiz scores its questions with one `ScoringMethod`, optionally floored at
+`score_floor` and weighted by the `weight` of every question. Grading lays
+the answers chosen by a batch of attempts out as a boolean selection matrix
+of attempts by the answers of the quiz, and computes every score of the
+batch with array operations, so that submitting one submission and
+regrading a million attempts take the same path.
+
+A method is a function of the `Tally` of a batch, registered with `rule`.
+"""
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Iterable, Optional, Sequence
+from uuid import UUID
+
+import numpy as np
+
+
+class ScoringMethod(str, Enum):
+    # Correct answers of a question share +1 and incorrect ones share -1,
+    # like `Answer.point`
+    PARTIAL_CREDIT = "partial_credit"
+    # 1 for choosing exactly the correct answers, 0 otherwise
+    ALL_OR_NOTHING = "all_or_nothing"
+
+
+@dataclass
+class Tally:
+    """
+    Per attempt: the correct and incorrect answers it chose, and those its
+    question has.
+    """
+
+    correct_chosen: np.ndarray
+    incorrect_chosen: np.ndarray
+    correct: np.ndarray
+    incorrect: np.ndarray
+
+
+ScoringRule = Callable[[Tally], np.ndarray]
+RULES: dict[ScoringMethod, ScoringRule] = {}
+
+
+def rule(method: ScoringMethod) -> Callable[[ScoringRule], ScoringRule]:
+    def register(function: ScoringRule) -> ScoringRule:
+        RULES[method] = function
+        return function
+
+    return register
+
+
+def share(chosen: np.ndarray, available: np.ndarray) -> np.ndarray:
+    return np.divide(
+        chosen,
+        available,
+        out=np.zeros(len(chosen)),
+        where=available > 0,
+    )
+
+
+@rule(ScoringMethod.PARTIAL_CREDIT)
+def partial_credit(tally: Tally) -> np.ndarray:
+    return share(tally.correct_chosen, tally.correct) - share(
+        tally.incorrect_chosen, tally.incorrect
+    )
+
+
+@rule(ScoringMethod.ALL_OR_NOTHING)
+def all_or_nothing(tally: Tally) -> np.ndarray:
+    return (
+        (tally.correct_chosen == tally.correct) & (tally.incorrect_chosen == 0)
+    ).astype(float)
+
+
+class AnswerKey:
+    def __init__(
+        self, answers: Iterable[tuple[Optional[UUID], UUID, bool, float]]
+    ):
+        """
+        Index the answers of a quiz, given as `(answer_id, question_id,
+        is_correct, weight)` with the weight of their question, as the
+        columns of selection matrices. A question without answers is given
+        once with a `None` answer id.
+        """
+        self.answer_index: dict[UUID, int] = {}
+        self.question_index: dict[UUID, int] = {}
+        questions, correct, weights = [], [], []
+        for answer_id, question_id, is_correct, weight in answers:
+            if question_id not in self.question_index:
+                self.question_index[question_id] = len(weights)
+                weights.append(weight)
+            if answer_id is None:
+                continue
+            self.answer_index[answer_id] = len(questions)
+            questions.append(self.question_index[question_id])
+            correct.append(is_correct)
+        # The question of every answer
+        self.questions = np.array(questions, dtype=np.intp)
+        self.correct = np.array(correct, dtype=bool)
+        self.weights = np.array(weights, dtype=float)
+        self.correct_counts = np.bincount(
+            self.questions, weights=self.correct, minlength=len(weights)
+        )
+        self.incorrect_counts = np.bincount(
+            self.questions, weights=~self.correct, minlength=len(weights)
+        )
+
+    def select(
+        self, questions: np.ndarray, rows: np.ndarray, answers: np.ndarray
+    ) -> np.ndarray:
+        """
+        Build the selection matrix of attempts of `questions` that chose the
+        answers at index `answers` in the attempts at index `rows`. Answers
+        of another question than that of their attempt are left out.
+        """
+        selection = np.zeros((len(questions), len(self.correct)), dtype=bool)
+        valid = self.questions[answers] == questions[rows]
+        selection[rows[valid], answers[valid]] = True
+        return selection
+
+    def selection(
+        self,
+        attempts: Sequence[tuple[UUID, UUID]],
+        chosen: Iterable[tuple[UUID, UUID]],
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the question of every attempt, given as `(attempt_id,
+        question_id)`, and their selection matrix from the `(attempt_id,
+        answer_id)` of the answers they chose.
+        """
+        rows = {
+            attempt_id: row for row, (attempt_id, _) in enumerate(attempts)
+        }
+        questions = np.fromiter(
+            (self.question_index[question_id] for _, question_id in attempts),
+            dtype=np.intp,
+            count=len(attempts),
+        )
+        pairs = [
+            (rows[attempt_id], self.answer_index[answer_id])
+            for attempt_id, answer_id in chosen
+            if attempt_id in rows and answer_id in self.answer_index
+        ]
+        indexes = np.array(pairs, dtype=np.intp).reshape(-1, 2)
+        return questions, self.select(questions, indexes[:, 0], indexes[:, 1])
+
+
+@dataclass
+class Scoring:
+    method: ScoringMethod = ScoringMethod.PARTIAL_CREDIT
+    # Lowest score of a question, before its weight
+    floor: Optional[float] = None
+
+    def grade(
+        self, key: AnswerKey, questions: np.ndarray, selection: np.ndarray
+    ) -> np.ndarray:
+        """
+        Score the attempts of `questions` from their `selection` matrix.
+        Attempts that chose nothing score NaN, like a sum over no
+        solutions.
+        """
+        correct_chosen = np.count_nonzero(selection & key.correct, axis=1)
+        incorrect_chosen = np.count_nonzero(selection & ~key.correct, axis=1)
+        scores = RULES[self.method](
+            Tally(
+                correct_chosen,
+                incorrect_chosen,
+                key.correct_counts[questions],
+                key.incorrect_counts[questions],
+            )
+        )
+        if self.floor is not None:
+            scores = np.maximum(scores, self.floor)
+        scores = scores * key.weights[questions]
+        scores[correct_chosen + incorrect_chosen == 0] = np.nan
+        return scores
+
+    def grade_attempts(
+        self,
+        key: AnswerKey,
+        attempts: Sequence[tuple[UUID, UUID]],
+        chosen: Iterable[tuple[UUID, UUID]],
+    ) -> list[Optional[float]]:
+        """
+        Score the `(attempt_id, question_id)` attempts from the
+        `(attempt_id, answer_id)` answers they chose, `None` for those that
+        chose nothing.
+        """
+        scores = self.grade(key, *key.selection(attempts, chosen))
+        return [
+            None if np.isnan(score) else score for score in scores.tolist()
+        ]
@@ -0,0 +1,170 @@
+"""
+Mergeable streaming summaries of score distributions.
+
+`TDigest` estimates quantiles from at most a few `compression` centroids,
+each the mean and weight of neighbouring values. Centroids stay small near
+both tails, so extreme percentiles stay accurate, and the digests of
+separate parts of the data merge into a digest of the whole. `ScoreSketch`
+adds the exact count, sum and sum of squares for the mean and the standard
+deviation.
+"""
+from dataclasses import dataclass, field
+from math import asin, inf, pi, sin, sqrt
+from struct import pack, unpack_from
+from typing import Iterable, Optional
+
+COMPRESSION = 100.0
+# Values are added to a buffer and sorted into the centroids in bulk
+BUFFER_FACTOR = 5
+
+
+class TDigest:
+    def __init__(
+        self,
+        compression: float = COMPRESSION,
+        centroids: Optional[list[tuple[float, float]]] = None,
+        minimum: float = inf,
+        maximum: float = -inf,
+    ):
+        """
+        Merging t-digest with the `k1` scale function (Dunning, 2019).
+
+        `centroids` are sorted `(mean, weight)` pairs; `minimum` and
+        `maximum` bound the interpolation at the tails.
+        """
+        self.compression = compression
+        self.centroids = centroids or []
+        self.minimum = minimum
+        self.maximum = maximum
+        self._buffer: list[tuple[float, float]] = []
+
+    @property
+    def count(self) -> float:
+        return sum(weight for _, weight in self.centroids) + sum(
+            weight for _, weight in self._buffer
+        )
+
+    def _weight_limit(self, q: float) -> float:
+        """
+        The quantile up to which a centroid starting at quantile `q` may
+        grow: one unit further along `k1(q) = δ / 2π * asin(2q - 1)`.
+        """
+        k = self.compression / (2 * pi) * asin(2 * q - 1) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return (sin(k * 2 * pi / self.compression) + 1) / 2
+
+    def _insert(self, centroids: Iterable[tuple[float, float]]) -> None:
+        self._buffer.extend(centroids)
+        if len(self._buffer) >= BUFFER_FACTOR * self.compression:
+            self.compress()
+
+    def update(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.minimum = min(self.minimum, value)
+            self.maximum = max(self.maximum, value)
+            self._insert(((value, 1.0),))
+
+    def merge(self, other: "TDigest") -> None:
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._insert(other.centroids + other._buffer)
+
+    def compress(self) -> None:
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in points)
+        centroids = []
+        mean, weight = points[0]
+        before = 0.0
+        limit = total * self._weight_limit(0.0)
+        for next_mean, next_weight in points[1:]:
+            if before + weight + next_weight <= limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                centroids.append((mean, weight))
+                before += weight
+                limit = total * self._weight_limit(before / total)
+                mean, weight = next_mean, next_weight
+        centroids.append((mean, weight))
+        self.centroids = centroids
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate the value below which a fraction `q` of the values fall,
+        interpolating between the centers of neighbouring centroids.
+        """
+        self.compress()
+        if not self.centroids:
+            return None
+        total = sum(weight for _, weight in self.centroids)
+        target = q * total
+        previous_mean, previous_center = self.minimum, 0.0
+        before = 0.0
+        for mean, weight in self.centroids:
+            center = before + weight / 2
+            if target < center:
+                break
+            previous_mean, previous_center = mean, center
+            before += weight
+        else:
+            mean, center = self.maximum, total
+        if center <= previous_center:
+            return mean
+        fraction = (target - previous_center) / (center - previous_center)
+        return previous_mean + (mean - previous_mean) * fraction
+
+    def to_bytes(self) -> bytes:
+        """
+        Pack the digest into `minimum`, `maximum` and the interleaved means
+        and weights of its centroids, as little-endian doubles.
+        """
+        self.compress()
+        flat = [value for centroid in self.centroids for value in centroid]
+        return pack(f"<{2 + len(flat)}d", self.minimum, self.maximum, *flat)
+
+    @classmethod
+    def from_bytes(
+        cls, data: Optional[bytes], compression: float = COMPRESSION
+    ) -> "TDigest":
+        if not data:
+            return cls(compression)
+        values = unpack_from(f"<{len(data) // 8}d", data)
+        centroids = list(zip(values[2::2], values[3::2]))
+        return cls(compression, centroids, values[0], values[1])
+
+
+@dataclass
+class ScoreSketch:
+    count: int = 0
+    total: float = 0.0
+    total_squares: float = 0.0
+    digest: TDigest = field(default_factory=TDigest)
+
+    def update(self, scores: Iterable[float]) -> None:
+        scores = list(scores)
+        self.count += len(scores)
+        self.total += sum(scores)
+        self.total_squares += sum(score * score for score in scores)
+        self.digest.update(scores)
+
+    def merge(self, other: "ScoreSketch") -> None:
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        self.digest.merge(other.digest)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    @property
+    def stddev(self) -> Optional[float]:
+        if not self.count:
+            return None
+        variance = self.total_squares / self.count - self.mean**2
+        # Rounding can take the variance of equal scores slightly below 0
+        return sqrt(max(variance, 0.0))
@@ -1,33 +1,95 @@
-from typing import Any
-
 from app.crud.base import CRUDBase
+from app.db.session import shards
 from app.models.answer import Answer
+from app.models.question import Question
 from app.schemas.answer import AnswerCreate, AnswerUpdate
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import bindparam, case, select, update
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+BY_QUESTION = Answer.question_id == bindparam("question_id")
+GET_MULTI_BY_QUESTION = (
+    select(Answer)
+    .where(BY_QUESTION)
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+GET_CORRECT_BY_QUESTION = GET_MULTI_BY_QUESTION.where(Answer.is_correct)
+GET_INCORRECT_BY_QUESTION = GET_MULTI_BY_QUESTION.where(~Answer.is_correct)
+GET_MULTI_BY_QUIZ = (
+    select(Answer)
+    .join(Question, Question.id == Answer.question_id)
+    .where(Question.quiz_id == bindparam("quiz_id"))
+)
+COUNT_BY_QUESTION = select(func.count()).select_from(Answer).where(BY_QUESTION)
+COUNT_CORRECT_BY_QUESTION = COUNT_BY_QUESTION.where(Answer.is_correct)
+COUNT_INCORRECT_BY_QUESTION = COUNT_BY_QUESTION.where(~Answer.is_correct)
 
 
 class CRUDAnswer(CRUDBase[Answer, AnswerCreate, AnswerUpdate]):
-    def create_with_question_and_adjust_point(
+    def create_with_question(
         self, db: Session, *, obj_in: AnswerCreate, question_id: UUID
     ) -> Answer:
-        obj_in_data: dict[str, Any] = jsonable_encoder(obj_in)
-        is_correct = obj_in_data.pop("is_correct")
-        if is_correct:
-            answers = self.get_correct_by_question(db, question_id=question_id)
-            total_point = 1
-        else:
-            answers = self.get_incorrect_by_question(
-                db, question_id=question_id
-            )
-            total_point = -1
-        obj_in_data["point"] = total_point / (len(answers) + 1)
+        shards.locate(db, Question, question_id)
+        obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data, question_id=question_id)
         db.add(db_obj)
-        for answer in answers:
-            setattr(answer, "point", obj_in_data["point"])
-            db.add(answer)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+    def adjust_points_by_quiz_no_commit(
+        self, db: Session, *, quiz_id: UUID
+    ) -> None:
+        shards.use_quiz(db, quiz_id)
+        # Correct answers of a question share +1 and incorrect ones share -1
+        points = (
+            select(
+                Answer.id,
+                (
+                    case((Answer.is_correct, 1.0), else_=-1.0)
+                    / func.count().over(
+                        partition_by=(Answer.question_id, Answer.is_correct)
+                    )
+                ).label("point"),
+            )
+            .join(Question, Question.id == Answer.question_id)
+            .where(Question.quiz_id == quiz_id)
+            .subquery()
+        )
+        db.execute(
+            update(Answer)
+            .where(Answer.id == points.c.id)
+            .values(point=points.c.point)
+            .execution_options(synchronize_session=False)
+        )
+
+    def adjust_points_by_quiz(
+        self, db: Session, *, quiz_id: UUID
+    ) -> list[Answer]:
+        self.adjust_points_by_quiz_no_commit(db, quiz_id=quiz_id)
+        db.commit()
+        return self.get_multi_by_quiz(db, quiz_id=quiz_id)
+
+    def update_and_adjust_points(
+        self,
+        db: Session,
+        *,
+        db_obj: Answer,
+        obj_in: AnswerUpdate,
+        quiz_id: UUID,
+    ) -> Answer:
+        """
+        Update the answer and the points of the answers of its quiz in one
+        transaction, so that grading never reads correctness and points that
+        disagree.
+        """
+        self.update_no_commit(db, db_obj=db_obj, obj_in=obj_in)
+        # Sessions do not autoflush, and the points follow the new correctness
+        db.flush()
+        self.adjust_points_by_quiz_no_commit(db, quiz_id=quiz_id)
         db.commit()
         db.refresh(db_obj)
         return db_obj
@@ -40,13 +102,11 @@ class CRUDAnswer(CRUDBase[Answer, AnswerCreate, AnswerUpdate]):
         skip: int = 0,
         limit: int = 100,
     ) -> list[Answer]:
-        return (
-            db.query(self.model)
-            .filter(Answer.question_id == question_id, Answer.point > 0)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.locate(db, Question, question_id)
+        return db.scalars(
+            GET_CORRECT_BY_QUESTION,
+            {"question_id": question_id, "skip": skip, "limit": limit},
+        ).all()
 
     def get_incorrect_by_question(
         self,
@@ -56,13 +116,11 @@ class CRUDAnswer(CRUDBase[Answer, AnswerCreate, AnswerUpdate]):
         skip: int = 0,
         limit: int = 100,
     ) -> list[Answer]:
-        return (
-            db.query(self.model)
-            .filter(Answer.question_id == question_id, Answer.point < 0)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.locate(db, Question, question_id)
+        return db.scalars(
+            GET_INCORRECT_BY_QUESTION,
+            {"question_id": question_id, "skip": skip, "limit": limit},
+        ).all()
 
     def get_multi_by_question(
         self,
@@ -72,37 +130,34 @@ class CRUDAnswer(CRUDBase[Answer, AnswerCreate, AnswerUpdate]):
         skip: int = 0,
         limit: int = 100,
     ) -> list[Answer]:
-        return (
-            db.query(self.model)
-            .filter(Answer.question_id == question_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.locate(db, Question, question_id)
+        return db.scalars(
+            GET_MULTI_BY_QUESTION,
+            {"question_id": question_id, "skip": skip, "limit": limit},
+        ).all()
+
+    def get_multi_by_quiz(self, db: Session, *, quiz_id: UUID) -> list[Answer]:
+        shards.use_quiz(db, quiz_id)
+        return db.scalars(GET_MULTI_BY_QUIZ, {"quiz_id": quiz_id}).all()
 
     def count_by_question(self, db: Session, *, question_id: UUID) -> int:
-        return (
-            db.query(self.model)
-            .filter(Answer.question_id == question_id)
-            .count()
-        )
+        shards.locate(db, Question, question_id)
+        return db.scalar(COUNT_BY_QUESTION, {"question_id": question_id})
 
     def count_correct_by_question(
         self, db: Session, *, question_id: UUID
     ) -> int:
-        return (
-            db.query(self.model)
-            .filter(Answer.question_id == question_id, Answer.point > 0)
-            .count()
+        shards.locate(db, Question, question_id)
+        return db.scalar(
+            COUNT_CORRECT_BY_QUESTION, {"question_id": question_id}
         )
 
     def count_incorrect_by_question(
         self, db: Session, *, question_id: UUID
     ) -> int:
-        return (
-            db.query(self.model)
-            .filter(Answer.question_id == question_id, Answer.point < 0)
-            .count()
+        shards.locate(db, Question, question_id)
+        return db.scalar(
+            COUNT_INCORRECT_BY_QUESTION, {"question_id": question_id}
         )
 
 
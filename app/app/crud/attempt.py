@@ -1,13 +1,98 @@
-from datetime import datetime, timezone
+from typing import Optional
 
 from app.crud.base import CRUDBase
+from app.db import drafts, grading
+from app.db.audit import AuditAction
+from app.db.grading import GRADES, LOCK_DRAFT_ATTEMPT
+from app.db.partitions import quiz_of
+from app.db.session import shards
 from app.models.attempt import Attempt
+from app.models.question import Question
+from app.models.submission import Submission
 from app.schemas.attempt import AttemptCreate, AttemptUpdate
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import and_, bindparam, select, update
+from sqlalchemy.dialects.postgresql import UUID, insert
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
+# The quiz of the submission or question prunes the partitions of attempts
+BY_SUBMISSION = and_(
+    Attempt.submission_id == bindparam("submission_id"),
+    Attempt.quiz_id == quiz_of(Submission, bindparam("submission_id")),
+)
+GET_MULTI_BY_SUBMISSION = (
+    select(Attempt)
+    .where(BY_SUBMISSION)
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+GET_MULTI_BY_QUESTION = (
+    select(Attempt)
+    .where(
+        Attempt.question_id == bindparam("question_id"),
+        Attempt.quiz_id == quiz_of(Question, bindparam("question_id")),
+    )
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+GET_BY_SUBMISSION_QUESTION = (
+    select(Attempt)
+    .where(BY_SUBMISSION, Attempt.question_id == bindparam("question_id"))
+    .limit(1)
+)
+GET_MULTI_DRAFT_BY_SUBMISSION = select(Attempt).where(
+    BY_SUBMISSION, Attempt.draft
+)
+SUM_SCORE_BY_SUBMISSION = select(func.sum(Attempt.score)).where(BY_SUBMISSION)
+CREATE_WITH_QUESTION_SUBMISSION = (
+    insert(Attempt)
+    .on_conflict_do_nothing(
+        index_elements=[
+            Attempt.question_id,
+            Attempt.submission_id,
+            Attempt.quiz_id,
+        ]
+    )
+    .returning(Attempt)
+)
+
+# State transitions are single guarded UPDATEs: a request racing another
+# one on the same attempt matches no row instead of overwriting it.
+TIME_REMAINING = Attempt.time_remaining - (func.now() - Attempt.updated_at)
+OWNED_DRAFT = (
+    Attempt.id == bindparam("pk"),
+    Attempt.draft,
+    Attempt.user_id == bindparam("owner_id"),
+)
+SKIP = (
+    update(Attempt)
+    .where(
+        *OWNED_DRAFT,
+        ~Attempt.skipped,
+        select(Question.resumable)
+        .where(Question.id == Attempt.question_id)
+        .scalar_subquery(),
+    )
+    .values(time_remaining=TIME_REMAINING, skipped=True)
+    .returning(Attempt)
+)
+RESUME = (
+    update(Attempt)
+    .where(*OWNED_DRAFT, Attempt.skipped)
+    .values(skipped=False)
+    .returning(Attempt)
+)
+GET_DRAFT_QUIZ = select(Attempt.id, Attempt.quiz_id).where(
+    Attempt.id == bindparam("pk"), Attempt.draft
+)
+SUBMIT = (
+    update(Attempt)
+    .where(*OWNED_DRAFT, ~Attempt.skipped, Attempt.id == GRADES.c.id)
+    .values(time_remaining=TIME_REMAINING, draft=False, score=GRADES.c.score)
+    .returning(Attempt)
+)
+
 
 class CRUDAttempt(CRUDBase[Attempt, AttemptCreate, AttemptUpdate]):
     def create_with_question_submission(
@@ -16,15 +101,29 @@ class CRUDAttempt(CRUDBase[Attempt, AttemptCreate, AttemptUpdate]):
         *,
         obj_in: AttemptCreate,
         submission_id: UUID,
-        question_id: UUID
-    ) -> Attempt:
+        question_id: UUID,
+        quiz_id: UUID,
+        user_id: UUID
+    ) -> Optional[Attempt]:
+        """
+        Create the attempt, or return `None` when the submission already
+        has an attempt for the question.
+        """
+        shards.use_quiz(db, quiz_id)
         obj_in_data = jsonable_encoder(obj_in)
-        db_obj = self.model(
-            **obj_in_data, submission_id=submission_id, question_id=question_id
-        )
-        db.add(db_obj)
+        db_obj = db.scalars(
+            CREATE_WITH_QUESTION_SUBMISSION,
+            [
+                {
+                    **obj_in_data,
+                    "submission_id": submission_id,
+                    "question_id": question_id,
+                    "quiz_id": quiz_id,
+                    "user_id": user_id,
+                }
+            ],
+        ).first()
         db.commit()
-        db.refresh(db_obj)
         return db_obj
 
     def get_multi_by_submission(
@@ -35,13 +134,11 @@ class CRUDAttempt(CRUDBase[Attempt, AttemptCreate, AttemptUpdate]):
         skip: int = 0,
         limit: int = 100
     ) -> list[Attempt]:
-        return (
-            db.query(self.model)
-            .filter(Attempt.submission_id == submission_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.locate(db, Submission, submission_id)
+        return db.scalars(
+            GET_MULTI_BY_SUBMISSION,
+            {"submission_id": submission_id, "skip": skip, "limit": limit},
+        ).all()
 
     def get_multi_by_question(
         self,
@@ -51,102 +148,77 @@ class CRUDAttempt(CRUDBase[Attempt, AttemptCreate, AttemptUpdate]):
         skip: int = 0,
         limit: int = 100
     ) -> list[Attempt]:
-        return (
-            db.query(self.model)
-            .filter(Attempt.question_id == question_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.locate(db, Question, question_id)
+        return db.scalars(
+            GET_MULTI_BY_QUESTION,
+            {"question_id": question_id, "skip": skip, "limit": limit},
+        ).all()
 
     def get_by_submission_question(
-        self,
-        db: Session,
-        *,
-        submission_id: UUID,
-        question_id: UUID,
-        skip: int = 0,
-        limit: int = 100
-    ) -> Attempt:
-        return (
-            db.query(self.model.score)
-            .filter(
-                Attempt.submission_id == submission_id,
-                Attempt.question_id == question_id,
-            )
-            .offset(skip)
-            .limit(limit)
-            .first()
-        )
+        self, db: Session, *, submission_id: UUID, question_id: UUID
+    ) -> Optional[Attempt]:
+        shards.locate(db, Submission, submission_id)
+        return db.scalars(
+            GET_BY_SUBMISSION_QUESTION,
+            {"submission_id": submission_id, "question_id": question_id},
+        ).first()
 
     def get_multi_draft_by_submission(
         self, db: Session, *, submission_id: UUID
     ) -> list[Attempt]:
-        return (
-            db.query(self.model)
-            .filter(Attempt.submission_id == submission_id, Attempt.draft)
-            .all()
-        )
-
-    def submit_multi_by_submission_no_commit(
-        self, db: Session, *, submission_id: UUID, scores: dict[UUID, float]
-    ) -> None:
-        attempts = self.get_multi_draft_by_submission(
-            db, submission_id=submission_id
-        )
-        for attempt in attempts:
-            if attempt.time_remaining:
-                time_remaining = attempt.time_remaining - (
-                    datetime.now(tz=timezone.utc) - attempt.updated_at
-                )
-            else:
-                time_remaining = None
-            setattr(attempt, "time_remaining", time_remaining)
-            setattr(attempt, "draft", False)
-            setattr(attempt, "score", scores[attempt.id])
-            db.add(attempt)
+        shards.locate(db, Submission, submission_id)
+        return db.scalars(
+            GET_MULTI_DRAFT_BY_SUBMISSION, {"submission_id": submission_id}
+        ).all()
 
     def sum_score_by_submission(
         self, db: Session, *, submission_id: UUID
     ) -> float:
-        return db.query(
-            func.sum(self.model.score).filter(
-                Attempt.submission_id == submission_id
-            )
-        ).scalar()
+        shards.locate(db, Submission, submission_id)
+        return db.scalar(
+            SUM_SCORE_BY_SUBMISSION, {"submission_id": submission_id}
+        )
 
-    def skip(self, db: Session, *, db_obj: Attempt) -> Attempt:
-        if db_obj.time_remaining:
-            time_remaining = db_obj.time_remaining - (
-                datetime.now(tz=timezone.utc) - db_obj.updated_at
-            )
-        else:
-            time_remaining = None
-        return self.update(
+    def skip(
+        self, db: Session, *, id: UUID, user_id: UUID
+    ) -> Optional[Attempt]:
+        return self._transition(
             db,
-            db_obj=db_obj,
-            obj_in={"time_remaining": time_remaining, "skipped": True},
+            SKIP,
+            {"pk": id, "owner_id": user_id},
+            audit_action=AuditAction.SKIP_ATTEMPT,
         )
 
-    def resume(self, db: Session, *, db_obj: Attempt) -> Attempt:
-        return self.update(db, db_obj=db_obj, obj_in={"skipped": False})
-
-    def submit(self, db: Session, *, db_obj: Attempt, score: float) -> Attempt:
-        if db_obj.time_remaining:
-            time_remaining = db_obj.time_remaining - (
-                datetime.now(tz=timezone.utc) - db_obj.updated_at
-            )
-        else:
-            time_remaining = None
-        return self.update(
+    def resume(
+        self, db: Session, *, id: UUID, user_id: UUID
+    ) -> Optional[Attempt]:
+        return self._transition(
             db,
-            db_obj=db_obj,
-            obj_in={
-                "time_remaining": time_remaining,
-                "draft": False,
-                "score": score,
-            },
+            RESUME,
+            {"pk": id, "owner_id": user_id},
+            audit_action=AuditAction.RESUME_ATTEMPT,
         )
 
+    def submit(
+        self, db: Session, *, id: UUID, user_id: UUID
+    ) -> Optional[Attempt]:
+        """
+        Submit the attempt, graded with the scoring of the quiz.
+        """
+        shards.locate(db, self.model, id)
+        attempts = (
+            dict(db.execute(GET_DRAFT_QUIZ, {"pk": id}).all())
+            if drafts.store is not None
+            else {}
+        )
+        with drafts.write_behind(db, attempts):
+            grades = grading.grade_drafts(db, LOCK_DRAFT_ATTEMPT, {"pk": id})
+            return self._transition(
+                db,
+                SUBMIT,
+                {"pk": id, "owner_id": user_id, **grades},
+                audit_action=AuditAction.SUBMIT_ATTEMPT,
+            )
+
 
 attempt = CRUDAttempt(Attempt)
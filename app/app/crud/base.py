@@ -1,11 +1,20 @@
-from typing import Any, Generic, Optional, Type, TypeVar, Union
+from inspect import getattr_static, isfunction
+from typing import Any, Callable, Generic, Optional, Type, TypeVar, Union
 
+from app.core.metrics import timed_crud
+from app.db import audit
+from app.db.audit import AuditAction
 from app.db.base_class import Base
+from app.db.session import shards
+from app.db.shards import SHARDED_TABLES
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import bindparam, delete, select, update
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.base import Executable
 from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.functions import now
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -13,6 +22,26 @@ UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        for name in dir(cls):
+            if name.startswith("_"):
+                continue
+            # Static and class methods are timed as the same descriptor, so
+            # they keep being called without an instance
+            attribute = getattr_static(cls, name)
+            if isinstance(attribute, (staticmethod, classmethod)):
+                descriptor, method = type(attribute), attribute.__func__
+            elif isfunction(attribute):
+                descriptor, method = None, attribute
+            else:
+                continue
+            method = getattr(method, "__wrapped__", method)
+            timed = timed_crud(cls.__name__, name, method)
+            setattr(
+                cls, name, timed if descriptor is None else descriptor(timed)
+            )
+
     def __init__(self, model: Type[ModelType]):
         """
         CRUD object with default methods.
@@ -23,14 +52,48 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         * `schema`: A Pydantic model (schema) class
         """
         self.model = model
+        # Rows of sharded models are looked up on every shard when the
+        # session is not pinned to one yet
+        self.sharded = model.__table__.name in SHARDED_TABLES
+        # Fixed-shape statements are built once so that every call reuses
+        # the memoized cache key and the compiled form from the engine cache
+        # Soft-deleted rows stay invisible until the purge removes them
+        live = (
+            (model.deleted_at.is_(None),)
+            if hasattr(model, "deleted_at")
+            else ()
+        )
+        self._get_statement = select(model).where(
+            model.id == bindparam("id"), *live
+        )
+        self._get_multi_statement = (
+            select(model)
+            .where(*live)
+            .offset(bindparam("skip"))
+            .limit(bindparam("limit"))
+        )
+        self._delete_statement = (
+            delete(model).where(model.id == bindparam("pk")).returning(model)
+        )
+        if live:
+            self._soft_delete_statement = (
+                update(model)
+                .where(model.id == bindparam("pk"), *live)
+                .values(deleted_at=now())
+                .returning(model)
+            )
 
     def get(self, db: Session, id: UUID) -> Optional[ModelType]:
-        return db.query(self.model).filter(self.model.id == id).first()
+        if self.sharded:
+            shards.locate(db, self.model, id)
+        return db.scalars(self._get_statement, {"id": id}).first()
 
     def get_multi(
         self, db: Session, *, skip: int = 0, limit: int = 100
     ) -> list[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return db.scalars(
+            self._get_multi_statement, {"skip": skip, "limit": limit}
+        ).all()
 
     def get_multi_with_filter(
         self,
@@ -52,13 +115,13 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.refresh(db_obj)
         return db_obj
 
-    def update(
+    def update_no_commit(
         self,
         db: Session,
         *,
         db_obj: ModelType,
         obj_in: Union[UpdateSchemaType, dict[str, Any]]
-    ) -> ModelType:
+    ) -> None:
         obj_data = jsonable_encoder(db_obj)
         if isinstance(obj_in, dict):
             update_data = obj_in
@@ -68,12 +131,64 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             if field in update_data:
                 setattr(db_obj, field, update_data[field])
         db.add(db_obj)
+
+    def update(
+        self,
+        db: Session,
+        *,
+        db_obj: ModelType,
+        obj_in: Union[UpdateSchemaType, dict[str, Any]]
+    ) -> ModelType:
+        self.update_no_commit(db, db_obj=db_obj, obj_in=obj_in)
         db.commit()
         db.refresh(db_obj)
         return db_obj
 
-    def delete(self, db: Session, *, id: UUID) -> ModelType:
-        obj = db.query(self.model).get(id)
-        db.delete(obj)
+    def _transition(
+        self,
+        db: Session,
+        statement: Executable,
+        params: dict[str, Any],
+        before_commit: Optional[Callable[[ModelType], None]] = None,
+        audit_action: Optional[AuditAction] = None,
+    ) -> Optional[ModelType]:
+        """
+        Commit a guarded `UPDATE`/`DELETE .. RETURNING` and return the
+        affected row, or `None` when the guard matched no row.
+
+        The row is detached before the commit, so returning it to the client
+        does not reload it. `before_commit` is called with the row to write
+        what follows from the transition in the same transaction. Committed
+        transitions are recorded in the audit log as `audit_action`.
+        """
+        if self.sharded:
+            shards.locate(db, self.model, params["pk"])
+        # RETURNING already carries the new state, so the session needs no
+        # synchronization, which would otherwise expire the returned row.
+        db_obj = db.scalars(
+            statement,
+            params,
+            execution_options={"synchronize_session": False},
+        ).first()
+        if db_obj is not None:
+            db.expunge(db_obj)
+            if before_commit is not None:
+                before_commit(db_obj)
         db.commit()
-        return obj
+        if db_obj is not None and audit_action is not None:
+            audit.record(audit_action, [db_obj])
+        return db_obj
+
+    def delete(self, db: Session, *, id: UUID) -> Optional[ModelType]:
+        """
+        Delete the row; its dependents go with it through `ON DELETE
+        CASCADE` without being loaded.
+        """
+        return self._transition(db, self._delete_statement, {"pk": id})
+
+    def soft_delete(self, db: Session, *, id: UUID) -> Optional[ModelType]:
+        """
+        Mark the row deleted and hide it from reads, leaving its removal
+        to `app.db.purge`. Only available for models with `deleted_at`.
+        """
+        return self._transition(db, self._soft_delete_statement, {"pk": id})
@@ -1,15 +1,28 @@
 from app.crud.base import CRUDBase
+from app.db.session import shards
 from app.models.question import Question
 from app.schemas.question import QuestionCreate, QuestionUpdate
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import bindparam, select
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+BY_QUIZ = Question.quiz_id == bindparam("quiz_id")
+GET_MULTI_BY_QUIZ = (
+    select(Question)
+    .where(BY_QUIZ)
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+COUNT_BY_QUIZ = select(func.count()).select_from(Question).where(BY_QUIZ)
 
 
 class CRUDQuestion(CRUDBase[Question, QuestionCreate, QuestionUpdate]):
     def create_with_quiz(
         self, db: Session, *, obj_in: QuestionCreate, quiz_id: UUID
     ) -> Question:
+        shards.use_quiz(db, quiz_id)
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data, quiz_id=quiz_id)
         db.add(db_obj)
@@ -20,16 +33,15 @@ class CRUDQuestion(CRUDBase[Question, QuestionCreate, QuestionUpdate]):
     def get_multi_by_quiz(
         self, db: Session, *, quiz_id: UUID, skip: int = 0, limit: int = 100
     ) -> list[Question]:
-        return (
-            db.query(self.model)
-            .filter(Question.quiz_id == quiz_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.use_quiz(db, quiz_id)
+        return db.scalars(
+            GET_MULTI_BY_QUIZ,
+            {"quiz_id": quiz_id, "skip": skip, "limit": limit},
+        ).all()
 
     def count_by_quiz(self, db: Session, *, quiz_id: UUID) -> int:
-        return db.query(self.model).filter(Question.quiz_id == quiz_id).count()
+        shards.use_quiz(db, quiz_id)
+        return db.scalar(COUNT_BY_QUIZ, {"quiz_id": quiz_id})
 
 
 question = CRUDQuestion(Question)
@@ -1,10 +1,28 @@
 from app.crud.base import CRUDBase
+from app.db import outbox
+from app.db.outbox import Topic
+from app.db.session import shards
+from app.db.shards import DEFAULT_SHARD
 from app.models.quiz import Quiz
 from app.schemas.quiz import QuizCreate, QuizUpdate
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import bindparam, select
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Session
 
+GET_MULTI_BY_AUTHOR = (
+    select(Quiz)
+    .where(Quiz.author_id == bindparam("author_id"), Quiz.deleted_at.is_(None))
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+GET_MULTI_PUBLISHED = (
+    select(Quiz)
+    .where(Quiz.published, Quiz.deleted_at.is_(None))
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+
 
 class CRUDQuiz(CRUDBase[Quiz, QuizCreate, QuizUpdate]):
     def create_with_author(
@@ -20,27 +38,37 @@ class CRUDQuiz(CRUDBase[Quiz, QuizCreate, QuizUpdate]):
     def get_multi_by_author(
         self, db: Session, *, author_id: UUID, skip: int = 0, limit: int = 100
     ) -> list[Quiz]:
-        return (
-            db.query(self.model)
-            .filter(Quiz.author_id == author_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        return db.scalars(
+            GET_MULTI_BY_AUTHOR,
+            {"author_id": author_id, "skip": skip, "limit": limit},
+        ).all()
 
     def get_multi_published(
         self, db: Session, *, skip: int = 0, limit: int = 100
     ) -> list[Quiz]:
-        return (
-            db.query(self.model)
-            .filter(Quiz.published)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        return db.scalars(
+            GET_MULTI_PUBLISHED, {"skip": skip, "limit": limit}
+        ).all()
 
     def publish(self, db: Session, db_obj: Quiz) -> Quiz:
-        return self.update(db, db_obj=db_obj, obj_in={"published": True})
+        """
+        Publish the quiz, and write its event to the outbox of the primary,
+        which holds `quizzes`, in the same transaction.
+        """
+        db_obj.published = True
+        db.add(db_obj)
+        with shards.pin(db, DEFAULT_SHARD):
+            outbox.write(
+                db,
+                Topic.QUIZ_PUBLISHED,
+                quiz_id=db_obj.id,
+                user_id=db_obj.author_id,
+                subject_id=db_obj.id,
+                payload={"scoring": db_obj.scoring},
+            )
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
 
 
 quiz = CRUDQuiz(Quiz)
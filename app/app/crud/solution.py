@@ -1,47 +1,260 @@
+from datetime import datetime, timezone
+from operator import attrgetter
+from typing import Any, Optional
+
 from app.crud.base import CRUDBase
+from app.db import audit, drafts
+from app.db.audit import AuditAction
+from app.db.base_class import uuid7
+from app.db.partitions import quiz_of
+from app.db.session import shards
+from app.models.attempt import Attempt
 from app.models.solution import Solution
+from app.models.submission import Submission
 from app.schemas.solution import SolutionCreate, SolutionUpdate
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import and_, bindparam, delete, select
+from sqlalchemy.dialects.postgresql import UUID, insert
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
+# The quiz of the attempt or submission prunes the partitions of solutions
+BY_ATTEMPT = and_(
+    Solution.attempt_id == bindparam("attempt_id"),
+    Solution.quiz_id == quiz_of(Attempt, bindparam("attempt_id")),
+)
+SUBMISSION_QUIZ = quiz_of(Submission, bindparam("submission_id"))
+GET_MULTI_BY_ATTEMPT = (
+    select(Solution)
+    .where(BY_ATTEMPT)
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+GET_MULTI_BY_SUBMISSION = (
+    select(Solution)
+    .join(
+        Attempt,
+        and_(
+            Attempt.id == Solution.attempt_id,
+            Attempt.quiz_id == Solution.quiz_id,
+        ),
+    )
+    .where(
+        Attempt.submission_id == bindparam("submission_id"),
+        Attempt.quiz_id == SUBMISSION_QUIZ,
+        Solution.quiz_id == SUBMISSION_QUIZ,
+    )
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+SUM_POINT_BY_ATTEMPT = select(func.sum(Solution.point)).where(BY_ATTEMPT)
+CREATE_WITH_ANSWER_ATTEMPT = (
+    insert(Solution)
+    .on_conflict_do_nothing(
+        index_elements=[
+            Solution.answer_id,
+            Solution.attempt_id,
+            Solution.quiz_id,
+        ]
+    )
+    .returning(Solution)
+)
+DELETE_MULTI_BY_USER = (
+    delete(Solution)
+    .where(
+        Solution.id.in_(bindparam("ids", expanding=True)),
+        Solution.user_id == bindparam("owner_id"),
+    )
+    .returning(
+        Solution.id,
+        Solution.attempt_id,
+        Solution.answer_id,
+        Solution.quiz_id,
+        Solution.user_id,
+    )
+)
+
 
 class CRUDSolution(CRUDBase[Solution, SolutionCreate, SolutionUpdate]):
+    """
+    Solutions go through `app.db.drafts` when a draft store is configured:
+    writes only reach the store, and reads merge its pending changes over
+    the table.
+    """
+
+    def get(self, db: Session, id: UUID) -> Optional[Solution]:
+        if drafts.store is not None:
+            value = drafts.store.lookup(id)
+            if value is not None:
+                return drafts.decode(value)
+        return super().get(db, id)
+
     def create_with_answer_attempt(
         self,
         db: Session,
         *,
         obj_in: SolutionCreate,
         attempt_id: UUID,
-        answer_id: UUID
-    ) -> Solution:
+        answer_id: UUID,
+        quiz_id: UUID,
+        user_id: UUID
+    ) -> Optional[Solution]:
+        """
+        Create the solution, or return `None` when the attempt already has
+        a solution for the answer.
+        """
         obj_in_data = jsonable_encoder(obj_in)
-        db_obj = self.model(
-            **obj_in_data, attempt_id=attempt_id, answer_id=answer_id
+        db_objs = self.create_multi(
+            db,
+            objs_in=[
+                {
+                    **obj_in_data,
+                    "attempt_id": attempt_id,
+                    "answer_id": answer_id,
+                    "quiz_id": quiz_id,
+                    "user_id": user_id,
+                }
+            ],
         )
-        db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
-        return db_obj
+        return db_objs[0] if db_objs else None
+
+    def create_multi(
+        self, db: Session, *, objs_in: list[dict[str, Any]]
+    ) -> list[Solution]:
+        """
+        Create the solutions at once, skipping those whose attempt already
+        has a solution for the answer. They must all belong to the same quiz.
+        """
+        if not objs_in:
+            return []
+        shards.use_quiz(db, objs_in[0]["quiz_id"])
+        if drafts.store is None:
+            db_objs = db.scalars(CREATE_WITH_ANSWER_ATTEMPT, objs_in).all()
+            # Detached like the rows of transitions, so that neither the
+            # audit log nor the client reloads them after the commit
+            for db_obj in db_objs:
+                db.expunge(db_obj)
+            db.commit()
+            audit.record(AuditAction.ADD_SOLUTION, db_objs)
+            return db_objs
+        chosen = {
+            (attempt_id, solution.answer_id)
+            for attempt_id in {obj_in["attempt_id"] for obj_in in objs_in}
+            for solution in self.get_multi_by_attempt(
+                db, attempt_id=attempt_id
+            )
+        }
+        created_at = datetime.now(timezone.utc)
+        db_objs = []
+        for obj_in in objs_in:
+            key = (obj_in["attempt_id"], obj_in["answer_id"])
+            if key in chosen:
+                continue
+            chosen.add(key)
+            db_obj = self.model(
+                **obj_in,
+                id=uuid7(),
+                created_at=created_at,
+                updated_at=created_at,
+            )
+            drafts.store.add(db_obj)
+            db_objs.append(db_obj)
+        audit.record(AuditAction.ADD_SOLUTION, db_objs)
+        return db_objs
 
     def get_multi_by_attempt(
         self, db: Session, *, attempt_id: UUID, skip: int = 0, limit: int = 100
     ) -> list[Solution]:
-        return (
-            db.query(self.model)
-            .filter(Solution.attempt_id == attempt_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.locate(db, Attempt, attempt_id)
+        if drafts.store is None:
+            return db.scalars(
+                GET_MULTI_BY_ATTEMPT,
+                {"attempt_id": attempt_id, "skip": skip, "limit": limit},
+            ).all()
+        changes = drafts.store.changes(attempt_id)
+        merged = {
+            solution.id: solution
+            for solution in db.scalars(
+                GET_MULTI_BY_ATTEMPT,
+                {
+                    "attempt_id": attempt_id,
+                    "skip": 0,
+                    "limit": skip + limit + len(changes),
+                },
+            )
+        }
+        for id, value in changes.items():
+            solution = drafts.decode(value)
+            if solution is None:
+                merged.pop(id, None)
+            else:
+                merged[id] = solution
+        solutions = sorted(merged.values(), key=attrgetter("id"))
+        return solutions[skip:][:limit]
+
+    def get_multi_by_submission(
+        self,
+        db: Session,
+        *,
+        submission_id: UUID,
+        skip: int = 0,
+        limit: int = 100
+    ) -> list[Solution]:
+        """
+        Solutions of a submitted submission, which has none left in the
+        draft store.
+        """
+        shards.locate(db, Submission, submission_id)
+        return db.scalars(
+            GET_MULTI_BY_SUBMISSION,
+            {"submission_id": submission_id, "skip": skip, "limit": limit},
+        ).all()
 
     def sum_point_by_attempt(self, db: Session, *, attempt_id: UUID) -> float:
-        return db.query(
-            func.sum(self.model.point).filter(
-                Solution.attempt_id == attempt_id
+        shards.locate(db, Attempt, attempt_id)
+        return db.scalar(SUM_POINT_BY_ATTEMPT, {"attempt_id": attempt_id})
+
+    def delete_multi_by_user(
+        self, db: Session, *, ids: list[UUID], user_id: UUID
+    ) -> list[UUID]:
+        """
+        Delete the solutions among `ids` that belong to the user, and return
+        the ids of those deleted.
+        """
+        if not ids:
+            return []
+        if drafts.store is None:
+            shards.locate(db, self.model, ids[0])
+            rows = db.execute(
+                DELETE_MULTI_BY_USER,
+                {"ids": ids, "owner_id": user_id},
+                execution_options={"synchronize_session": False},
+            ).all()
+            db.commit()
+            audit.record(AuditAction.DELETE_SOLUTION, rows)
+            return [row.id for row in rows]
+        db_objs = []
+        for id in ids:
+            db_obj = self.get(db, id)
+            if db_obj is not None and db_obj.user_id == user_id:
+                drafts.store.discard(db_obj)
+                db_objs.append(db_obj)
+        audit.record(AuditAction.DELETE_SOLUTION, db_objs)
+        return [db_obj.id for db_obj in db_objs]
+
+    def delete(self, db: Session, *, id: UUID) -> Optional[Solution]:
+        if drafts.store is None:
+            return self._transition(
+                db,
+                self._delete_statement,
+                {"pk": id},
+                audit_action=AuditAction.DELETE_SOLUTION,
             )
-        ).scalar()
+        db_obj = self.get(db, id)
+        if db_obj is not None:
+            drafts.store.discard(db_obj)
+            audit.record(AuditAction.DELETE_SOLUTION, [db_obj])
+        return db_obj
 
 
 solution = CRUDSolution(Solution)
@@ -1,38 +1,348 @@
-from datetime import datetime, timezone
+from operator import attrgetter
+from typing import Optional
 
+from app.core.config import settings
+from app.core.sketch import ScoreSketch, TDigest
 from app.crud.base import CRUDBase
+from app.db import audit, drafts, grading, outbox
+from app.db.audit import AuditAction
+from app.db.base_class import uuid7
+from app.db.grading import GRADES, LOCK_DRAFT_ATTEMPTS_BY_SUBMISSION
+from app.db.outbox import Topic
+from app.db.partitions import quiz_of
+from app.db.session import shards
+from app.models.attempt import Attempt
+from app.models.question import Question
+from app.models.quiz import Quiz
+from app.models.quiz_score_sketch import QuizScoreSketch
 from app.models.submission import Submission
+from app.models.submission_counter import SubmissionCounter
 from app.schemas.submission import SubmissionCreate, SubmissionUpdate
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    Boolean,
+    Double,
+    Interval,
+    LargeBinary,
+    bindparam,
+    case,
+    cast,
+    false,
+    insert,
+    select,
+    true,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import UUID, array
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+BY_USER = Submission.user_id == bindparam("user_id")
+BY_QUIZ_USER = (Submission.quiz_id == bindparam("quiz_id"), BY_USER)
+COUNT_BY_QUIZ_USER = (
+    select(func.count()).select_from(Submission).where(*BY_QUIZ_USER)
+)
+GET_MULTI_BY_QUIZ_USER = (
+    select(Submission)
+    .where(*BY_QUIZ_USER)
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+GET_MULTI_BY_USER = (
+    select(Submission)
+    .where(BY_USER)
+    .order_by(Submission.id)
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+# The quiz of the submission prunes the partitions of attempts
+SUBMISSION_QUIZ = quiz_of(Submission, bindparam("pk"))
+GET_DRAFT_ATTEMPT_QUIZZES = select(Attempt.id, Attempt.quiz_id).where(
+    Attempt.submission_id == bindparam("pk"),
+    Attempt.quiz_id == SUBMISSION_QUIZ,
+    Attempt.draft,
+)
+GET_NONDRAFT_MULTI_BY_QUIZ = (
+    select(Submission)
+    .where(Submission.quiz_id == bindparam("quiz_id"), ~Submission.draft)
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+
+# Taking a submission slot bumps the (quiz, user) counter only while it is
+# below `max_submissions`. Concurrent drafts serialize on the counter row,
+# so the limit holds without a separate count query. A missing counter is
+# seeded from the submissions made before the counters existed.
+EXISTING_BY_QUIZ_USER = COUNT_BY_QUIZ_USER.scalar_subquery()
+RESERVE_BY_QUIZ_USER = (
+    pg_insert(SubmissionCounter)
+    .from_select(
+        ["id", "quiz_id", "user_id", "count"],
+        select(
+            bindparam("counter_id", type_=UUID(as_uuid=True)),
+            bindparam("quiz_id", type_=UUID(as_uuid=True)),
+            bindparam("user_id", type_=UUID(as_uuid=True)),
+            EXISTING_BY_QUIZ_USER + 1,
+        ).where(EXISTING_BY_QUIZ_USER < bindparam("max_submissions")),
+    )
+    .on_conflict_do_update(
+        index_elements=[SubmissionCounter.quiz_id, SubmissionCounter.user_id],
+        set_={"count": SubmissionCounter.count + 1},
+        where=SubmissionCounter.count < bindparam("max_submissions"),
+    )
+    .returning(SubmissionCounter.count)
+    .cte("reserved")
+)
+# ORM-enabled INSERT does not support INSERT .. SELECT, so the Core
+# statement is mapped back onto `Submission` with `from_statement`.
+CREATE_WITH_QUIZ_USER = select(Submission).from_statement(
+    insert(Submission.__table__)
+    .from_select(
+        ["id", "quiz_id", "user_id", "time_remaining", "draft", "paused"],
+        select(
+            bindparam("id", type_=UUID(as_uuid=True)),
+            bindparam("quiz_id", type_=UUID(as_uuid=True)),
+            bindparam("user_id", type_=UUID(as_uuid=True)),
+            cast(bindparam("time_remaining"), Interval),
+            true(),
+            false(),
+        ).select_from(RESERVE_BY_QUIZ_USER),
+    )
+    .returning(*Submission.__table__.columns)
+)
+
+# State transitions are single guarded UPDATEs: a request racing another
+# one on the same submission matches no row instead of overwriting it.
+TIME_REMAINING = Submission.time_remaining - (
+    func.now() - Submission.updated_at
+)
+OWNED_DRAFT = (
+    Submission.id == bindparam("pk"),
+    Submission.user_id == bindparam("owner_id"),
+    Submission.draft,
+)
+# The clock of a submission only runs while it is not paused
+LIVE_STATE = select(
+    Submission.draft,
+    Submission.paused,
+    case(
+        (Submission.paused, Submission.time_remaining), else_=TIME_REMAINING
+    ).label("time_remaining"),
+    func.now().label("server_time"),
+).where(Submission.id == bindparam("id"))
+# The quiz lives in the primary, apart from its submissions, so `resumable`
+# is read share-locked: the quiz cannot change until the pause commits.
+RESUMABLE = (
+    select(Quiz.resumable)
+    .where(Quiz.id == bindparam("quiz_id"), Quiz.deleted_at.is_(None))
+    .with_for_update(read=True)
+)
+PAUSE = (
+    update(Submission)
+    .where(
+        *OWNED_DRAFT,
+        ~Submission.paused,
+        Submission.quiz_id == bindparam("quiz"),
+        bindparam("resumable", type_=Boolean),
+    )
+    .values(time_remaining=TIME_REMAINING, paused=True)
+    .returning(Submission)
+)
+RESUME = (
+    update(Submission)
+    .where(*OWNED_DRAFT, Submission.paused)
+    .values(paused=False)
+    .returning(Submission)
+)
+# Submitting also submits the draft attempts, with the scores they were
+# graded with. Both UPDATEs read the same snapshot, so the submission score
+# adds the attempts submitted here to those submitted before.
+SUBMIT_ATTEMPTS = (
+    update(Attempt)
+    .where(
+        Attempt.id == GRADES.c.id,
+        Attempt.submission_id == bindparam("pk"),
+        Attempt.quiz_id == SUBMISSION_QUIZ,
+        Attempt.draft,
+        select(Submission.id).where(*OWNED_DRAFT, ~Submission.paused).exists(),
+    )
+    .values(
+        time_remaining=Attempt.time_remaining
+        - (func.now() - Attempt.updated_at),
+        draft=False,
+        score=GRADES.c.score,
+    )
+    .returning(Attempt.score)
+    .cte("submitted_attempts")
+)
+ATTEMPT_SCORES = union_all(
+    select(SUBMIT_ATTEMPTS.c.score),
+    select(Attempt.score).where(
+        Attempt.submission_id == bindparam("pk"),
+        Attempt.quiz_id == SUBMISSION_QUIZ,
+        ~Attempt.draft,
+    ),
+).subquery()
+SUBMIT = (
+    update(Submission)
+    .add_cte(SUBMIT_ATTEMPTS)
+    .where(*OWNED_DRAFT, ~Submission.paused)
+    .values(
+        time_remaining=TIME_REMAINING,
+        draft=False,
+        score=select(func.sum(ATTEMPT_SCORES.c.score)).scalar_subquery(),
+    )
+    .returning(Submission)
+)
+
+# Every submitted score goes into one of `SCORE_SKETCH_STRIPES` sketch rows
+# of its quiz, so concurrent submissions to a popular quiz rarely wait on
+# the same row lock; reading merges the stripes. A score only costs a few
+# additions and an array append here, its row folds the appended scores
+# into the digest every `SCORE_SKETCH_BUFFER` scores.
+SCORE = bindparam("score", type_=Double)
+SCORE_SKETCH = pg_insert(QuizScoreSketch).values(
+    id=bindparam("id"),
+    quiz_id=bindparam("quiz_id"),
+    stripe=bindparam("stripe"),
+    count=1,
+    total=SCORE,
+    total_squares=SCORE * SCORE,
+    pending=array([SCORE]),
+)
+RECORD_SCORE = SCORE_SKETCH.on_conflict_do_update(
+    index_elements=[QuizScoreSketch.quiz_id, QuizScoreSketch.stripe],
+    set_={
+        "count": QuizScoreSketch.count + 1,
+        "total": QuizScoreSketch.total + SCORE_SKETCH.excluded.total,
+        "total_squares": QuizScoreSketch.total_squares
+        + SCORE_SKETCH.excluded.total_squares,
+        "pending": func.array_cat(
+            QuizScoreSketch.pending, SCORE_SKETCH.excluded.pending
+        ),
+        "updated_at": func.now(),
+    },
+).returning(
+    QuizScoreSketch.id,
+    QuizScoreSketch.digest,
+    QuizScoreSketch.pending,
+)
+FOLD_SCORES = (
+    update(QuizScoreSketch)
+    .where(QuizScoreSketch.id == bindparam("pk"))
+    .values(digest=bindparam("digest", type_=LargeBinary), pending=[])
+)
+GET_SCORE_SKETCHES = select(
+    QuizScoreSketch.count,
+    QuizScoreSketch.total,
+    QuizScoreSketch.total_squares,
+    QuizScoreSketch.digest,
+    QuizScoreSketch.pending,
+).where(QuizScoreSketch.quiz_id == bindparam("quiz_id"))
 
 
 class CRUDSubmission(CRUDBase[Submission, SubmissionCreate, SubmissionUpdate]):
-    def create_with_quiz_user(
+    def create_with_quiz_user_no_commit(
         self,
         db: Session,
         *,
         obj_in: SubmissionCreate,
         user_id: UUID,
-        quiz_id: UUID
-    ) -> Submission:
+        quiz_id: UUID,
+        max_submissions: int
+    ) -> Optional[Submission]:
+        shards.use_quiz(db, quiz_id)
         obj_in_data = jsonable_encoder(obj_in)
-        db_obj = self.model(**obj_in_data, user_id=user_id, quiz_id=quiz_id)
-        db.add(db_obj)
+        return db.scalars(
+            CREATE_WITH_QUIZ_USER,
+            {
+                "id": uuid7(),
+                "counter_id": uuid7(),
+                "quiz_id": quiz_id,
+                "user_id": user_id,
+                "time_remaining": obj_in_data.get("time_remaining"),
+                "max_submissions": max_submissions,
+            },
+        ).first()
+
+    def create_with_quiz_user(
+        self,
+        db: Session,
+        *,
+        obj_in: SubmissionCreate,
+        user_id: UUID,
+        quiz_id: UUID,
+        max_submissions: int
+    ) -> Optional[Submission]:
+        """
+        Create the submission, or return `None` when the user already made
+        `max_submissions` submissions to the quiz.
+        """
+        db_obj = self.create_with_quiz_user_no_commit(
+            db,
+            obj_in=obj_in,
+            user_id=user_id,
+            quiz_id=quiz_id,
+            max_submissions=max_submissions,
+        )
         db.commit()
-        db.refresh(db_obj)
+        if db_obj is not None:
+            audit.record(AuditAction.DRAFT, [db_obj])
         return db_obj
 
+    def draft_with_attempts(
+        self,
+        db: Session,
+        *,
+        obj_in: SubmissionCreate,
+        user_id: UUID,
+        quiz_id: UUID,
+        max_submissions: int
+    ) -> tuple[Optional[Submission], list[UUID]]:
+        db_obj = self.create_with_quiz_user_no_commit(
+            db,
+            obj_in=obj_in,
+            user_id=user_id,
+            quiz_id=quiz_id,
+            max_submissions=max_submissions,
+        )
+        if db_obj is None:
+            db.rollback()
+            return None, []
+        questions = db.execute(
+            select(Question.id, Question.duration).where(
+                Question.quiz_id == quiz_id
+            )
+        ).all()
+        attempt_ids = []
+        if questions:
+            attempt_ids = db.scalars(
+                insert(Attempt).returning(Attempt.id),
+                [
+                    {
+                        "submission_id": db_obj.id,
+                        "question_id": question_id,
+                        "quiz_id": quiz_id,
+                        "user_id": user_id,
+                        "time_remaining": duration,
+                    }
+                    for question_id, duration in questions
+                ],
+            ).all()
+        db.commit()
+        db.refresh(db_obj)
+        audit.record(AuditAction.DRAFT, [db_obj])
+        return db_obj, attempt_ids
+
     def count_by_quiz_user(
         self, db: Session, *, user_id: UUID, quiz_id: UUID
     ) -> int:
-        return (
-            db.query(self.model)
-            .filter(
-                Submission.user_id == user_id, Submission.quiz_id == quiz_id
-            )
-            .count()
+        shards.use_quiz(db, quiz_id)
+        return db.scalar(
+            COUNT_BY_QUIZ_USER, {"quiz_id": quiz_id, "user_id": user_id}
         )
 
     def get_multi_by_quiz_user(
@@ -44,72 +354,171 @@ class CRUDSubmission(CRUDBase[Submission, SubmissionCreate, SubmissionUpdate]):
         skip: int = 0,
         limit: int = 100
     ) -> list[Submission]:
-        return (
-            db.query(self.model)
-            .filter(
-                Submission.user_id == user_id, Submission.quiz_id == quiz_id
-            )
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.use_quiz(db, quiz_id)
+        return db.scalars(
+            GET_MULTI_BY_QUIZ_USER,
+            {
+                "quiz_id": quiz_id,
+                "user_id": user_id,
+                "skip": skip,
+                "limit": limit,
+            },
+        ).all()
 
     def get_multi_by_user(
         self, db: Session, *, user_id: UUID, skip: int = 0, limit: int = 100
     ) -> list[Submission]:
-        return (
-            db.query(self.model)
-            .filter(Submission.user_id == user_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        """
+        The submissions of a user span quizzes, so with shards configured
+        the first `skip + limit` of every shard are merged by id.
+        """
+        if len(shards.engines) == 1:
+            return db.scalars(
+                GET_MULTI_BY_USER,
+                {"user_id": user_id, "skip": skip, "limit": limit},
+            ).all()
+        submissions = [
+            submission
+            for _ in shards.each(db)
+            for submission in db.scalars(
+                GET_MULTI_BY_USER,
+                {"user_id": user_id, "skip": 0, "limit": skip + limit},
+            )
+        ]
+        submissions.sort(key=attrgetter("id"))
+        return submissions[skip:][:limit]
 
     def get_nondraft_multi_by_quiz(
         self, db: Session, *, quiz_id: UUID, skip: int = 0, limit: int = 100
     ) -> list[Submission]:
-        return (
-            db.query(self.model)
-            .filter(Submission.quiz_id == quiz_id, not Submission.draft)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        shards.use_quiz(db, quiz_id)
+        return db.scalars(
+            GET_NONDRAFT_MULTI_BY_QUIZ,
+            {"quiz_id": quiz_id, "skip": skip, "limit": limit},
+        ).all()
 
-    def pause(self, db: Session, *, db_obj: Submission):
-        if db_obj.time_remaining:
-            time_remaining = db_obj.time_remaining - (
-                datetime.now(tz=timezone.utc) - db_obj.updated_at
-            )
-        else:
-            time_remaining = None
-        return self.update(
+    def get_live_state(self, db: Session, *, id: UUID) -> Optional[Row]:
+        """
+        Return `draft`, `paused`, `time_remaining` and `server_time` of the
+        submission as of the database clock.
+        """
+        shards.locate(db, self.model, id)
+        return db.execute(LIVE_STATE, {"id": id}).first()
+
+    def pause(
+        self, db: Session, *, id: UUID, user_id: UUID, quiz_id: UUID
+    ) -> Optional[Submission]:
+        """
+        Pause the submission of the quiz, which only succeeds while the quiz
+        is `resumable`.
+        """
+        resumable = db.scalar(RESUMABLE, {"quiz_id": quiz_id})
+        return self._transition(
             db,
-            db_obj=db_obj,
-            obj_in={"time_remaining": time_remaining, "paused": True},
+            PAUSE,
+            {
+                "pk": id,
+                "owner_id": user_id,
+                "quiz": quiz_id,
+                "resumable": bool(resumable),
+            },
+            audit_action=AuditAction.PAUSE,
         )
 
-    def resume(self, db: Session, *, db_obj: Submission):
-        return self.update(db, db_obj=db_obj, obj_in={"paused": False})
+    def resume(
+        self, db: Session, *, id: UUID, user_id: UUID
+    ) -> Optional[Submission]:
+        return self._transition(
+            db,
+            RESUME,
+            {"pk": id, "owner_id": user_id},
+            audit_action=AuditAction.RESUME,
+        )
 
     def submit(
-        self, db: Session, *, db_obj: Submission, score: float
-    ) -> Submission:
-        if db_obj.time_remaining:
-            time_remaining = db_obj.time_remaining - (
-                datetime.now(tz=timezone.utc) - db_obj.updated_at
+        self, db: Session, *, id: UUID, user_id: UUID
+    ) -> Optional[Submission]:
+        """
+        Submit the submission together with its draft attempts, graded with
+        the scoring of the quiz, and announce it through the outbox.
+        """
+        shards.locate(db, self.model, id)
+        attempts = (
+            dict(db.execute(GET_DRAFT_ATTEMPT_QUIZZES, {"pk": id}).all())
+            if drafts.store is not None
+            else {}
+        )
+        with drafts.write_behind(db, attempts):
+            grades = grading.grade_drafts(
+                db, LOCK_DRAFT_ATTEMPTS_BY_SUBMISSION, {"pk": id}
+            )
+            return self._transition(
+                db,
+                SUBMIT,
+                {"pk": id, "owner_id": user_id, **grades},
+                before_commit=lambda db_obj: self.record_submit_no_commit(
+                    db, db_obj=db_obj
+                ),
+                audit_action=AuditAction.SUBMIT,
             )
-        else:
-            time_remaining = None
-        return self.update(
+
+    def record_submit_no_commit(
+        self, db: Session, *, db_obj: Submission
+    ) -> None:
+        """
+        Write the event of the submitted submission to the outbox of its
+        shard, and add its score to the score sketch of its quiz.
+        """
+        outbox.write(
             db,
-            db_obj=db_obj,
-            obj_in={
-                "score": score,
-                "time_remaining": time_remaining,
-                "draft": False,
-            },
+            Topic.SUBMISSION_SUBMITTED,
+            quiz_id=db_obj.quiz_id,
+            user_id=db_obj.user_id,
+            subject_id=db_obj.id,
+            payload={"score": db_obj.score},
         )
+        self.record_score_no_commit(db, db_obj=db_obj)
+
+    def record_score_no_commit(
+        self, db: Session, *, db_obj: Submission
+    ) -> None:
+        """
+        Add the score of the submitted submission to the score sketch of
+        its quiz.
+        """
+        if db_obj.score is None:
+            return
+        shards.use_quiz(db, db_obj.quiz_id)
+        sketch = db.execute(
+            RECORD_SCORE,
+            {
+                "id": uuid7(),
+                "quiz_id": db_obj.quiz_id,
+                "stripe": db_obj.id.int % settings.SCORE_SKETCH_STRIPES,
+                "score": db_obj.score,
+            },
+        ).one()
+        if len(sketch.pending) < settings.SCORE_SKETCH_BUFFER:
+            return
+        # The upsert holds the lock on the row until the commit
+        digest = TDigest.from_bytes(sketch.digest)
+        digest.update(sketch.pending)
+        db.execute(FOLD_SCORES, {"pk": sketch.id, "digest": digest.to_bytes()})
+
+    def get_score_sketch(self, db: Session, *, quiz_id: UUID) -> ScoreSketch:
+        """
+        Merge the stripes of the score sketch of the quiz, which stays as
+        small however many submissions it summarizes.
+        """
+        shards.use_quiz(db, quiz_id)
+        sketch = ScoreSketch()
+        for row in db.execute(GET_SCORE_SKETCHES, {"quiz_id": quiz_id}):
+            digest = TDigest.from_bytes(row.digest)
+            digest.update(row.pending)
+            sketch.merge(
+                ScoreSketch(row.count, row.total, row.total_squares, digest)
+            )
+        return sketch
 
 
 submission = CRUDSubmission(Submission)
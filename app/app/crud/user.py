@@ -4,21 +4,42 @@ from app.core.security import get_password_hash, verify_password
 from app.crud.base import CRUDBase
 from app.models.user import User
 from app.schemas.user import UserCreate, UserUpdate
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
+GET_BY_EMAIL = (
+    select(User)
+    .where(User.email == bindparam("email"), User.deleted_at.is_(None))
+    .limit(1)
+)
+CREATE = (
+    insert(User)
+    .values(
+        email=bindparam("email"),
+        hashed_password=bindparam("hashed_password"),
+    )
+    .on_conflict_do_nothing(index_elements=[User.email])
+    .returning(User)
+)
+
 
 class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
     def get_by_email(self, db: Session, *, email: str) -> Optional[User]:
-        return db.query(User).filter(User.email == email).first()
-
-    def create(self, db: Session, *, obj_in: UserCreate) -> User:
-        db_obj = User(
-            email=obj_in.email,
-            hashed_password=get_password_hash(obj_in.password),
-        )
-        db.add(db_obj)
+        return db.scalars(GET_BY_EMAIL, {"email": email}).first()
+
+    def create(self, db: Session, *, obj_in: UserCreate) -> Optional[User]:
+        """
+        Register a user, or return `None` when the email is already taken.
+        """
+        db_obj = db.scalars(
+            CREATE,
+            {
+                "email": obj_in.email,
+                "hashed_password": get_password_hash(obj_in.password),
+            },
+        ).first()
         db.commit()
-        db.refresh(db_obj)
         return db_obj
 
     def update_password(
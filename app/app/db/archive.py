@@ -0,0 +1,379 @@
+"""
+Archive of the attempts and solutions of old submissions to Parquet files.
+
+Submitted submissions not updated for `ARCHIVE_AFTER_DAYS` move their
+attempts and solutions out of the database, into zstd compressed Parquet
+files under `ARCHIVE_DIR`, partitioned by quiz and by the month the
+submission was created:
+
+    quiz_id=QUIZ_ID/month=YYYY-MM/BATCH.attempts.parquet
+    quiz_id=QUIZ_ID/month=YYYY-MM/BATCH.solutions.parquet
+
+The submission itself stays, with its score, as the stub the endpoints find
+and authorize with, and records its batch in `archive`. A batch holds the
+submissions of one partition archived in the same transaction, up to
+`ARCHIVE_CHUNK_SIZE`, with their rows sorted by submission, so reading back
+one submission from a memory map of the file only decodes the row groups
+whose statistics cover it.
+
+The files of a batch are written and synced before the transaction that
+points its submissions at it and deletes their rows commits, so a crash in
+between leaves unreferenced files at worst, never a stub without its rows.
+`ARCHIVE_DIR` must be shared by every instance of the API. Regrades skip
+archived submissions, which keep their score.
+
+Run as a module, e.g. daily, to archive the old submissions of every shard:
+
+    $ python -m app.db.archive
+"""
+import os
+from argparse import ArgumentParser
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from logging import INFO, basicConfig, getLogger
+from shutil import rmtree
+from typing import Any, Optional, Sequence
+from uuid import UUID
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from app.core.config import settings
+from app.db.base_class import Base, uuid7
+from app.db.session import shards
+from app.models import Attempt, Solution, Submission
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Double,
+    Interval,
+    and_,
+    any_,
+    bindparam,
+    cast,
+    delete,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.engine import Connection, Engine
+
+logger = getLogger(__name__)
+
+ROW_GROUP_SIZE = 10_000
+ARROW_TYPES = [
+    (PG_UUID, pa.binary(16)),
+    (DateTime, pa.timestamp("us", tz="UTC")),
+    (Interval, pa.duration("us")),
+    (Boolean, pa.bool_()),
+    (Double, pa.float64()),
+]
+SUBMISSION_IDS = any_(
+    cast(bindparam("submission_ids"), ARRAY(PG_UUID(as_uuid=True)))
+)
+
+OLD = (
+    ~Submission.draft,
+    Submission.archive.is_(None),
+    Submission.updated_at < bindparam("cutoff"),
+)
+QUIZ_IDS = select(Submission.quiz_id).where(*OLD).distinct()
+# Skips the submissions being changed, such as by a regrade, until the next
+# run
+NEXT_SUBMISSIONS = (
+    select(Submission.id, Submission.created_at)
+    .where(Submission.quiz_id == bindparam("quiz_id"), *OLD)
+    .order_by(Submission.id)
+    .limit(bindparam("chunk_size"))
+    .with_for_update(skip_locked=True)
+)
+# The quiz prunes the partitions of attempts and solutions
+ATTEMPTS = (
+    select(Attempt.__table__)
+    .where(
+        Attempt.submission_id == SUBMISSION_IDS,
+        Attempt.quiz_id == bindparam("quiz_id"),
+    )
+    .order_by(Attempt.submission_id, Attempt.id)
+)
+# Solutions carry the submission of their attempt, to be read back by it
+SOLUTIONS = (
+    select(Attempt.submission_id, Solution.__table__)
+    .join(
+        Attempt,
+        and_(
+            Attempt.id == Solution.attempt_id,
+            Attempt.quiz_id == Solution.quiz_id,
+        ),
+    )
+    .where(
+        Attempt.submission_id == SUBMISSION_IDS,
+        Attempt.quiz_id == bindparam("quiz_id"),
+        Solution.quiz_id == bindparam("quiz_id"),
+    )
+    .order_by(Attempt.submission_id, Solution.attempt_id, Solution.id)
+)
+MARK_ARCHIVED = (
+    update(Submission)
+    .where(Submission.id == SUBMISSION_IDS)
+    .values(archive=bindparam("archive"))
+)
+DELETE_SOLUTIONS = delete(Solution).where(
+    Solution.attempt_id == Attempt.id,
+    Solution.quiz_id == Attempt.quiz_id,
+    Attempt.submission_id == SUBMISSION_IDS,
+    Attempt.quiz_id == bindparam("quiz_id"),
+    Solution.quiz_id == bindparam("quiz_id"),
+)
+DELETE_ATTEMPTS = delete(Attempt).where(
+    Attempt.submission_id == SUBMISSION_IDS,
+    Attempt.quiz_id == bindparam("quiz_id"),
+)
+ARCHIVES_BY_USER = (
+    select(Submission.archive)
+    .where(
+        Submission.user_id == bindparam("user_id"),
+        Submission.archive.is_not(None),
+    )
+    .distinct()
+)
+
+
+def arrow_type(column: Column) -> pa.DataType:
+    for type_, arrow_type in ARROW_TYPES:
+        if isinstance(column.type, type_):
+            return arrow_type
+    raise TypeError(f"Cannot archive {column} of type {column.type}")
+
+
+def arrow_schema(columns: Sequence[Column]) -> pa.Schema:
+    return pa.schema([(column.name, arrow_type(column)) for column in columns])
+
+
+ATTEMPT_SCHEMA = arrow_schema(ATTEMPTS.selected_columns)
+SOLUTION_SCHEMA = arrow_schema(SOLUTIONS.selected_columns)
+
+
+def to_arrow(rows: Sequence[Any], schema: pa.Schema) -> pa.Table:
+    columns = list(zip(*rows)) or [[] for _ in schema]
+    return pa.table(
+        [
+            [None if value is None else value.bytes for value in values]
+            if field.type == pa.binary(16)
+            else values
+            for field, values in zip(schema, columns)
+        ],
+        schema=schema,
+    )
+
+
+def to_python(column: pa.ChunkedArray) -> list[Any]:
+    if column.type == pa.binary(16):
+        return [
+            None if value is None else UUID(bytes=value)
+            for value in column.to_pylist()
+        ]
+    if pa.types.is_timestamp(column.type):
+        # Much faster than converting every value to the time zone
+        return [
+            None if value is None else value.replace(tzinfo=timezone.utc)
+            for value in column.cast(pa.timestamp("us")).to_pylist()
+        ]
+    return column.to_pylist()
+
+
+def from_arrow(table: pa.Table, model: type[Base]) -> list[Base]:
+    """
+    Rebuild the rows of `table` as transient instances of `model`, leaving
+    out the columns it does not have.
+    """
+    names = [name for name in table.column_names if name in model.__table__.c]
+    columns = [to_python(table[name]) for name in names]
+    return [model(**dict(zip(names, row))) for row in zip(*columns)]
+
+
+def directory() -> str:
+    if settings.ARCHIVE_DIR is None:
+        raise RuntimeError("ARCHIVE_DIR is not set")
+    return settings.ARCHIVE_DIR
+
+
+def path(archive: str, kind: str) -> str:
+    return os.path.join(directory(), f"{archive}.{kind}.parquet")
+
+
+def write(table: pa.Table, path: str) -> None:
+    """
+    Write `table` to `path` durably, replacing any file there at once.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    pq.write_table(
+        table,
+        temporary,
+        row_group_size=ROW_GROUP_SIZE,
+        compression="zstd",
+    )
+    with open(temporary, "rb") as file:
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    descriptor = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def read(archive: str, kind: str, submission_id: UUID) -> pa.Table:
+    """
+    Read the rows of the submission from a memory map of the file of the
+    batch, decoding only the row groups whose statistics cover it.
+    """
+    file = pq.ParquetFile(path(archive, kind), memory_map=True)
+    column = file.schema_arrow.get_field_index("submission_id")
+    key = submission_id.bytes
+    row_groups = []
+    for index in range(file.num_row_groups):
+        statistics = file.metadata.row_group(index).column(column).statistics
+        if (
+            statistics is None
+            or not statistics.has_min_max
+            or statistics.min <= key <= statistics.max
+        ):
+            row_groups.append(index)
+    table = file.read_row_groups(row_groups)
+    return table.filter(pc.equal(table["submission_id"], key))
+
+
+def read_attempts(
+    archive: str, submission_id: UUID, skip: int = 0, limit: int = 100
+) -> list[Attempt]:
+    table = read(archive, "attempts", submission_id)
+    return from_arrow(table.slice(skip, limit), Attempt)
+
+
+def read_solutions(
+    archive: str, submission_id: UUID, skip: int = 0, limit: int = 100
+) -> list[Solution]:
+    table = read(archive, "solutions", submission_id)
+    return from_arrow(table.slice(skip, limit), Solution)
+
+
+def archive_chunk(
+    connection: Connection, quiz_id: UUID, cutoff: datetime, chunk_size: int
+) -> int:
+    """
+    Archive the next chunk of old submissions of the quiz in one batch per
+    month, and return how many there were.
+    """
+    submissions = connection.execute(
+        NEXT_SUBMISSIONS,
+        {"quiz_id": quiz_id, "cutoff": cutoff, "chunk_size": chunk_size},
+    ).all()
+    if not submissions:
+        return 0
+    months = {
+        submission.id: submission.created_at.astimezone(timezone.utc).strftime(
+            "%Y-%m"
+        )
+        for submission in submissions
+    }
+    params = {"submission_ids": list(months), "quiz_id": quiz_id}
+    batches: dict[str, list[UUID]] = defaultdict(list)
+    for submission_id, month in months.items():
+        batches[month].append(submission_id)
+    attempts: dict[str, list[Any]] = defaultdict(list)
+    for row in connection.execute(ATTEMPTS, params):
+        attempts[months[row.submission_id]].append(row)
+    solutions: dict[str, list[Any]] = defaultdict(list)
+    for row in connection.execute(SOLUTIONS, params):
+        solutions[months[row.submission_id]].append(row)
+    for month, submission_ids in batches.items():
+        archive = f"quiz_id={quiz_id}/month={month}/{uuid7()}"
+        write(
+            to_arrow(attempts[month], ATTEMPT_SCHEMA),
+            path(archive, "attempts"),
+        )
+        write(
+            to_arrow(solutions[month], SOLUTION_SCHEMA),
+            path(archive, "solutions"),
+        )
+        connection.execute(
+            MARK_ARCHIVED,
+            {"submission_ids": submission_ids, "archive": archive},
+        )
+    connection.execute(DELETE_SOLUTIONS, params)
+    connection.execute(DELETE_ATTEMPTS, params)
+    return len(submissions)
+
+
+def archive_shard(
+    bind: Engine, cutoff: datetime, chunk_size: int
+) -> dict[UUID, int]:
+    with bind.connect() as connection:
+        quiz_ids = connection.scalars(QUIZ_IDS, {"cutoff": cutoff}).all()
+    archived = {}
+    for quiz_id in quiz_ids:
+        archived[quiz_id] = 0
+        while True:
+            with bind.begin() as connection:
+                count = archive_chunk(connection, quiz_id, cutoff, chunk_size)
+            archived[quiz_id] += count
+            if count < chunk_size:
+                break
+        logger.info(
+            "Archived %d submissions of quiz %s" % (archived[quiz_id], quiz_id)
+        )
+    return archived
+
+
+def archive_old(
+    days: Optional[int] = None, chunk_size: Optional[int] = None
+) -> dict[UUID, int]:
+    """
+    Archive the submissions of every shard not updated for `days`, and
+    return how many of every quiz were.
+    """
+    directory()
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    chunk_size = chunk_size or settings.ARCHIVE_CHUNK_SIZE
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    archived = {}
+    for bind in shards.engines.values():
+        archived.update(archive_shard(bind, cutoff, chunk_size))
+    return archived
+
+
+def remove_quiz(quiz_id: UUID) -> None:
+    if settings.ARCHIVE_DIR is not None:
+        rmtree(
+            os.path.join(settings.ARCHIVE_DIR, f"quiz_id={quiz_id}"),
+            ignore_errors=True,
+        )
+
+
+def remove_user(bind: Engine, user_id: UUID) -> None:
+    """
+    Rewrite the batches on the shard that hold archived rows of the user
+    without them. Must run before the stubs of the user are deleted.
+    """
+    with bind.connect() as connection:
+        archives = connection.scalars(
+            ARCHIVES_BY_USER, {"user_id": user_id}
+        ).all()
+    for archive in archives:
+        for kind in ("attempts", "solutions"):
+            table = pq.read_table(path(archive, kind))
+            keep = pc.not_equal(table["user_id"], user_id.bytes)
+            write(table.filter(keep), path(archive, kind))
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = ArgumentParser(prog="python -m app.db.archive")
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--chunk-size", type=int)
+    args = parser.parse_args()
+    archive_old(args.days, args.chunk_size)
@@ -0,0 +1,215 @@
+"""
+Append-only log of what candidates do, to settle disputes.
+
+The CRUD layer records an event for each state transition of a submission
+(draft, pause, resume, submit), an attempt (skip, resume, submit) and a
+solution (add, delete) once it has committed. Recording only puts the event
+on an in-process queue of `AUDIT_QUEUE_SIZE` events, so the request
+transaction writes nothing more. A background task writes the queue to
+`audit_events` on the shard of each quiz every `AUDIT_FLUSH_SECONDS`, with
+one `COPY` of up to `AUDIT_BATCH_SIZE` events per shard and transaction, and
+on shutdown.
+
+When the queue is full, `AUDIT_OVERFLOW` decides:
+
+* `drop` (default) drops the event at once, so a slow database never slows
+  down requests.
+* `block` hands the event to a thread that waits up to
+  `AUDIT_BLOCK_SECONDS` for the queue to drain before dropping it. Requests
+  run on the event loop, so they never wait themselves; at most
+  `AUDIT_QUEUE_SIZE` events wait in the thread, and those beyond are
+  dropped at once.
+
+Events dropped either way, or in a batch that failed to write, are counted
+by the `quizar_audit_events_dropped` metric. Events still queued when the
+process dies are lost.
+"""
+from asyncio import sleep, to_thread
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from enum import Enum
+from io import StringIO
+from logging import getLogger
+from queue import Empty, Full, Queue
+from threading import BoundedSemaphore
+from typing import Any, Iterable, NamedTuple, Optional
+from uuid import UUID
+
+from app.core.config import settings
+from app.core.metrics import AUDIT_EVENTS_DROPPED
+from app.db.base_class import uuid7
+from app.db.session import shards
+from app.models import AuditEvent
+from sqlalchemy.engine import Connection
+
+logger = getLogger(__name__)
+
+
+class AuditAction(str, Enum):
+    DRAFT = "submission.draft"
+    PAUSE = "submission.pause"
+    RESUME = "submission.resume"
+    SUBMIT = "submission.submit"
+    SKIP_ATTEMPT = "attempt.skip"
+    RESUME_ATTEMPT = "attempt.resume"
+    SUBMIT_ATTEMPT = "attempt.submit"
+    ADD_SOLUTION = "solution.add"
+    DELETE_SOLUTION = "solution.delete"
+
+    @property
+    def subject(self) -> str:
+        """
+        The column the id of the row acted on goes to.
+        """
+        return f"{self.value.split('.')[0]}_id"
+
+
+class Event(NamedTuple):
+    id: UUID
+    created_at: datetime
+    action: str
+    quiz_id: UUID
+    user_id: UUID
+    submission_id: Optional[UUID]
+    attempt_id: Optional[UUID]
+    solution_id: Optional[UUID]
+    answer_id: Optional[UUID]
+
+
+REFERENCES = ("submission_id", "attempt_id", "solution_id", "answer_id")
+COPY_EVENTS = (
+    f"COPY {AuditEvent.__tablename__} (id, created_at, updated_at, action, "
+    "quiz_id, user_id, submission_id, attempt_id, solution_id, answer_id) "
+    "FROM STDIN"
+)
+
+queue: Queue[Event] = Queue(settings.AUDIT_QUEUE_SIZE)
+# One thread keeps the events waiting for room in the order they came
+overflow = ThreadPoolExecutor(1, thread_name_prefix="audit-overflow")
+waiting = BoundedSemaphore(settings.AUDIT_QUEUE_SIZE)
+
+
+def put_blocking(event: Event) -> None:
+    try:
+        queue.put(event, timeout=settings.AUDIT_BLOCK_SECONDS)
+    except Full:
+        AUDIT_EVENTS_DROPPED.labels("full").inc()
+    finally:
+        waiting.release()
+
+
+def record(action: AuditAction, rows: Iterable[Any]) -> None:
+    """
+    Queue an event of `action` for every row, a submission, attempt or
+    solution, or a row of their columns.
+    """
+    created_at = datetime.now(timezone.utc)
+    for row in rows:
+        references = {
+            column: getattr(row, column, None) for column in REFERENCES
+        }
+        references[action.subject] = row.id
+        event = Event(
+            id=uuid7(),
+            created_at=created_at,
+            action=action.value,
+            quiz_id=row.quiz_id,
+            user_id=row.user_id,
+            **references,
+        )
+        try:
+            queue.put_nowait(event)
+        except Full:
+            if settings.AUDIT_OVERFLOW == "block" and waiting.acquire(False):
+                overflow.submit(put_blocking, event)
+            else:
+                AUDIT_EVENTS_DROPPED.labels("full").inc()
+
+
+def encode(event: Event) -> str:
+    created_at = event.created_at.isoformat()
+    values = [
+        event.id,
+        created_at,
+        created_at,
+        event.action,
+        event.quiz_id,
+        event.user_id,
+        *(getattr(event, column) for column in REFERENCES),
+    ]
+    return (
+        "\t".join(r"\N" if value is None else str(value) for value in values)
+        + "\n"
+    )
+
+
+def copy(connection: Connection, buffer: StringIO) -> None:
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(COPY_EVENTS, buffer)
+    else:
+        # psycopg 3
+        with cursor.copy(COPY_EVENTS) as copying:
+            copying.write(buffer.getvalue())
+    cursor.close()
+
+
+def take(limit: int) -> list[Event]:
+    events = []
+    while len(events) < limit:
+        try:
+            events.append(queue.get_nowait())
+        except Empty:
+            break
+    return events
+
+
+def flush(batch_size: Optional[int] = None) -> int:
+    """
+    Write the queued events to the shards of their quizzes, `batch_size`
+    at a time, and return how many were written.
+    """
+    batch_size = batch_size or settings.AUDIT_BATCH_SIZE
+    written = 0
+    while True:
+        events = take(batch_size)
+        buffers: dict[str, StringIO] = defaultdict(StringIO)
+        counts: dict[str, int] = defaultdict(int)
+        for event in events:
+            name = shards.shard_for(event.quiz_id)
+            buffers[name].write(encode(event))
+            counts[name] += 1
+        for name, buffer in buffers.items():
+            try:
+                with shards.engines[name].begin() as connection:
+                    copy(connection, buffer)
+            except Exception:
+                logger.exception(
+                    "Dropped %d audit events for shard %s"
+                    % (counts[name], name)
+                )
+                AUDIT_EVENTS_DROPPED.labels("failed").inc(counts[name])
+            else:
+                written += counts[name]
+        if len(events) < batch_size:
+            return written
+
+
+def close() -> None:
+    """
+    Flush the queue on shutdown, with the events that waited for room in it.
+    """
+    flush()
+    overflow.shutdown()
+    flush()
+
+
+async def flush_periodically() -> None:
+    while True:
+        await sleep(settings.AUDIT_FLUSH_SECONDS)
+        try:
+            await to_thread(flush)
+        except Exception:
+            logger.exception("Audit flush failed")
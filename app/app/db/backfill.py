@@ -0,0 +1,122 @@
+"""
+Backfill of denormalized columns for rows created before they existed.
+
+`Attempt.quiz_id`/`user_id` are copied from the submission,
+`Solution.quiz_id`/`user_id` from the attempt, and `Answer.is_correct` is
+derived from the sign of the point answers used to encode it with,
+`BACKFILL_CHUNK_SIZE` rows per transaction, on every shard. Rows that are
+already filled are skipped, so it is safe to run on every start. Databases
+older than the boolean `Submission.draft` have it converted from the string
+it was, a type change autogenerate does not compare:
+
+    $ python -m app.db.backfill
+"""
+from logging import INFO, basicConfig, getLogger
+from typing import Optional
+
+from app.core.config import settings
+from app.db.session import shards
+from app.models import Answer, Attempt, Solution, Submission
+from sqlalchemy import bindparam, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Update
+
+logger = getLogger(__name__)
+
+BACKFILL_ATTEMPTS = (
+    update(Attempt)
+    .where(
+        Attempt.submission_id == Submission.id,
+        Attempt.id.in_(
+            # Submissions without a quiz would leave their attempts
+            # unfilled, matching every chunk again
+            select(Attempt.id)
+            .join(Submission, Attempt.submission_id == Submission.id)
+            .where(Attempt.quiz_id.is_(None), Submission.quiz_id.is_not(None))
+            .limit(bindparam("chunk_size"))
+            .correlate(None)
+            .scalar_subquery()
+        ),
+    )
+    .values(quiz_id=Submission.quiz_id, user_id=Submission.user_id)
+)
+FILLED_ATTEMPT = (
+    select(Solution.id)
+    .join(Attempt, Solution.attempt_id == Attempt.id)
+    .where(Solution.quiz_id.is_(None), Attempt.quiz_id.is_not(None))
+)
+BACKFILL_SOLUTIONS = (
+    update(Solution)
+    .where(
+        Solution.attempt_id == Attempt.id,
+        Solution.id.in_(
+            FILLED_ATTEMPT.limit(bindparam("chunk_size"))
+            .correlate(None)
+            .scalar_subquery()
+        ),
+    )
+    .values(quiz_id=Attempt.quiz_id, user_id=Attempt.user_id)
+)
+BACKFILL_ANSWERS = (
+    update(Answer)
+    .where(
+        Answer.id.in_(
+            select(Answer.id)
+            .where(Answer.is_correct.is_(None))
+            .limit(bindparam("chunk_size"))
+            .correlate(None)
+            .scalar_subquery()
+        )
+    )
+    .values(is_correct=Answer.point > 0)
+)
+
+DRAFT_TYPE = text(
+    "SELECT data_type FROM information_schema.columns "
+    "WHERE table_schema = current_schema() "
+    "AND table_name = 'submissions' AND column_name = 'draft'"
+)
+CONVERT_DRAFT = text(
+    "ALTER TABLE submissions ALTER COLUMN draft TYPE boolean "
+    "USING draft::boolean"
+)
+
+
+def convert_draft(bind: Engine) -> bool:
+    with bind.begin() as connection:
+        if connection.scalar(DRAFT_TYPE) in (None, "boolean"):
+            return False
+        connection.execute(CONVERT_DRAFT)
+    logger.info("Converted submissions.draft to boolean")
+    return True
+
+
+def update_in_chunks(bind: Engine, statement: Update, chunk_size: int) -> int:
+    total = 0
+    while True:
+        with bind.begin() as connection:
+            updated = connection.execute(
+                statement, {"chunk_size": chunk_size}
+            ).rowcount
+        total += updated
+        if updated < chunk_size:
+            return total
+
+
+def backfill(chunk_size: Optional[int] = None) -> None:
+    chunk_size = chunk_size or settings.BACKFILL_CHUNK_SIZE
+    attempts = solutions = answers = 0
+    for bind in shards.engines.values():
+        convert_draft(bind)
+        attempts += update_in_chunks(bind, BACKFILL_ATTEMPTS, chunk_size)
+        solutions += update_in_chunks(bind, BACKFILL_SOLUTIONS, chunk_size)
+        answers += update_in_chunks(bind, BACKFILL_ANSWERS, chunk_size)
+    logger.info(
+        "Backfilled %d attempts, %d solutions and %d answers"
+        % (attempts, solutions, answers)
+    )
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    backfill()
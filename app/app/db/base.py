@@ -3,8 +3,14 @@
 from app.db.base_class import Base  # noqa: F401
 from app.models.answer import Answer  # noqa: F401
 from app.models.attempt import Attempt  # noqa: F401
+from app.models.audit_event import AuditEvent  # noqa: F401
+from app.models.collusion_flag import CollusionFlag  # noqa: F401
+from app.models.outbox_event import OutboxEvent  # noqa: F401
 from app.models.question import Question  # noqa: F401
 from app.models.quiz import Quiz  # noqa: F401
+from app.models.quiz_regrade import QuizRegrade  # noqa: F401
+from app.models.quiz_score_sketch import QuizScoreSketch  # noqa: F401
 from app.models.solution import Solution  # noqa: F401
 from app.models.submission import Submission  # noqa: F401
+from app.models.submission_counter import SubmissionCounter  # noqa: F401
 from app.models.user import User  # noqa: F401
@@ -1,16 +1,46 @@
-from uuid import uuid4
+from os import urandom
+from threading import Lock
+from time import time_ns
+from uuid import UUID as PyUUID
 
 from sqlalchemy import Column, DateTime
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import as_declarative
 from sqlalchemy.sql.functions import now
 
+_uuid7_lock = Lock()
+_uuid7_last = 0
+
+
+def uuid7() -> PyUUID:
+    """
+    Time-ordered UUID (RFC 9562 version 7).
+
+    The leading 48 bits are the unix time in milliseconds, so ids generated
+    close together land on the same right-most pages of the primary key
+    index instead of random leaf pages. Ids generated within the same
+    millisecond are kept increasing so they are appended in order too.
+    """
+    global _uuid7_last
+    timestamp_ms = time_ns() // 1_000_000
+    random_bits = int.from_bytes(urandom(10), "big")
+    value = (
+        (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | (random_bits >> 62 & 0xFFF) << 64
+        | 0b10 << 62
+        | random_bits & 0x3FFF_FFFF_FFFF_FFFF
+    )
+    with _uuid7_lock:
+        if value <= _uuid7_last:
+            value = _uuid7_last + 1
+        _uuid7_last = value
+    return PyUUID(int=value)
+
 
 @as_declarative()
 class Base:
-    id = Column(
-        UUID(as_uuid=True), primary_key=True, index=True, default=uuid4
-    )
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     created_at = Column(
         DateTime(timezone=True), index=True, server_default=now()
     )
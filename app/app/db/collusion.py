@@ -0,0 +1,363 @@
+"""
+Offline detection of submissions of a quiz with suspiciously similar answers.
+
+Comparing every pair of submissions is quadratic, so the analysis:
+
+1. encodes the answers every submitted submission chose as a bitset over
+   the answers of the quiz, and merges identical bitsets into one pattern;
+2. signs every pattern with `BANDS * ROWS` MinHashes and buckets the
+   patterns by each band of `ROWS` of them. Patterns with a Jaccard
+   similarity `s` share a bucket in some band with probability
+   `1 - (1 - s ** ROWS) ** BANDS`, over 99.9% from `s = 0.8`;
+3. verifies the pairs of patterns that share a bucket with the exact
+   Jaccard similarity of their bitsets, in bulk;
+4. replaces the `collusion_flags` of the quiz, through `COPY`, with the
+   pairs of submissions at or above `--threshold` that also share
+   `--min-shared-incorrect` incorrect answers.
+
+Strong candidates are expected to choose the same correct answers; sharing
+the same mistakes is what copying leaves behind. A pattern shared by more
+than `MAX_GROUP` submissions is a common misconception rather than
+collusion, and is left out. The bands are split between `--jobs` worker
+processes for quizzes with at least `PARALLEL_PATTERNS` patterns:
+
+    $ python -m app.db.collusion --jobs 4
+    $ python -m app.db.collusion --quiz QUIZ_ID
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from logging import INFO, basicConfig, getLogger
+from multiprocessing import get_context
+from typing import Any, Optional
+from uuid import UUID
+
+import numpy as np
+from app.db.base_class import uuid7
+from app.db.session import shards
+from app.models import (
+    Answer,
+    Attempt,
+    CollusionFlag,
+    Question,
+    Solution,
+    Submission,
+)
+from sqlalchemy import and_, bindparam, delete, select
+from sqlalchemy.engine import Connection, Engine
+
+logger = getLogger(__name__)
+
+BANDS = 16
+ROWS = 4
+THRESHOLD = 0.8
+MIN_SHARED_INCORRECT = 2
+MAX_GROUP = 50
+# Buckets larger than this are mostly chance collisions of common patterns
+MAX_BUCKET = 1000
+PARALLEL_PATTERNS = 10_000
+CHUNK_SIZE = 10_000
+# Number of set bits of every byte
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], np.uint8)
+
+ANSWERS = (
+    select(Answer.id, Answer.is_correct)
+    .join(Question, Question.id == Answer.question_id)
+    .where(Question.quiz_id == bindparam("quiz_id"))
+    .order_by(Answer.id)
+)
+SELECTIONS = (
+    select(Attempt.submission_id, Solution.answer_id)
+    .join(
+        Attempt,
+        and_(
+            Attempt.id == Solution.attempt_id,
+            Attempt.quiz_id == Solution.quiz_id,
+        ),
+    )
+    .join(Submission, Submission.id == Attempt.submission_id)
+    .where(
+        Solution.quiz_id == bindparam("quiz_id"),
+        Attempt.quiz_id == bindparam("quiz_id"),
+        ~Submission.draft,
+    )
+)
+QUIZ_IDS = select(Submission.quiz_id).where(~Submission.draft).distinct()
+DELETE_FLAGS = delete(CollusionFlag).where(
+    CollusionFlag.quiz_id == bindparam("quiz_id")
+)
+# Flags can be many, so they are written with `COPY`
+COPY_FLAGS = (
+    f"COPY {CollusionFlag.__tablename__} (id, quiz_id, submission_id, "
+    "other_submission_id, similarity, shared_incorrect) FROM STDIN"
+)
+
+# What the worker processes share, inherited through the fork
+state: dict[str, Any] = {}
+
+
+def load(
+    connection: Connection, quiz_id: UUID
+) -> tuple[list[UUID], np.ndarray, np.ndarray]:
+    """
+    Return the submitted submissions of the quiz that chose any answer,
+    their selection matrix of submissions by answers, and which answers are
+    incorrect.
+    """
+    answers = connection.execute(ANSWERS, {"quiz_id": quiz_id}).all()
+    columns = {answer.id: column for column, answer in enumerate(answers)}
+    rows: dict[UUID, int] = {}
+    indexes = []
+    result = connection.execution_options(yield_per=CHUNK_SIZE).execute(
+        SELECTIONS, {"quiz_id": quiz_id}
+    )
+    for submission_id, answer_id in result:
+        row = rows.setdefault(submission_id, len(rows))
+        indexes.append((row, columns[answer_id]))
+    selection = np.zeros((len(rows), len(answers)), dtype=bool)
+    index = np.array(indexes, dtype=np.intp).reshape(-1, 2)
+    selection[index[:, 0], index[:, 1]] = True
+    incorrect = np.array([not answer.is_correct for answer in answers])
+    return list(rows), selection, incorrect
+
+
+def sign(chosen: np.ndarray, generator: np.random.Generator) -> np.ndarray:
+    """
+    MinHash signatures of the rows of `chosen`: per random permutation of
+    the answers, the lowest rank among the chosen ones.
+    """
+    answers = chosen.shape[1]
+    signatures = np.empty((len(chosen), BANDS * ROWS), dtype=np.int32)
+    for column in range(BANDS * ROWS):
+        ranks = generator.permutation(answers)
+        signatures[:, column] = np.where(chosen, ranks, answers).min(axis=1)
+    return signatures
+
+
+def candidates(signatures: np.ndarray, band: int) -> np.ndarray:
+    """
+    The pairs of patterns `i < j` whose signatures agree on every hash of
+    the band, as `i * len(signatures) + j`, which is cheaper to deduplicate
+    than rows of pairs.
+    """
+    hashes = slice(band * ROWS, (band + 1) * ROWS)
+    _, buckets = np.unique(signatures[:, hashes], axis=0, return_inverse=True)
+    buckets = buckets.reshape(-1)
+    order = np.argsort(buckets, kind="stable")
+    counts = np.bincount(buckets)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    pairs = [np.empty(0, dtype=np.int64)]
+    for bucket in np.flatnonzero((counts > 1) & (counts <= MAX_BUCKET)):
+        start = starts[bucket]
+        end = start + counts[bucket]
+        members = np.sort(order[start:end]).astype(np.int64)
+        first, second = np.triu_indices(len(members), 1)
+        pairs.append(members[first] * len(signatures) + members[second])
+    return np.concatenate(pairs)
+
+
+def verify(
+    bits: np.ndarray,
+    incorrect: np.ndarray,
+    pairs: np.ndarray,
+    threshold: float,
+    min_shared_incorrect: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Keep the `pairs` of packed bitsets whose Jaccard similarity and shared
+    incorrect answers reach the limits, with both.
+    """
+    kept, similarities, shared = [], [], []
+    for start in range(0, len(pairs), CHUNK_SIZE):
+        end = start + CHUNK_SIZE
+        chunk = pairs[start:end]
+        first, second = bits[chunk[:, 0]], bits[chunk[:, 1]]
+        both = first & second
+        union = POPCOUNT[first | second].sum(axis=1, dtype=np.int64)
+        similarity = POPCOUNT[both].sum(axis=1, dtype=np.int64) / union
+        mistakes = POPCOUNT[both & incorrect].sum(axis=1, dtype=np.int64)
+        keep = (similarity >= threshold) & (mistakes >= min_shared_incorrect)
+        kept.append(chunk[keep])
+        similarities.append(similarity[keep])
+        shared.append(mistakes[keep])
+    if not kept:
+        return np.empty((0, 2), dtype=np.intp), np.empty(0), np.empty(0)
+    return (
+        np.concatenate(kept),
+        np.concatenate(similarities),
+        np.concatenate(shared),
+    )
+
+
+def flag_bands(bands: list[int]) -> tuple[np.ndarray, ...]:
+    signatures = state["signatures"]
+    pairs = np.unique(
+        np.concatenate([candidates(signatures, band) for band in bands])
+    )
+    pairs = np.stack(np.divmod(pairs, len(signatures)), axis=1)
+    return verify(
+        state["bits"],
+        state["incorrect"],
+        pairs,
+        state["threshold"],
+        state["min_shared_incorrect"],
+    )
+
+
+def copy(connection: Connection, buffer: StringIO) -> None:
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(COPY_FLAGS, buffer)
+    else:
+        # psycopg 3
+        with cursor.copy(COPY_FLAGS) as copying:
+            copying.write(buffer.getvalue())
+    cursor.close()
+
+
+def save(bind: Engine, quiz_id: UUID, buffer: StringIO) -> None:
+    """
+    Replace the collusion flags of the quiz with the rows of `buffer`.
+    """
+    with bind.begin() as connection:
+        connection.execute(DELETE_FLAGS, {"quiz_id": quiz_id})
+        copy(connection, buffer)
+
+
+def similar_patterns(jobs: int) -> tuple[np.ndarray, ...]:
+    """
+    Find the similar pairs of the patterns in `state`, splitting the bands
+    between `jobs` processes.
+    """
+    jobs = min(jobs, BANDS)
+    tasks = [list(range(BANDS))[job::jobs] for job in range(jobs)]
+    if jobs <= 1:
+        results = [flag_bands(bands) for bands in tasks]
+    else:
+        # The workers inherit `state` through the fork
+        with ProcessPoolExecutor(jobs, mp_context=get_context("fork")) as pool:
+            results = list(pool.map(flag_bands, tasks))
+    pairs = np.concatenate([result[0] for result in results])
+    _, first = np.unique(
+        pairs[:, 0] * len(state["signatures"]) + pairs[:, 1],
+        return_index=True,
+    )
+    similarities = np.concatenate([result[1] for result in results])
+    shared = np.concatenate([result[2] for result in results])
+    return pairs[first], similarities[first], shared[first]
+
+
+def analyze(
+    quiz_id: UUID,
+    jobs: int = 1,
+    threshold: float = THRESHOLD,
+    min_shared_incorrect: int = MIN_SHARED_INCORRECT,
+) -> int:
+    """
+    Replace the collusion flags of the quiz and return how many there are.
+    """
+    bind = shards.engine_for(quiz_id)
+    with bind.connect() as connection:
+        submission_ids, selection, incorrect = load(connection, quiz_id)
+    # Without submissions or answers there is nothing to compare, but flags
+    # of submissions since deleted are still cleared
+    if not selection.size:
+        save(bind, quiz_id, StringIO())
+        return 0
+    bits, patterns, counts = np.unique(
+        np.packbits(selection, axis=1),
+        axis=0,
+        return_inverse=True,
+        return_counts=True,
+    )
+    patterns = patterns.reshape(-1)
+    members = np.split(
+        np.argsort(patterns, kind="stable"), np.cumsum(counts)[:-1]
+    )
+    # Common patterns are left out altogether
+    kept = np.flatnonzero(counts <= MAX_GROUP)
+    if not len(kept):
+        save(bind, quiz_id, StringIO())
+        return 0
+    incorrect_bits = np.packbits(incorrect)
+    chosen = np.unpackbits(bits[kept], axis=1, count=len(incorrect))
+    state.clear()
+    state.update(
+        signatures=sign(
+            chosen.astype(bool), np.random.default_rng(quiz_id.int)
+        ),
+        bits=bits[kept],
+        incorrect=incorrect_bits,
+        threshold=threshold,
+        min_shared_incorrect=min_shared_incorrect,
+    )
+    pairs, similarities, shared = similar_patterns(
+        jobs if len(kept) >= PARALLEL_PATTERNS else 1
+    )
+    flags = []
+    # Submissions with the same pattern are identical
+    mistakes = POPCOUNT[bits[kept] & incorrect_bits].sum(axis=1)
+    for pattern in np.flatnonzero(
+        (counts[kept] > 1) & (mistakes >= min_shared_incorrect)
+    ):
+        group = members[kept[pattern]]
+        first, second = np.triu_indices(len(group), 1)
+        flags.extend(
+            (row, other, 1.0, mistakes[pattern])
+            for row, other in zip(group[first], group[second])
+        )
+    for (pattern, other_pattern), similarity, mistake in zip(
+        pairs, similarities, shared
+    ):
+        flags.extend(
+            (row, other, similarity, mistake)
+            for row in members[kept[pattern]]
+            for other in members[kept[other_pattern]]
+        )
+    names = [str(submission_id) for submission_id in submission_ids]
+    buffer = StringIO()
+    for row, other, similarity, mistake in flags:
+        # Ordering the text of the ids orders the ids
+        first, second = sorted((names[row], names[other]))
+        buffer.write(
+            f"{uuid7()}\t{quiz_id}\t{first}\t{second}\t"
+            f"{float(similarity)!r}\t{int(mistake)}\n"
+        )
+    save(bind, quiz_id, buffer)
+    logger.info(
+        "Flagged %d pairs of %d submissions (%d patterns) of quiz %s"
+        % (len(flags), len(submission_ids), len(counts), quiz_id)
+    )
+    return len(flags)
+
+
+def detect(
+    quiz_ids: Optional[list[UUID]] = None,
+    jobs: int = 1,
+    threshold: float = THRESHOLD,
+    min_shared_incorrect: int = MIN_SHARED_INCORRECT,
+) -> None:
+    """
+    Analyze `quiz_ids`, or every quiz with submitted submissions.
+    """
+    if quiz_ids is None:
+        quiz_ids = []
+        for bind in shards.engines.values():
+            with bind.connect() as connection:
+                quiz_ids.extend(connection.scalars(QUIZ_IDS))
+    for quiz_id in quiz_ids:
+        analyze(quiz_id, jobs, threshold, min_shared_incorrect)
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = ArgumentParser(prog="python -m app.db.collusion")
+    parser.add_argument("--quiz", type=UUID, action="append", dest="quizzes")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument(
+        "--min-shared-incorrect", type=int, default=MIN_SHARED_INCORRECT
+    )
+    args = parser.parse_args()
+    detect(args.quizzes, args.jobs, args.threshold, args.min_shared_incorrect)
@@ -0,0 +1,365 @@
+"""
+Write-behind store for solutions.
+
+Choosing and unchoosing answers is most of the writes of a live exam, while
+grading only needs the final selection. With `DRAFT_STORE_URL` set,
+solutions are added to and deleted from the draft store instead of
+`solutions`, and the pending changes are written in bulk every
+`DRAFT_CHECKPOINT_SECONDS` and when an attempt or submission is submitted,
+in the transaction that scores it.
+
+* `memory://` keeps the changes in the worker process. It only suits a
+  single worker, loses the changes made since the last checkpoint if the
+  process dies, and is the stand-in used by local runs and scripts.
+* `redis://` (or `rediss://`, `unix://`) shares them between workers and
+  nodes.
+"""
+from abc import ABC, abstractmethod
+from asyncio import sleep, to_thread
+from contextlib import contextmanager
+from datetime import datetime
+from json import dumps, loads
+from logging import getLogger
+from threading import Lock
+from typing import Iterable, Iterator, Optional, Union
+from uuid import UUID
+
+from app.core.config import settings
+from app.db.session import shards
+from app.db.shards import DEFAULT_SHARD
+from app.models import Answer, Attempt, Solution
+from redis import Redis
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+logger = getLogger(__name__)
+
+# A pending change is the encoded solution, or `DELETED` for a solution
+# that is deleted while it may already have been written.
+DELETED = ""
+UUID_COLUMNS = ("id", "attempt_id", "answer_id", "quiz_id", "user_id")
+DATETIME_COLUMNS = ("created_at", "updated_at")
+COLUMNS = (*UUID_COLUMNS, "point", *DATETIME_COLUMNS)
+
+# Writes are per quiz, so that they prune the partitions of attempts and
+# solutions to its own
+EXISTING_ATTEMPTS = select(Attempt.id).where(
+    Attempt.quiz_id == bindparam("quiz_id"),
+    Attempt.id.in_(bindparam("ids", expanding=True)),
+)
+EXISTING_ANSWERS = select(Answer.id).where(
+    Answer.id.in_(bindparam("ids", expanding=True))
+)
+WRITE_DELETED = delete(Solution.__table__).where(
+    Solution.__table__.c.quiz_id == bindparam("quiz_id"),
+    Solution.__table__.c.id.in_(bindparam("ids", expanding=True)),
+)
+# Only the checkpoint, which does not know the quizzes of the attempts,
+# looks them up in every partition
+QUIZZES_OF_ATTEMPTS = select(Attempt.id, Attempt.quiz_id).where(
+    Attempt.id.in_(bindparam("ids", expanding=True))
+)
+WRITE_ADDED = insert(Solution.__table__).on_conflict_do_nothing()
+
+
+def encode(solution: Solution) -> str:
+    return dumps(
+        {column: getattr(solution, column) for column in COLUMNS},
+        default=str,
+    )
+
+
+def decode(value: str) -> Optional[Solution]:
+    if value == DELETED:
+        return None
+    data = loads(value)
+    for column in UUID_COLUMNS:
+        data[column] = UUID(data[column])
+    for column in DATETIME_COLUMNS:
+        data[column] = datetime.fromisoformat(data[column])
+    return Solution(**data)
+
+
+class DraftStore(ABC):
+    """
+    Pending solution changes, keyed by attempt and solution id.
+    """
+
+    @abstractmethod
+    def put(self, attempt_id: UUID, id: UUID, value: str) -> None:
+        ...
+
+    @abstractmethod
+    def lookup(self, id: UUID) -> Optional[str]:
+        """
+        Return the pending change of the solution, or `None` when it has
+        none.
+        """
+
+    @abstractmethod
+    def changes(self, attempt_id: UUID) -> dict[UUID, str]:
+        ...
+
+    @abstractmethod
+    def attempts(self) -> list[UUID]:
+        """
+        Return the attempts with pending changes.
+        """
+
+    @abstractmethod
+    def trim(self, attempt_id: UUID, written: dict[UUID, str]) -> None:
+        """
+        Forget the written changes, except those changed again since they
+        were read.
+        """
+
+    def add(self, solution: Solution) -> None:
+        self.put(solution.attempt_id, solution.id, encode(solution))
+
+    def discard(self, solution: Solution) -> None:
+        self.put(solution.attempt_id, solution.id, DELETED)
+
+
+class MemoryDraftStore(DraftStore):
+    def __init__(self) -> None:
+        self._changes: dict[UUID, dict[UUID, str]] = {}
+        self._attempt_ids: dict[UUID, UUID] = {}
+        self._lock = Lock()
+
+    def put(self, attempt_id: UUID, id: UUID, value: str) -> None:
+        with self._lock:
+            self._changes.setdefault(attempt_id, {})[id] = value
+            self._attempt_ids[id] = attempt_id
+
+    def lookup(self, id: UUID) -> Optional[str]:
+        with self._lock:
+            attempt_id = self._attempt_ids.get(id)
+            if attempt_id is None:
+                return None
+            return self._changes[attempt_id][id]
+
+    def changes(self, attempt_id: UUID) -> dict[UUID, str]:
+        with self._lock:
+            return dict(self._changes.get(attempt_id, {}))
+
+    def attempts(self) -> list[UUID]:
+        with self._lock:
+            return list(self._changes)
+
+    def trim(self, attempt_id: UUID, written: dict[UUID, str]) -> None:
+        with self._lock:
+            changes = self._changes.get(attempt_id, {})
+            for id, value in written.items():
+                if changes.get(id) == value:
+                    del changes[id]
+                    del self._attempt_ids[id]
+            if not changes:
+                self._changes.pop(attempt_id, None)
+
+
+# Compare-and-delete, so that a change made while the previous one was being
+# written stays pending. KEYS: attempt changes, solution index, attempt set.
+# ARGV: attempt id followed by the written (solution id, value) pairs.
+TRIM_SCRIPT = """
+for i = 2, #ARGV, 2 do
+    if redis.call("HGET", KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call("HDEL", KEYS[1], ARGV[i])
+        redis.call("HDEL", KEYS[2], ARGV[i])
+    end
+end
+if redis.call("HLEN", KEYS[1]) == 0 then
+    redis.call("SREM", KEYS[3], ARGV[1])
+end
+"""
+
+
+class RedisDraftStore(DraftStore):
+    def __init__(self, redis: Redis, prefix: str = "quizar:drafts") -> None:
+        self.redis = redis
+        self.index_key = f"{prefix}:solutions"
+        self.attempts_key = f"{prefix}:attempts"
+        self.prefix = prefix
+        self._trim = redis.register_script(TRIM_SCRIPT)
+
+    def changes_key(self, attempt_id: Union[UUID, str]) -> str:
+        return f"{self.prefix}:attempt:{attempt_id}"
+
+    def put(self, attempt_id: UUID, id: UUID, value: str) -> None:
+        with self.redis.pipeline() as pipeline:
+            pipeline.hset(self.changes_key(attempt_id), str(id), value)
+            pipeline.hset(self.index_key, str(id), str(attempt_id))
+            pipeline.sadd(self.attempts_key, str(attempt_id))
+            pipeline.execute()
+
+    def lookup(self, id: UUID) -> Optional[str]:
+        attempt_id = self.redis.hget(self.index_key, str(id))
+        if attempt_id is None:
+            return None
+        return self.redis.hget(self.changes_key(attempt_id), str(id))
+
+    def changes(self, attempt_id: UUID) -> dict[UUID, str]:
+        return {
+            UUID(id): value
+            for id, value in self.redis.hgetall(
+                self.changes_key(attempt_id)
+            ).items()
+        }
+
+    def attempts(self) -> list[UUID]:
+        return [UUID(id) for id in self.redis.smembers(self.attempts_key)]
+
+    def trim(self, attempt_id: UUID, written: dict[UUID, str]) -> None:
+        self._trim(
+            keys=[
+                self.changes_key(attempt_id),
+                self.index_key,
+                self.attempts_key,
+            ],
+            args=[
+                str(attempt_id),
+                *(
+                    item
+                    for id, value in written.items()
+                    for item in (str(id), value)
+                ),
+            ],
+        )
+
+
+def make_store(url: Optional[str]) -> Optional[DraftStore]:
+    if url is None:
+        return None
+    if url.startswith("memory:"):
+        return MemoryDraftStore()
+    if url.startswith(("redis:", "rediss:", "unix:")):
+        return RedisDraftStore(Redis.from_url(url, decode_responses=True))
+    raise ValueError(f"Unsupported DRAFT_STORE_URL: {url}")
+
+
+store = make_store(settings.DRAFT_STORE_URL)
+
+
+def write_quiz(
+    db: Union[Session, Connection],
+    quiz_id: UUID,
+    pending: dict[UUID, dict[UUID, str]],
+) -> None:
+    """
+    Write the pending changes of attempts of the quiz.
+    """
+    deleted = [
+        id
+        for changes in pending.values()
+        for id, value in changes.items()
+        if value == DELETED
+    ]
+    added = [
+        solution
+        for changes in pending.values()
+        for value in changes.values()
+        if (solution := decode(value)) is not None
+    ]
+    if deleted:
+        db.execute(WRITE_DELETED, {"quiz_id": quiz_id, "ids": deleted})
+    if added:
+        attempts = set(
+            db.scalars(
+                EXISTING_ATTEMPTS,
+                {
+                    "quiz_id": quiz_id,
+                    "ids": list({s.attempt_id for s in added}),
+                },
+            )
+        )
+        answers = set(
+            db.scalars(
+                EXISTING_ANSWERS, {"ids": list({s.answer_id for s in added})}
+            )
+        )
+        rows = [
+            {column: getattr(solution, column) for column in COLUMNS}
+            for solution in added
+            if solution.attempt_id in attempts
+            and solution.answer_id in answers
+        ]
+        if rows:
+            db.execute(WRITE_ADDED, rows)
+
+
+@contextmanager
+def write_behind(
+    db: Union[Session, Connection], attempts: dict[UUID, UUID]
+) -> Iterator[None]:
+    """
+    Write the pending changes of the `attempts`, ids mapped to the ids of
+    their quizzes, in the current transaction of `db`, then forget them once
+    the block, which must commit, exits.
+
+    Changes of attempts or answers deleted in the meantime can never be
+    written and are dropped.
+    """
+    if store is None:
+        yield
+        return
+    pending: dict[UUID, dict[UUID, dict[UUID, str]]] = {}
+    for attempt_id, quiz_id in attempts.items():
+        if changes := store.changes(attempt_id):
+            pending.setdefault(quiz_id, {})[attempt_id] = changes
+    for quiz_id, quiz_pending in pending.items():
+        write_quiz(db, quiz_id, quiz_pending)
+    yield
+    for quiz_pending in pending.values():
+        for attempt_id, changes in quiz_pending.items():
+            store.trim(attempt_id, changes)
+
+
+def forget(attempt_ids: Iterable[UUID]) -> None:
+    """
+    Drop the pending changes of attempts deleted since, which can never be
+    written.
+    """
+    for attempt_id in attempt_ids:
+        store.trim(attempt_id, store.changes(attempt_id))
+
+
+def checkpoint(chunk_size: Optional[int] = None) -> None:
+    """
+    Write the pending changes of every attempt on the shard of the attempt,
+    `chunk_size` attempts per transaction.
+    """
+    if store is None:
+        return
+    chunk_size = chunk_size or settings.DRAFT_CHECKPOINT_CHUNK_SIZE
+    attempt_ids = store.attempts()
+    # The primary is probed last, as before shards existed
+    for name, bind in sorted(
+        shards.engines.items(), key=lambda item: item[0] == DEFAULT_SHARD
+    ):
+        if not attempt_ids:
+            break
+        with bind.connect() as connection:
+            found = dict(
+                connection.execute(
+                    QUIZZES_OF_ATTEMPTS, {"ids": attempt_ids}
+                ).all()
+            )
+        attempt_ids = [id for id in attempt_ids if id not in found]
+        found_ids = list(found)
+        while found_ids:
+            chunk = found_ids[:chunk_size]
+            found_ids = found_ids[chunk_size:]
+            with bind.connect() as connection:
+                with write_behind(connection, {id: found[id] for id in chunk}):
+                    connection.commit()
+    forget(attempt_ids)
+
+
+async def checkpoint_periodically() -> None:
+    while True:
+        await sleep(settings.DRAFT_CHECKPOINT_SECONDS)
+        try:
+            await to_thread(checkpoint)
+        except Exception:
+            logger.exception("Draft checkpoint failed")
@@ -0,0 +1,86 @@
+"""
+Grading of attempts with the scoring of their quiz.
+
+Submitting locks the draft attempts it submits, so that no solution can be
+added to or removed from them in the meantime, grades them with
+`app.core.scoring` and hands the scores to the guarded `UPDATE` of the
+submit as the `attempt_ids` and `scores` arrays of `GRADES`.
+"""
+from typing import Any, Optional, Union
+from uuid import UUID
+
+from app.core.scoring import AnswerKey, Scoring, ScoringMethod
+from app.db.partitions import quiz_of
+from app.models import Answer, Attempt, Question, Quiz, Solution, Submission
+from sqlalchemy import Double, bindparam, cast, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+GET_SCORING = select(Quiz.scoring, Quiz.score_floor).where(
+    Quiz.id == bindparam("quiz_id")
+)
+# Questions left without answers still get a row, with a null answer
+GET_ANSWER_KEY = (
+    select(Answer.id, Question.id, Answer.is_correct, Question.weight)
+    .select_from(Question)
+    .outerjoin(Answer, Answer.question_id == Question.id)
+    .where(Question.quiz_id == bindparam("quiz_id"))
+)
+GET_CHOSEN = select(Solution.attempt_id, Solution.answer_id).where(
+    Solution.attempt_id.in_(bindparam("attempt_ids", expanding=True)),
+    Solution.quiz_id == bindparam("quiz_id"),
+)
+# FOR UPDATE conflicts with the lock a new solution takes on its attempt
+# through its foreign key
+DRAFT_ATTEMPTS = (
+    select(Attempt.id, Attempt.question_id, Attempt.quiz_id)
+    .where(Attempt.draft)
+    .with_for_update(of=Attempt)
+)
+LOCK_DRAFT_ATTEMPT = DRAFT_ATTEMPTS.where(Attempt.id == bindparam("pk"))
+LOCK_DRAFT_ATTEMPTS_BY_SUBMISSION = DRAFT_ATTEMPTS.where(
+    Attempt.submission_id == bindparam("pk"),
+    Attempt.quiz_id == quiz_of(Submission, bindparam("pk")),
+)
+# The scores of the attempts with the ids at the same position, to join
+# the attempts being submitted against
+GRADES = select(
+    func.unnest(
+        cast(bindparam("attempt_ids"), ARRAY(PG_UUID(as_uuid=True)))
+    ).label("id"),
+    func.unnest(cast(bindparam("scores"), ARRAY(Double))).label("score"),
+).cte("grades")
+
+
+def get_scoring(db: Union[Session, Connection], quiz_id: UUID) -> Scoring:
+    row = db.execute(GET_SCORING, {"quiz_id": quiz_id}).one()
+    return Scoring(ScoringMethod(row.scoring), row.score_floor)
+
+
+def get_answer_key(db: Union[Session, Connection], quiz_id: UUID) -> AnswerKey:
+    return AnswerKey(db.execute(GET_ANSWER_KEY, {"quiz_id": quiz_id}))
+
+
+def grade_drafts(
+    db: Session, statement: Select, params: dict[str, Any]
+) -> dict[str, list[Optional[Union[UUID, float]]]]:
+    """
+    Lock and grade the draft attempts of a quiz that `statement` selects,
+    returning the parameters of `GRADES`.
+    """
+    attempts = db.execute(statement, params).all()
+    if not attempts:
+        return {"attempt_ids": [], "scores": []}
+    quiz_id = attempts[0].quiz_id
+    attempt_ids = [attempt.id for attempt in attempts]
+    scores = get_scoring(db, quiz_id).grade_attempts(
+        get_answer_key(db, quiz_id),
+        [(attempt.id, attempt.question_id) for attempt in attempts],
+        db.execute(
+            GET_CHOSEN, {"attempt_ids": attempt_ids, "quiz_id": quiz_id}
+        ),
+    )
+    return {"attempt_ids": attempt_ids, "scores": scores}
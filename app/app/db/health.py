@@ -0,0 +1,71 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+from app.core.config import settings
+from app.db.session import engine
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+
+@dataclass(frozen=True)
+class DatabaseStatus:
+    reachable: bool
+    pool_saturated: bool
+
+    @property
+    def ready(self) -> bool:
+        return self.reachable and not self.pool_saturated
+
+
+_lock = Lock()
+_checked_at = 0.0
+_status: Optional[DatabaseStatus] = None
+# Waits for a connection of the pool apart from the probe, which gives up
+# after `READINESS_CHECKOUT_SECONDS`
+_checkouts = ThreadPoolExecutor(max_workers=1)
+
+
+def release(checkout: Future) -> None:
+    if checkout.exception() is None:
+        checkout.result().close()
+
+
+def check() -> DatabaseStatus:
+    """
+    Check out a connection of the pool within `READINESS_CHECKOUT_SECONDS`
+    and run `SELECT 1` on it. A pool that has no connection to spare by
+    then is saturated, and the database unavailable to the requests.
+    """
+    checkout = _checkouts.submit(engine.connect)
+    try:
+        connection = checkout.result(
+            timeout=settings.READINESS_CHECKOUT_SECONDS
+        )
+    except TimeoutError:
+        # Give the connection back once the checkout gets one
+        checkout.add_done_callback(release)
+        return DatabaseStatus(reachable=False, pool_saturated=True)
+    except SQLAlchemyError:
+        return DatabaseStatus(reachable=False, pool_saturated=False)
+    try:
+        with connection:
+            connection.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        return DatabaseStatus(reachable=False, pool_saturated=False)
+    return DatabaseStatus(reachable=True, pool_saturated=False)
+
+
+def database_status() -> DatabaseStatus:
+    global _checked_at, _status
+    with _lock:
+        if (
+            _status is not None
+            and monotonic() - _checked_at < settings.READINESS_CACHE_SECONDS
+        ):
+            return _status
+        _status = check()
+        _checked_at = monotonic()
+        return _status
@@ -0,0 +1,98 @@
+"""
+Last write of each user, so that they read their own writes on replicas.
+
+When a session that wrote on behalf of a user commits, the WAL position of
+the primary is remembered for the user of the request's token. Their read
+sessions then only use a replica that has replayed the primary up to that
+position; see `RoutingSession`. A position is only kept while a replica
+within `REPLICA_MAX_LAG_SECONDS` may not have replayed it yet.
+
+`LAST_WRITE_STORE_URL` picks where positions are kept:
+
+* `memory://` (default) keeps them in the worker process, so a user whose
+  next request goes to another worker may not read their write there.
+* `redis://` (or `rediss://`, `unix://`) shares them between workers and
+  nodes.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from math import ceil
+from threading import Lock
+from time import monotonic
+from uuid import UUID
+
+from app.core.config import settings
+from redis import Redis
+
+
+def ttl() -> int:
+    return ceil(
+        settings.REPLICA_MAX_LAG_SECONDS + settings.REPLICA_LAG_CHECK_SECONDS
+    )
+
+
+class LastWrites(ABC):
+    @abstractmethod
+    def remember(self, user_id: UUID, lsn: int) -> None:
+        pass
+
+    @abstractmethod
+    def get(self, user_id: UUID) -> int:
+        """
+        The last WAL position the user wrote at, or 0 when none matters.
+        """
+
+
+class MemoryLastWrites(LastWrites):
+    def __init__(self) -> None:
+        # Oldest first, so expired positions are dropped from the front
+        self._positions: OrderedDict[UUID, tuple[int, float]] = OrderedDict()
+        self._lock = Lock()
+
+    def remember(self, user_id: UUID, lsn: int) -> None:
+        now = monotonic()
+        with self._lock:
+            previous, _ = self._positions.pop(user_id, (0, now))
+            self._positions[user_id] = (max(previous, lsn), now + ttl())
+            while next(iter(self._positions.values()))[1] < now:
+                self._positions.popitem(last=False)
+
+    def get(self, user_id: UUID) -> int:
+        lsn, expires_at = self._positions.get(user_id, (0, 0.0))
+        return lsn if expires_at >= monotonic() else 0
+
+
+class RedisLastWrites(LastWrites):
+    # Keeps the highest position when writes of a user commit concurrently
+    REMEMBER = """
+    local previous = tonumber(redis.call('GET', KEYS[1]) or '0')
+    if tonumber(ARGV[1]) > previous then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    else
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    """
+
+    def __init__(
+        self, redis: Redis, prefix: str = "quizar:last_writes"
+    ) -> None:
+        self.redis = redis
+        self.prefix = prefix
+        self._remember = redis.register_script(self.REMEMBER)
+
+    def remember(self, user_id: UUID, lsn: int) -> None:
+        self._remember(keys=[f"{self.prefix}:{user_id}"], args=[lsn, ttl()])
+
+    def get(self, user_id: UUID) -> int:
+        return int(self.redis.get(f"{self.prefix}:{user_id}") or 0)
+
+
+def make_last_writes(url: str) -> LastWrites:
+    if url.startswith("memory:"):
+        return MemoryLastWrites()
+    if url.startswith(("redis:", "rediss:", "unix:")):
+        return RedisLastWrites(Redis.from_url(url, decode_responses=True))
+    raise ValueError(f"Unsupported LAST_WRITE_STORE_URL: {url}")
+
+
+last_writes = make_last_writes(settings.LAST_WRITE_STORE_URL)
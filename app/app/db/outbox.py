@@ -0,0 +1,253 @@
+"""
+Transactional outbox of the changes other services consume.
+
+`CRUDSubmission.submit` and `CRUDQuiz.publish` write an event to
+`outbox_events` in the transaction of their change, on the shard of the
+submission and on the primary along with `quizzes`, so an event exists if
+and only if its change committed. A relay then publishes the events of every
+shard every `OUTBOX_RELAY_SECONDS`: each run numbers up to
+`OUTBOX_BATCH_SIZE` unpublished events after the last published one and
+sends them with `NOTIFY` on `OUTBOX_CHANNEL`, packed into as few
+notifications as fit, in the transaction that numbers them. Runs on a shard
+hold an advisory lock, so however many processes relay, the positions of a
+shard are gapless and become visible in order.
+
+Notifications only reach the listeners connected when they are sent, and
+listen on the database of each shard. Consumers catch up on what they missed
+with `GET /event/`, which returns the events of every shard after the
+positions of its cursor. Published events are deleted after
+`OUTBOX_RETENTION_DAYS`, except the last of each shard, that numbering goes
+on from; a cursor older than that is refused rather than skipping them.
+Until then events stay where they were numbered, whatever happens to their
+rows: `app.db.rebalance` does not move them and `app.db.purge` does not
+delete them, since consumers may not have read them yet.
+"""
+import json
+from asyncio import sleep, to_thread
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from logging import getLogger
+from operator import attrgetter
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+from app.core.config import settings
+from app.db.session import shards
+from app.models import OutboxEvent
+from sqlalchemy import bindparam, delete, func, insert, select, text, update
+from sqlalchemy.engine import Engine, Row
+from sqlalchemy.orm import Session
+
+logger = getLogger(__name__)
+
+
+class Topic(str, Enum):
+    SUBMISSION_SUBMITTED = "submission.submitted"
+    QUIZ_PUBLISHED = "quiz.published"
+
+
+OUTBOX = OutboxEvent.__table__
+PUBLISHED = OUTBOX.alias("published")
+# "outbox" in ASCII
+RELAY_LOCK = 0x6F7574626F78
+# Postgres refuses notifications of 8000 bytes or more
+MAX_NOTIFICATION_BYTES = 7999
+
+WRITE = insert(OutboxEvent)
+LOCK = text("SELECT pg_try_advisory_xact_lock(:key)")
+NOTIFY = text("SELECT pg_notify(:channel, :payload)")
+LAST_POSITION = select(
+    func.coalesce(func.max(PUBLISHED.c.position), 0)
+).scalar_subquery()
+PENDING = (
+    select(
+        OUTBOX.c.id,
+        func.row_number().over(order_by=OUTBOX.c.id).label("offset"),
+    )
+    .where(OUTBOX.c.position.is_(None))
+    .order_by(OUTBOX.c.id)
+    .limit(bindparam("limit"))
+    .subquery()
+)
+NUMBER = (
+    update(OUTBOX)
+    .where(OUTBOX.c.id == PENDING.c.id)
+    .values(position=LAST_POSITION + PENDING.c.offset, published_at=func.now())
+    .returning(*OUTBOX.c)
+)
+EXPIRE = delete(OUTBOX).where(
+    OUTBOX.c.id.in_(
+        select(OUTBOX.c.id)
+        .where(
+            OUTBOX.c.position < LAST_POSITION,
+            OUTBOX.c.published_at < bindparam("before"),
+        )
+        .order_by(OUTBOX.c.position)
+        .limit(bindparam("limit"))
+    )
+)
+READ = (
+    select(OutboxEvent)
+    .where(OutboxEvent.position > bindparam("after"))
+    .order_by(OutboxEvent.position)
+    .limit(bindparam("limit"))
+)
+
+
+def write(
+    db: Session,
+    topic: Topic,
+    *,
+    quiz_id: UUID,
+    user_id: Optional[UUID],
+    subject_id: UUID,
+    payload: dict[str, Any],
+) -> None:
+    """
+    Add an event of `topic` to the transaction of the session, on the shard
+    it is pinned to.
+    """
+    db.execute(
+        WRITE,
+        {
+            "topic": topic.value,
+            "quiz_id": quiz_id,
+            "user_id": user_id,
+            "subject_id": subject_id,
+            "payload": payload,
+        },
+    )
+
+
+def encode(shard: str, event: Any) -> dict[str, Any]:
+    return {
+        "shard": shard,
+        "position": event.position,
+        "topic": event.topic,
+        "quiz_id": str(event.quiz_id),
+        "user_id": None if event.user_id is None else str(event.user_id),
+        "subject_id": str(event.subject_id),
+        "payload": event.payload,
+        "created_at": event.created_at.isoformat(),
+        "published_at": event.published_at.isoformat(),
+    }
+
+
+def notifications(shard: str, events: list[Row]) -> Iterator[str]:
+    """
+    Pack the events into JSON arrays of at most `MAX_NOTIFICATION_BYTES`.
+    Their payloads are a few scalars, far from filling one on their own.
+    """
+    batch: list[str] = []
+    size = 2
+    for event in events:
+        encoded = json.dumps(encode(shard, event), separators=(",", ":"))
+        if batch and size + len(encoded.encode()) + 1 > MAX_NOTIFICATION_BYTES:
+            yield f"[{','.join(batch)}]"
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded.encode()) + 1
+    if batch:
+        yield f"[{','.join(batch)}]"
+
+
+def relay_shard(name: str, bind: Engine, batch_size: int) -> int:
+    """
+    Publish up to `batch_size` events of the shard, and return how many,
+    none when another relay holds the shard.
+    """
+    with bind.begin() as connection:
+        if not connection.scalar(LOCK, {"key": RELAY_LOCK}):
+            return 0
+        connection.execute(
+            EXPIRE,
+            {
+                "before": datetime.now(timezone.utc)
+                - timedelta(days=settings.OUTBOX_RETENTION_DAYS),
+                "limit": batch_size,
+            },
+        )
+        events = connection.execute(NUMBER, {"limit": batch_size}).all()
+        events.sort(key=attrgetter("position"))
+        for payload in notifications(name, events):
+            connection.execute(
+                NOTIFY,
+                {"channel": settings.OUTBOX_CHANNEL, "payload": payload},
+            )
+    return len(events)
+
+
+def relay(batch_size: Optional[int] = None) -> int:
+    """
+    Publish the pending events of every shard, `batch_size` per
+    transaction, and return how many were published.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    published = 0
+    for name, bind in shards.engines.items():
+        try:
+            while True:
+                relayed = relay_shard(name, bind, batch_size)
+                published += relayed
+                if relayed < batch_size:
+                    break
+        except Exception:
+            logger.exception("Could not relay the outbox of shard %s" % name)
+    return published
+
+
+async def relay_periodically() -> None:
+    while True:
+        await sleep(settings.OUTBOX_RELAY_SECONDS)
+        await to_thread(relay)
+
+
+def parse_cursor(cursor: str) -> dict[str, int]:
+    """
+    Read a cursor of `shard:position` pairs separated by commas.
+    """
+    positions = {}
+    for pair in filter(None, cursor.split(",")):
+        name, _, position = pair.rpartition(":")
+        if name not in shards.engines or not position.isdigit():
+            raise ValueError(f"Invalid cursor position {pair!r}")
+        positions[name] = int(position)
+    return positions
+
+
+def format_cursor(positions: dict[str, int]) -> str:
+    return ",".join(
+        f"{name}:{position}" for name, position in sorted(positions.items())
+    )
+
+
+def read(
+    db: Session, positions: dict[str, int], limit: int
+) -> tuple[list[tuple[str, OutboxEvent]], dict[str, int]]:
+    """
+    Return the first `limit` published events after `positions`, from every
+    shard in the order they were published, with the positions after them.
+    Shards missing from `positions` are read from their oldest event.
+    """
+    events = []
+    for name in shards.each(db):
+        after = positions.get(name, 0)
+        shard_events = db.scalars(READ, {"after": after, "limit": limit}).all()
+        if (
+            name in positions
+            and shard_events
+            and shard_events[0].position > after + 1
+        ):
+            raise ValueError(
+                f"The cursor of shard {name} is past the retention of "
+                "events, read from the start again"
+            )
+        events.extend((name, event) for event in shard_events)
+    events.sort(
+        key=lambda item: (item[1].published_at, item[0], item[1].position)
+    )
+    events = events[:limit]
+    positions = dict(positions)
+    for name, event in events:
+        positions[name] = event.position
+    return events, positions
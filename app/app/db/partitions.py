@@ -0,0 +1,335 @@
+"""
+Range partitioning of `attempts` and `solutions` by quiz.
+
+Both tables are partitioned by `quiz_id`, whose leading bits are the time
+the quiz was created (see `uuid7`): the partition of a month holds the rows
+of the quizzes created that month. The rows of a quiz stay in one partition
+that the queries of a quiz, a submission or an attempt prune to, and the
+partitions of past months go cold, so vacuum and index maintenance mostly
+run on the recent ones. Unique keys include `quiz_id`, as partitioning
+requires, and solutions reference their attempt by `(attempt_id, quiz_id)`.
+A default partition takes the quiz ids outside every month, such as random
+ids of quizzes created before `uuid7`, and those of a month whose partition
+is missing, which are moved into it once it is created.
+
+Run as a module on every start, and e.g. daily, to create the partitions of
+the current month and the `PARTITION_MONTHS_AHEAD` following ones before
+they are needed:
+
+    $ python -m app.db.partitions
+
+With `--convert`, tables created before partitioning are first moved into
+partitioned ones, with a partition for every month they have quizzes of.
+This copies them in one transaction, which keeps them locked meanwhile, so
+it runs before Alembic compares the schema to the models:
+
+    $ python -m app.db.partitions --convert
+"""
+import re
+from argparse import ArgumentParser
+from datetime import date, datetime, timezone
+from logging import INFO, basicConfig, getLogger
+from typing import Any, Iterable, Optional
+from uuid import UUID
+
+from app.core.config import settings
+from app.db.base import Base
+from app.db.session import shards
+from app.db.shards import DEFAULT_SHARD
+from sqlalchemy import MetaData, Table, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import ScalarSelect
+
+logger = getLogger(__name__)
+
+# Parents before children, so that the foreign keys hold
+PARTITIONED_TABLES = ("attempts", "solutions")
+PARTITION_NAME = re.compile(
+    rf"^({'|'.join(PARTITIONED_TABLES)})_(default|\d{{4}}_\d{{2}})$"
+)
+# Creating a partition waits for the queries on its table to finish, and
+# holds off new ones meanwhile, so it gives up rather than stall them
+LOCK_TIMEOUT = "5s"
+SUFFIX = "_unpartitioned"
+
+RELKIND = text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)")
+INDEXES = text(
+    "SELECT indexrelid::regclass::text FROM pg_index "
+    "WHERE indrelid = to_regclass(:name)"
+)
+
+
+def quiz_of(model: type[Base], id: ColumnElement) -> ScalarSelect:
+    """
+    The quiz of the row of `model` with `id`, to compare the partition key
+    with. As a parameter of the query, it prunes the partitions when the
+    query runs.
+    """
+    return select(model.quiz_id).where(model.id == id).scalar_subquery()
+
+
+def is_partition(name: str) -> bool:
+    return PARTITION_NAME.match(name) is not None
+
+
+def include_object(
+    object: Any, name: str, type_: str, reflected: bool, compare_to: Any
+) -> bool:
+    """
+    Leave the partitions to this module when autogenerating, with the
+    foreign keys Postgres adds to every partition a foreign key refers to.
+    """
+    if type_ == "table":
+        return not is_partition(name)
+    if type_ == "foreign_key_constraint" and reflected:
+        referred, _ = object.elements[0].target_fullname.split(".")
+        return not is_partition(referred)
+    return True
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(quiz_id: UUID) -> Optional[date]:
+    if quiz_id.version != 7:
+        return None
+    created = datetime.fromtimestamp((quiz_id.int >> 80) / 1000, timezone.utc)
+    return date(created.year, created.month, 1)
+
+
+def first_id(month: date) -> UUID:
+    """
+    The lowest `uuid7` of the month.
+    """
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    return UUID(int=int(start.timestamp() * 1000) << 80)
+
+
+def upcoming(months_ahead: int) -> list[date]:
+    today = datetime.now(timezone.utc).date()
+    month = date(today.year, today.month, 1)
+    return [add_months(month, months) for months in range(months_ahead + 1)]
+
+
+def create_partitions(
+    connection: Connection, table: str, months: Iterable[date]
+) -> None:
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {table}_default "
+            f"PARTITION OF {table} DEFAULT"
+        )
+    )
+    for month in months:
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} "
+                f"PARTITION OF {table} FOR VALUES "
+                f"FROM ('{first_id(month)}') "
+                f"TO ('{first_id(add_months(month, 1))}')"
+            )
+        )
+
+
+def move_from_default(connection: Connection, month: date) -> None:
+    """
+    Create the partitions of the month when rows of it landed in the default
+    ones meanwhile, which Postgres otherwise refuses. The rows of the month
+    are kept aside in temporary tables while the partitions are created;
+    solutions leave before their attempts, so deleting these cascades to
+    none, and come back after them.
+    """
+    in_month = (
+        f"quiz_id >= '{first_id(month)}' "
+        f"AND quiz_id < '{first_id(add_months(month, 1))}'"
+    )
+    stranded = {
+        table: connection.scalar(
+            text(f"SELECT count(*) FROM {table}_default WHERE {in_month}")
+        )
+        for table in PARTITIONED_TABLES
+        if connection.scalar(RELKIND, {"name": f"{table}_default"})
+    }
+    if not any(stranded.values()):
+        return
+    for table in reversed(PARTITIONED_TABLES):
+        connection.execute(
+            text(
+                f"CREATE TEMPORARY TABLE moving_{table} ON COMMIT DROP AS "
+                f"SELECT * FROM {table} WHERE {in_month}"
+            )
+        )
+        connection.execute(text(f"DELETE FROM {table} WHERE {in_month}"))
+    for table in PARTITIONED_TABLES:
+        create_partitions(connection, table, [month])
+        connection.execute(
+            text(f"INSERT INTO {table} SELECT * FROM moving_{table}")
+        )
+    logger.warning(
+        "Moved %s of %s out of the default partitions"
+        % (
+            " and ".join(
+                f"{count} {table}" for table, count in stranded.items()
+            ),
+            f"{month:%Y-%m}",
+        )
+    )
+
+
+def is_kind(connection: Connection, relkind: str) -> bool:
+    """
+    Whether `attempts` and `solutions` are both of the `relkind` of
+    `pg_class`: `p` once partitioned, `r` before.
+    """
+    return all(
+        connection.scalar(RELKIND, {"name": name}) == relkind
+        for name in PARTITIONED_TABLES
+    )
+
+
+def maintain(bind: Engine, months_ahead: int) -> None:
+    """
+    Create the missing partitions of the current month and the following
+    `months_ahead` ones, one transaction per month. Those that time out
+    waiting for their tables are left to the next run.
+    """
+    with bind.connect() as connection:
+        if not is_kind(connection, "p"):
+            return
+    for month in upcoming(months_ahead):
+        try:
+            with bind.begin() as connection:
+                connection.execute(
+                    text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+                )
+                move_from_default(connection, month)
+                for table in PARTITIONED_TABLES:
+                    create_partitions(connection, table, [month])
+        except DBAPIError as error:
+            logger.warning(
+                "Could not create the partitions for %s: %s"
+                % (f"{month:%Y-%m}", error.orig)
+            )
+
+
+def convert(bind: Engine, metadata: MetaData, months_ahead: int) -> None:
+    """
+    Move the rows of unpartitioned `attempts` and `solutions` into
+    partitioned tables of `metadata`. Their `quiz_id` and `user_id` are
+    taken from the submission and the attempt, since tables that old may
+    not have them yet; attempts whose submission has no quiz, and their
+    solutions, are left out, as partitioning cannot keep them.
+    """
+    with bind.begin() as connection:
+        if not is_kind(connection, "r"):
+            return
+        # The names of the indexes and constraints go to the new tables
+        for name in PARTITIONED_TABLES:
+            connection.execute(
+                text(f"ALTER TABLE {name} RENAME TO {name}{SUFFIX}")
+            )
+            for index in connection.scalars(
+                INDEXES, {"name": f"{name}{SUFFIX}"}
+            ).all():
+                connection.execute(
+                    text(f"ALTER INDEX {index} RENAME TO {index}{SUFFIX}")
+                )
+        old = MetaData()
+        attempts, solutions = (
+            Table(f"{name}{SUFFIX}", old, autoload_with=connection)
+            for name in PARTITIONED_TABLES
+        )
+        submissions = Table("submissions", old, autoload_with=connection)
+        months = set(upcoming(months_ahead))
+        for quiz_id in connection.scalars(
+            select(submissions.c.quiz_id)
+            .join(attempts, attempts.c.submission_id == submissions.c.id)
+            .distinct()
+        ):
+            if quiz_id is not None and month_of(quiz_id) is not None:
+                months.add(month_of(quiz_id))
+        for name in PARTITIONED_TABLES:
+            metadata.tables[name].create(connection)
+            create_partitions(connection, name, sorted(months))
+        new_attempts = metadata.tables["attempts"]
+        for source, target, parent, rows in (
+            (
+                attempts,
+                new_attempts,
+                submissions,
+                select(attempts).join(
+                    submissions,
+                    submissions.c.id == attempts.c.submission_id,
+                ),
+            ),
+            (
+                solutions,
+                metadata.tables["solutions"],
+                new_attempts,
+                select(solutions).join(
+                    new_attempts, new_attempts.c.id == solutions.c.attempt_id
+                ),
+            ),
+        ):
+            keys = {"quiz_id": parent.c.quiz_id, "user_id": parent.c.user_id}
+            columns = [
+                column["name"]
+                for column in inspect(connection).get_columns(source.name)
+                if column["name"] in target.c and column["name"] not in keys
+            ]
+            total = connection.scalar(select(func.count()).select_from(source))
+            copied = connection.execute(
+                insert(target).from_select(
+                    [*columns, *keys],
+                    rows.with_only_columns(
+                        *(source.c[column] for column in columns),
+                        *keys.values(),
+                    ).where(parent.c.quiz_id.is_not(None)),
+                )
+            ).rowcount
+            logger.info(
+                "Moved %d of %d rows of %s into %d partitions"
+                % (copied, total, target.name, len(months) + 1)
+            )
+        connection.execute(
+            text(f"DROP TABLE {solutions.name}, {attempts.name}")
+        )
+        # The queries of the foreign keys are planned once per session,
+        # better not without statistics
+        for name in PARTITIONED_TABLES:
+            connection.execute(text(f"ANALYZE {name}"))
+
+
+def partition(
+    convert_tables: bool = False, months_ahead: Optional[int] = None
+) -> None:
+    """
+    Create the upcoming partitions on every shard, after converting the
+    tables of the primary with `convert_tables`. `app.db.shard_schema`
+    converts those of the other shards.
+    """
+    months_ahead = (
+        settings.PARTITION_MONTHS_AHEAD
+        if months_ahead is None
+        else months_ahead
+    )
+    primary = shards.engines[DEFAULT_SHARD]
+    with primary.connect() as connection:
+        unpartitioned = is_kind(connection, "r")
+    if convert_tables and unpartitioned:
+        convert(primary, Base.metadata, months_ahead)
+    for bind in shards.engines.values():
+        maintain(bind, months_ahead)
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = ArgumentParser(prog="python -m app.db.partitions")
+    parser.add_argument("--convert", action="store_true")
+    parser.add_argument("--months-ahead", type=int)
+    args = parser.parse_args()
+    partition(args.convert, args.months_ahead)
@@ -0,0 +1,162 @@
+"""
+Background removal of soft-deleted quizzes and users.
+
+Deleting a quiz or a user only sets its `deleted_at`. The purge then
+deletes its dependents leaf first, `PURGE_CHUNK_SIZE` rows per transaction,
+so no single transaction holds locks on, or loads, a whole object graph.
+The row itself goes last and takes whatever is left with it through
+`ON DELETE CASCADE`. Dependents on other shards than the primary have no
+foreign key to cascade from, so the purge deletes all of them: those of a
+quiz on its shard, and those of a user on every shard, as well as their
+audit events, which have no foreign keys at all. Archived attempts
+and solutions go too: the archive directory of a quiz, and the rows of a
+user from every batch holding some.
+
+Run as a module to resume purges interrupted by a restart:
+
+    $ python -m app.db.purge
+"""
+from logging import INFO, basicConfig, getLogger
+from typing import Optional
+from uuid import UUID
+
+from app.core.config import settings
+from app.db import archive
+from app.db.partitions import PARTITIONED_TABLES
+from app.db.session import engine, shards
+from app.models import (
+    Answer,
+    Attempt,
+    AuditEvent,
+    CollusionFlag,
+    Question,
+    Quiz,
+    QuizScoreSketch,
+    Solution,
+    Submission,
+    SubmissionCounter,
+    User,
+)
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Delete, Select
+
+logger = getLogger(__name__)
+
+QUIZ_DEPENDENTS: list[Select] = [
+    select(Solution.id).where(Solution.quiz_id == bindparam("quiz_id")),
+    select(Attempt.id).where(Attempt.quiz_id == bindparam("quiz_id")),
+    select(CollusionFlag.id).where(
+        CollusionFlag.quiz_id == bindparam("quiz_id")
+    ),
+    select(AuditEvent.id).where(AuditEvent.quiz_id == bindparam("quiz_id")),
+    select(Submission.id).where(Submission.quiz_id == bindparam("quiz_id")),
+    select(SubmissionCounter.id).where(
+        SubmissionCounter.quiz_id == bindparam("quiz_id")
+    ),
+    select(QuizScoreSketch.id).where(
+        QuizScoreSketch.quiz_id == bindparam("quiz_id")
+    ),
+    select(Answer.id)
+    .join(Question, Answer.question_id == Question.id)
+    .where(Question.quiz_id == bindparam("quiz_id")),
+    select(Question.id).where(Question.quiz_id == bindparam("quiz_id")),
+]
+USER_DEPENDENTS: list[Select] = [
+    select(Solution.id).where(Solution.user_id == bindparam("user_id")),
+    select(Attempt.id).where(Attempt.user_id == bindparam("user_id")),
+    select(AuditEvent.id).where(AuditEvent.user_id == bindparam("user_id")),
+    select(Submission.id).where(Submission.user_id == bindparam("user_id")),
+    select(SubmissionCounter.id).where(
+        SubmissionCounter.user_id == bindparam("user_id")
+    ),
+]
+QUIZZES_BY_AUTHOR = select(Quiz.id).where(
+    Quiz.author_id == bindparam("user_id")
+)
+DELETED_QUIZZES = select(Quiz.id).where(Quiz.deleted_at.is_not(None))
+DELETED_USERS = select(User.id).where(User.deleted_at.is_not(None))
+
+
+def chunked_delete(ids: Select) -> Delete:
+    table = ids.selected_columns[0].table
+    statement = delete(table).where(
+        table.c.id.in_(
+            ids.limit(bindparam("chunk_size"))
+            .correlate(None)
+            .scalar_subquery()
+        )
+    )
+    if table.name in PARTITIONED_TABLES:
+        # Looks up the ids only in the partitions the criterion prunes to
+        statement = statement.where(ids.whereclause)
+    return statement
+
+
+DELETE_QUIZ_DEPENDENTS = [chunked_delete(ids) for ids in QUIZ_DEPENDENTS]
+DELETE_USER_DEPENDENTS = [chunked_delete(ids) for ids in USER_DEPENDENTS]
+DELETE_QUIZ = delete(Quiz).where(Quiz.id == bindparam("quiz_id"))
+DELETE_USER = delete(User).where(User.id == bindparam("user_id"))
+
+
+def delete_in_chunks(
+    bind: Engine, statement: Delete, params: dict[str, UUID], chunk_size: int
+) -> int:
+    total = 0
+    while True:
+        with bind.begin() as connection:
+            deleted = connection.execute(
+                statement, {**params, "chunk_size": chunk_size}
+            ).rowcount
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+
+def purge_quiz(quiz_id: UUID, chunk_size: Optional[int] = None) -> None:
+    chunk_size = chunk_size or settings.PURGE_CHUNK_SIZE
+    params = {"quiz_id": quiz_id}
+    deleted = sum(
+        delete_in_chunks(
+            shards.engine_for(quiz_id), statement, params, chunk_size
+        )
+        for statement in DELETE_QUIZ_DEPENDENTS
+    )
+    archive.remove_quiz(quiz_id)
+    with engine.begin() as connection:
+        connection.execute(DELETE_QUIZ, params)
+    logger.info("Purged quiz %s and %d dependent rows" % (quiz_id, deleted))
+
+
+def purge_user(user_id: UUID, chunk_size: Optional[int] = None) -> None:
+    chunk_size = chunk_size or settings.PURGE_CHUNK_SIZE
+    params = {"user_id": user_id}
+    with engine.connect() as connection:
+        quiz_ids = connection.scalars(QUIZZES_BY_AUTHOR, params).all()
+    for quiz_id in quiz_ids:
+        purge_quiz(quiz_id, chunk_size)
+    for bind in shards.engines.values():
+        archive.remove_user(bind, user_id)
+    deleted = sum(
+        delete_in_chunks(bind, statement, params, chunk_size)
+        for bind in shards.engines.values()
+        for statement in DELETE_USER_DEPENDENTS
+    )
+    with engine.begin() as connection:
+        connection.execute(DELETE_USER, params)
+    logger.info("Purged user %s and %d dependent rows" % (user_id, deleted))
+
+
+def purge_deleted(chunk_size: Optional[int] = None) -> None:
+    with engine.connect() as connection:
+        quiz_ids = connection.scalars(DELETED_QUIZZES).all()
+        user_ids = connection.scalars(DELETED_USERS).all()
+    for quiz_id in quiz_ids:
+        purge_quiz(quiz_id, chunk_size)
+    for user_id in user_ids:
+        purge_user(user_id, chunk_size)
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    purge_deleted()
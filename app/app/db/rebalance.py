@@ -0,0 +1,189 @@
+"""
+Moving quizzes between shards.
+
+Adding a shard or a `SHARD_OVERRIDES` entry changes where the router sends a
+quiz, but not where its rows are. `misplaced` lists the quizzes every shard
+holds that the router maps to another one, and `move` copies the rows of a
+quiz from one shard to another, `REBALANCE_CHUNK_SIZE` rows per
+transaction:
+
+    $ python -m app.db.rebalance misplaced
+    $ python -m app.db.rebalance move QUIZ_ID SOURCE TARGET
+    $ python -m app.db.rebalance move QUIZ_ID SOURCE TARGET --prune
+
+Copying is an upsert that keeps the most recently updated version of a row,
+so it can be repeated: copy while the quiz is still routed to the source,
+deploy the new routing, then copy again with `--prune` to pick up the rows
+changed in between, delete the quiz from the source and rebuild its score
+sketches.
+"""
+from argparse import ArgumentParser
+from logging import INFO, basicConfig, getLogger
+from typing import Optional
+from uuid import UUID
+
+from app.core.config import settings
+from app.db.purge import DELETE_QUIZ_DEPENDENTS, delete_in_chunks
+from app.db.session import shards
+from app.db.sketches import rebuild
+from app.models import (
+    Answer,
+    Attempt,
+    AuditEvent,
+    CollusionFlag,
+    Question,
+    Solution,
+    Submission,
+    SubmissionCounter,
+)
+from sqlalchemy import Table, bindparam, select, union
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import Insert, Select
+
+logger = getLogger(__name__)
+
+QUESTIONS = Question.__table__
+# Parents before children, so that the foreign keys within a shard hold
+QUIZ_ROWS: list[tuple[Table, Select]] = [
+    (
+        QUESTIONS,
+        select(QUESTIONS).where(QUESTIONS.c.quiz_id == bindparam("quiz_id")),
+    ),
+    (
+        Answer.__table__,
+        select(Answer.__table__)
+        .join(QUESTIONS, Answer.__table__.c.question_id == QUESTIONS.c.id)
+        .where(QUESTIONS.c.quiz_id == bindparam("quiz_id")),
+    ),
+    *(
+        (
+            model.__table__,
+            select(model.__table__).where(
+                model.__table__.c.quiz_id == bindparam("quiz_id")
+            ),
+        )
+        for model in (
+            Submission,
+            SubmissionCounter,
+            CollusionFlag,
+            Attempt,
+            Solution,
+            AuditEvent,
+        )
+    ),
+]
+QUIZ_IDS = union(select(Question.quiz_id), select(Submission.quiz_id))
+
+
+def chunked(rows: Select, table: Table) -> Select:
+    return (
+        rows.where(table.c.id > bindparam("after"))
+        .order_by(table.c.id)
+        .limit(bindparam("chunk_size"))
+    )
+
+
+def upsert(table: Table) -> Insert:
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=list(table.primary_key),
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in table.columns
+            if not column.primary_key
+        },
+        where=table.c.updated_at < statement.excluded.updated_at,
+    )
+
+
+COPY_QUIZ_ROWS = [
+    (chunked(rows, table), upsert(table)) for table, rows in QUIZ_ROWS
+]
+
+
+def misplaced() -> list[tuple[UUID, str, str]]:
+    """
+    Return the quizzes with rows on another shard than the one they map to,
+    as `(quiz_id, shard, mapped_shard)`.
+    """
+    found = []
+    for name, bind in shards.engines.items():
+        with bind.connect() as connection:
+            quiz_ids = connection.scalars(QUIZ_IDS).all()
+        for quiz_id in quiz_ids:
+            mapped = shards.shard_for(quiz_id)
+            if mapped != name:
+                found.append((quiz_id, name, mapped))
+    return found
+
+
+def move(
+    quiz_id: UUID,
+    source: str,
+    target: str,
+    prune: bool = False,
+    chunk_size: Optional[int] = None,
+) -> None:
+    chunk_size = chunk_size or settings.REBALANCE_CHUNK_SIZE
+    if source == target:
+        raise ValueError("The source and target shards are the same")
+    if prune and shards.shard_for(quiz_id) == source:
+        raise ValueError(
+            f"Quiz {quiz_id} is still routed to {source}, deploy the new "
+            "routing before pruning it"
+        )
+    source_engine = shards.engines[source]
+    target_engine = shards.engines[target]
+    copied = 0
+    for rows, write in COPY_QUIZ_ROWS:
+        after = UUID(int=0)
+        while True:
+            with source_engine.connect() as connection:
+                chunk = connection.execute(
+                    rows,
+                    {
+                        "quiz_id": quiz_id,
+                        "after": after,
+                        "chunk_size": chunk_size,
+                    },
+                ).all()
+            if not chunk:
+                break
+            with target_engine.begin() as connection:
+                connection.execute(write, [row._asdict() for row in chunk])
+            copied += len(chunk)
+            after = chunk[-1].id
+    logger.info(
+        "Copied %d rows of quiz %s from %s to %s"
+        % (copied, quiz_id, source, target)
+    )
+    if prune:
+        params = {"quiz_id": quiz_id}
+        deleted = sum(
+            delete_in_chunks(source_engine, statement, params, chunk_size)
+            for statement in DELETE_QUIZ_DEPENDENTS
+        )
+        logger.info(
+            "Pruned %d rows of quiz %s from %s" % (deleted, quiz_id, source)
+        )
+        # Score sketches are not copied, as the sketches a quiz may already
+        # have on the target cannot be told apart from the copied ones
+        rebuild([quiz_id])
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = ArgumentParser(prog="python -m app.db.rebalance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("misplaced")
+    move_parser = commands.add_parser("move")
+    move_parser.add_argument("quiz_id", type=UUID)
+    move_parser.add_argument("source", choices=shards.engines)
+    move_parser.add_argument("target", choices=shards.engines)
+    move_parser.add_argument("--prune", action="store_true")
+    args = parser.parse_args()
+    if args.command == "misplaced":
+        for quiz_id, name, mapped in misplaced():
+            print(quiz_id, name, mapped)
+    else:
+        move(args.quiz_id, args.source, args.target, args.prune)
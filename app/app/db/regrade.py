@@ -0,0 +1,312 @@
+"""
+Regrade of the submitted submissions of a quiz after its answer key changed.
+
+Starting a regrade records it in `quiz_regrades` with the number of
+submitted submissions of the quiz. The job then walks them in id order,
+`REGRADE_CHUNK_SIZE` submissions per transaction: it grades their attempts
+with `app.core.scoring` against the current key and scoring of the quiz,
+and rewrites the attempt scores, the points of their solutions and the
+submission scores with one set-based `UPDATE` each, skipping the rows that
+did not change. Each
+chunk only locks the rows it changes, so candidates keep taking the quiz
+meanwhile.
+
+The regrade row is locked while a chunk runs and records the last
+submission it regraded, so an interrupted regrade resumes after it, and
+concurrent runs of the same regrade take turns. A chunk that committed on
+its shard but not its progress is regraded again, with the same result.
+Starting a regrade of a quiz that is still being regraded starts it over,
+since the key changed again. The score sketches of the quiz are rebuilt
+when it finishes. Submissions archived by `app.db.archive` keep their
+score.
+
+Run as a module to regrade a quiz, or to resume the unfinished regrades:
+
+    $ python -m app.db.regrade --quiz QUIZ_ID
+    $ python -m app.db.regrade
+"""
+from argparse import ArgumentParser
+from logging import INFO, basicConfig, getLogger
+from typing import Optional
+from uuid import UUID
+
+from app.core.config import settings
+from app.db import grading, sketches
+from app.db.base_class import uuid7
+from app.db.grading import GRADES
+from app.db.session import engine, shards
+from app.models import Answer, Attempt, QuizRegrade, Solution, Submission
+from sqlalchemy import (
+    Boolean,
+    and_,
+    any_,
+    bindparam,
+    case,
+    cast,
+    func,
+    null,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
+
+logger = getLogger(__name__)
+
+# Sorts before every submission id
+FIRST = UUID(int=0)
+# Chunks pass their ids as one array parameter each, which costs far less
+# to send and plan than thousands of `IN` parameters
+SUBMISSION_IDS = any_(
+    cast(bindparam("submission_ids"), ARRAY(PG_UUID(as_uuid=True)))
+)
+ATTEMPT_IDS = any_(
+    cast(bindparam("attempt_ids"), ARRAY(PG_UUID(as_uuid=True)))
+)
+
+COUNT_SUBMITTED = (
+    select(func.count())
+    .select_from(Submission)
+    .where(
+        Submission.quiz_id == bindparam("quiz_id"),
+        ~Submission.draft,
+        Submission.archive.is_(None),
+    )
+)
+START = (
+    pg_insert(QuizRegrade)
+    .values(
+        id=bindparam("id"),
+        quiz_id=bindparam("quiz_id"),
+        submissions=bindparam("submissions"),
+        regraded=0,
+    )
+    .on_conflict_do_update(
+        index_elements=[QuizRegrade.quiz_id],
+        index_where=QuizRegrade.finished_at.is_(None),
+        set_={
+            "submissions": bindparam("submissions"),
+            "regraded": 0,
+            "last_submission_id": null(),
+            "updated_at": func.now(),
+        },
+    )
+    .returning(*QuizRegrade.__table__.c)
+)
+GET_LATEST = (
+    select(QuizRegrade)
+    .where(QuizRegrade.quiz_id == bindparam("quiz_id"))
+    .order_by(QuizRegrade.id.desc())
+    .limit(1)
+)
+UNFINISHED = select(QuizRegrade.id).where(QuizRegrade.finished_at.is_(None))
+LOCK_UNFINISHED = (
+    select(QuizRegrade.quiz_id, QuizRegrade.last_submission_id)
+    .where(
+        QuizRegrade.id == bindparam("pk"), QuizRegrade.finished_at.is_(None)
+    )
+    .with_for_update()
+)
+ADVANCE = (
+    update(QuizRegrade)
+    .where(QuizRegrade.id == bindparam("pk"))
+    .values(
+        last_submission_id=bindparam("last_submission_id"),
+        regraded=QuizRegrade.regraded + bindparam("count"),
+        finished_at=case(
+            (bindparam("finished", type_=Boolean), func.now()), else_=null()
+        ),
+    )
+    .returning(
+        QuizRegrade.regraded, QuizRegrade.submissions, QuizRegrade.quiz_id
+    )
+)
+
+NEXT_SUBMISSIONS = (
+    select(Submission.id)
+    .where(
+        Submission.quiz_id == bindparam("quiz_id"),
+        ~Submission.draft,
+        Submission.archive.is_(None),
+        Submission.id > bindparam("after"),
+    )
+    .order_by(Submission.id)
+    .limit(bindparam("chunk_size"))
+)
+# The quiz prunes the partitions of attempts and solutions. UPDATEs bind it
+# as `quiz`, since they reserve the names of the columns.
+SUBMITTED_ATTEMPTS = select(Attempt.id, Attempt.question_id).where(
+    Attempt.submission_id == SUBMISSION_IDS,
+    Attempt.quiz_id == bindparam("quiz_id"),
+    ~Attempt.draft,
+)
+# Reaching the solutions through the attempts of the chunk lets the planner
+# use the indexes instead of scanning all the solutions
+CHOSEN = (
+    select(Solution.attempt_id, Solution.answer_id)
+    .join(
+        Attempt,
+        and_(
+            Attempt.id == Solution.attempt_id,
+            Attempt.quiz_id == Solution.quiz_id,
+        ),
+    )
+    .where(
+        Attempt.submission_id == SUBMISSION_IDS,
+        Attempt.quiz_id == bindparam("quiz_id"),
+        Solution.quiz_id == bindparam("quiz_id"),
+        ~Attempt.draft,
+    )
+)
+REGRADE_ATTEMPTS = (
+    update(Attempt)
+    .where(
+        Attempt.id == GRADES.c.id,
+        Attempt.quiz_id == bindparam("quiz"),
+        Attempt.score.is_distinct_from(GRADES.c.score),
+    )
+    .values(score=GRADES.c.score)
+)
+# Solutions keep the point of their answer for display
+REFRESH_POINTS = (
+    update(Solution)
+    .where(
+        Solution.answer_id == Answer.id,
+        Solution.attempt_id == ATTEMPT_IDS,
+        Solution.quiz_id == bindparam("quiz"),
+        Solution.point.is_distinct_from(Answer.point),
+    )
+    .values(point=Answer.point)
+)
+SUBMISSION_SCORE = (
+    select(func.sum(Attempt.score))
+    .where(
+        Attempt.submission_id == Submission.id,
+        Attempt.quiz_id == Submission.quiz_id,
+        ~Attempt.draft,
+    )
+    .scalar_subquery()
+)
+# Submissions archived since the chunk read their attempts keep their score
+REGRADE_SUBMISSIONS = (
+    update(Submission)
+    .where(
+        Submission.id == SUBMISSION_IDS,
+        Submission.archive.is_(None),
+        Submission.score.is_distinct_from(SUBMISSION_SCORE),
+    )
+    .values(score=SUBMISSION_SCORE)
+)
+
+
+def start(quiz_id: UUID) -> Row:
+    """
+    Record a regrade of the quiz, or start its running regrade over, and
+    return it; `regrade` runs it.
+    """
+    with shards.engine_for(quiz_id).connect() as connection:
+        submissions = connection.scalar(COUNT_SUBMITTED, {"quiz_id": quiz_id})
+    with engine.begin() as connection:
+        return connection.execute(
+            START,
+            {"id": uuid7(), "quiz_id": quiz_id, "submissions": submissions},
+        ).one()
+
+
+def get_latest(quiz_id: UUID) -> Optional[Row]:
+    with engine.connect() as connection:
+        return connection.execute(GET_LATEST, {"quiz_id": quiz_id}).first()
+
+
+def regrade_chunk(regrade_id: UUID, chunk_size: int) -> Optional[Row]:
+    """
+    Regrade the next chunk of submissions and return the progress of the
+    regrade, or `None` when it is finished or gone.
+    """
+    with engine.begin() as primary:
+        regrade = primary.execute(LOCK_UNFINISHED, {"pk": regrade_id}).first()
+        if regrade is None:
+            return None
+        quiz_id = regrade.quiz_id
+        with shards.engine_for(quiz_id).begin() as connection:
+            submission_ids = connection.scalars(
+                NEXT_SUBMISSIONS,
+                {
+                    "quiz_id": quiz_id,
+                    "after": regrade.last_submission_id or FIRST,
+                    "chunk_size": chunk_size,
+                },
+            ).all()
+            if submission_ids:
+                params = {"submission_ids": submission_ids, "quiz_id": quiz_id}
+                attempts = connection.execute(SUBMITTED_ATTEMPTS, params).all()
+                attempt_ids = [attempt.id for attempt in attempts]
+                scores = grading.get_scoring(primary, quiz_id).grade_attempts(
+                    grading.get_answer_key(connection, quiz_id),
+                    [tuple(attempt) for attempt in attempts],
+                    connection.execute(CHOSEN, params),
+                )
+                if attempt_ids:
+                    connection.execute(
+                        REGRADE_ATTEMPTS,
+                        {
+                            "attempt_ids": attempt_ids,
+                            "scores": scores,
+                            "quiz": quiz_id,
+                        },
+                    )
+                    connection.execute(
+                        REFRESH_POINTS,
+                        {"attempt_ids": attempt_ids, "quiz": quiz_id},
+                    )
+                connection.execute(REGRADE_SUBMISSIONS, params)
+        return primary.execute(
+            ADVANCE,
+            {
+                "pk": regrade_id,
+                "last_submission_id": (
+                    submission_ids[-1]
+                    if submission_ids
+                    else regrade.last_submission_id
+                ),
+                "count": len(submission_ids),
+                "finished": len(submission_ids) < chunk_size,
+            },
+        ).one()
+
+
+def regrade(regrade_id: UUID, chunk_size: Optional[int] = None) -> None:
+    chunk_size = chunk_size or settings.REGRADE_CHUNK_SIZE
+    quiz_id = None
+    while True:
+        progress = regrade_chunk(regrade_id, chunk_size)
+        if progress is None:
+            break
+        quiz_id = progress.quiz_id
+        logger.info(
+            "Regraded %d of %d submissions of quiz %s"
+            % (progress.regraded, progress.submissions, quiz_id)
+        )
+    if quiz_id is not None:
+        sketches.rebuild([quiz_id])
+
+
+def resume(chunk_size: Optional[int] = None) -> None:
+    with engine.connect() as connection:
+        regrade_ids = connection.scalars(UNFINISHED).all()
+    for regrade_id in regrade_ids:
+        regrade(regrade_id, chunk_size)
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = ArgumentParser(prog="python -m app.db.regrade")
+    parser.add_argument("--quiz", type=UUID, action="append", dest="quizzes")
+    parser.add_argument("--chunk-size", type=int)
+    args = parser.parse_args()
+    if args.quizzes is None:
+        resume(args.chunk_size)
+    for quiz_id in args.quizzes or []:
+        regrade(start(quiz_id).id, args.chunk_size)
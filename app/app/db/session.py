@@ -1,6 +1,198 @@
+from logging import getLogger
+from random import choice
+from threading import Lock
+from time import monotonic
+from typing import Any, Optional
+
 from app.core.config import settings
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from app.core.metrics import instrument_engine
+from app.db.shards import DEFAULT_SHARD, ShardRouter, is_sharded
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import ORMExecuteState, Session, raiseload, sessionmaker
+
+# WAL positions are compared as byte offsets
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+    "END AS lag, pg_last_wal_replay_lsn() - '0/0' AS replayed"
+)
+CURRENT_LSN = text("SELECT pg_current_wal_lsn() - '0/0'")
+
+logger = getLogger(__name__)
+
+
+def make_engine(url: str, name: str) -> Engine:
+    connect_args = {}
+    # Only psycopg 3 can turn repeated statements into server-side prepared
+    # statements; psycopg2 always sends the full SQL text.
+    if settings.DB_PREPARE_THRESHOLD is not None and url.startswith(
+        "postgresql+psycopg:"
+    ):
+        connect_args["prepare_threshold"] = settings.DB_PREPARE_THRESHOLD
+    engine = create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_POOL_MAX_OVERFLOW,
+        connect_args=connect_args,
+    )
+    instrument_engine(engine, name)
+    return engine
+
+
+class Replica:
+    def __init__(self, engine: Engine):
+        """
+        Replica engine with a cached view of its replication progress.
+
+        `replayed` is the WAL position of the primary up to which the
+        replica is known to have replayed its writes, or `None` when it
+        could not be measured.
+        """
+        self.engine = engine
+        self.replayed: Optional[int] = None
+        self.lag: Optional[float] = None
+        self._checked_at = float("-inf")
+        self._lock = Lock()
+
+    def refresh(self) -> None:
+        if monotonic() - self._checked_at < settings.REPLICA_LAG_CHECK_SECONDS:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                with self.engine.connect() as connection:
+                    row = connection.execute(REPLICA_LAG_QUERY).one()
+                lag, replayed = float(row.lag), int(row.replayed)
+            except (SQLAlchemyError, TypeError):
+                self.lag = None
+                self.replayed = None
+            else:
+                self.lag = lag
+                self.replayed = replayed
+            self._checked_at = monotonic()
+        finally:
+            self._lock.release()
+
+    def serves(self, min_lsn: int) -> bool:
+        self.refresh()
+        return (
+            self.lag is not None
+            and self.lag <= settings.REPLICA_MAX_LAG_SECONDS
+            and self.replayed >= min_lsn
+        )
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads of read-only sessions to a replica.
+
+    A session is read-only when `info["read_only"]` is set. Its reads go to
+    a replica that is within `REPLICA_MAX_LAG_SECONDS` and has replayed the
+    WAL of the primary up to `info["min_lsn"]`, falling back to the primary
+    when no replica qualifies. Flushes and DML always go to the primary.
+
+    A session pinned to a shard through `info["shard"]` sends everything on
+    the sharded tables to that shard instead; see `app.db.shards`.
+    """
+
+    _read_bind: Optional[Engine] = None
+
+    def get_bind(self, mapper=None, *, clause=None, **kw: Any) -> Engine:
+        shard = self.info.get("shard", DEFAULT_SHARD)
+        if shard != DEFAULT_SHARD and is_sharded(mapper, clause):
+            return shards.engines[shard]
+        if (
+            not self.info.get("read_only")
+            or self._flushing
+            or getattr(clause, "is_dml", False)
+        ):
+            return super().get_bind(mapper, clause=clause, **kw)
+        if self._read_bind is None:
+            candidates = [
+                replica.engine
+                for replica in replicas
+                if replica.serves(self.info.get("min_lsn", 0))
+            ]
+            self._read_bind = (
+                choice(candidates)
+                if candidates
+                else super().get_bind(mapper, clause=clause, **kw)
+            )
+        return self._read_bind
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def mark_written(session: Session, flush_context: Any) -> None:
+    session.info["written"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def mark_dml_written(orm_execute_state: ORMExecuteState) -> None:
+    # INSERT/UPDATE statements executed directly bypass the flush
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["written"] = True
+
+
+def raise_on_lazy_load(orm_execute_state: ORMExecuteState) -> None:
+    """
+    Make every relationship of the loaded objects raise instead of emitting
+    a lazy load, so that N+1 access fails loudly.
+    """
+    if (
+        orm_execute_state.is_select
+        and not orm_execute_state.is_column_load
+        and not orm_execute_state.is_relationship_load
+    ):
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            raiseload("*", sql_only=True)
+        )
+
+
+if settings.DB_RAISE_ON_LAZY_LOAD:
+    event.listen(RoutingSession, "do_orm_execute", raise_on_lazy_load)
+
+
+def current_lsn() -> Optional[int]:
+    try:
+        with engine.connect() as connection:
+            return int(connection.execute(CURRENT_LSN).scalar())
+    except SQLAlchemyError:
+        logger.exception("Could not read the WAL position of the primary")
+        return None
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def record_commit(session: Session) -> None:
+    """
+    Hand the WAL position of the primary once a session that wrote has
+    committed, which covers the commit, to `info["on_commit"]`.
+    """
+    on_commit = session.info.get("on_commit")
+    if session.info.pop("written", False) and on_commit is not None:
+        lsn = current_lsn()
+        if lsn is not None:
+            on_commit(lsn)
+
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = make_engine(settings.SQLALCHEMY_DATABASE_URI, "primary")
+replicas = [
+    Replica(make_engine(url, f"replica-{i}"))
+    for i, url in enumerate(settings.SQLALCHEMY_REPLICA_URIS)
+]
+shards = ShardRouter(
+    {
+        DEFAULT_SHARD: engine,
+        **{
+            name: make_engine(url, f"shard-{name}")
+            for name, url in settings.SQLALCHEMY_SHARD_URIS.items()
+        },
+    },
+    settings.SHARD_OVERRIDES,
+)
+SessionLocal = sessionmaker(
+    class_=RoutingSession, autocommit=False, autoflush=False, bind=engine
+)
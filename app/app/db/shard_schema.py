@@ -0,0 +1,79 @@
+"""
+Schema of the shards other than the primary.
+
+The primary's schema is autogenerated by Alembic. A shard only holds the
+sharded tables, without the foreign keys to `users` and `quizzes` that live
+in the primary, and is brought up to date the same way, by applying
+whatever autogenerate finds missing, after moving unpartitioned `attempts`
+and `solutions` into partitioned tables as `app.db.partitions` does:
+
+    $ python -m app.db.shard_schema
+"""
+from logging import INFO, basicConfig, getLogger
+from typing import Any
+
+from alembic.autogenerate import produce_migrations
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from alembic.operations.ops import MigrateOperation, ModifyTableOps
+from app.core.config import settings
+from app.db import partitions
+from app.db.base import Base
+from app.db.session import shards
+from app.db.shards import DEFAULT_SHARD, SHARDED_TABLES
+from sqlalchemy import MetaData
+from sqlalchemy.engine import Engine
+
+logger = getLogger(__name__)
+
+
+def shard_metadata() -> MetaData:
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        if table.name not in SHARDED_TABLES:
+            continue
+        copy = table.to_metadata(metadata)
+        for constraint in list(copy.foreign_key_constraints):
+            referred, _ = constraint.elements[0].target_fullname.split(".")
+            if referred in SHARDED_TABLES:
+                continue
+            copy.constraints.discard(constraint)
+            for element in constraint.elements:
+                element.parent.foreign_keys.discard(element)
+                copy.foreign_keys.discard(element)
+    return metadata
+
+
+def include_object(
+    object: Any, name: str, type_: str, reflected: bool, compare_to: Any
+) -> bool:
+    return partitions.include_object(
+        object, name, type_, reflected, compare_to
+    ) and (type_ != "table" or name in SHARDED_TABLES)
+
+
+def run(operations: Operations, ops: list[MigrateOperation]) -> None:
+    for op in ops:
+        if isinstance(op, ModifyTableOps):
+            run(operations, op.ops)
+        else:
+            operations.invoke(op)
+
+
+def upgrade(engine: Engine) -> None:
+    metadata = shard_metadata()
+    partitions.convert(engine, metadata, settings.PARTITION_MONTHS_AHEAD)
+    with engine.begin() as connection:
+        context = MigrationContext.configure(
+            connection, opts={"include_object": include_object}
+        )
+        migrations = produce_migrations(context, metadata)
+        run(Operations(context), migrations.upgrade_ops.ops)
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    for name, engine in shards.engines.items():
+        if name != DEFAULT_SHARD:
+            logger.info("Upgrading the schema of shard %s" % name)
+            upgrade(engine)
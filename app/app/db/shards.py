@@ -0,0 +1,138 @@
+"""
+Routing of quiz data to shards.
+
+`users` and `quizzes` live in the primary database. The rows that belong to
+a quiz (its questions, answers, submissions and their counters, attempts,
+solutions and score sketches) live together on the shard the quiz maps to:
+the one `SHARD_OVERRIDES` names for it, otherwise its place on a
+consistent-hash ring over the primary (shard `default`) and
+`SQLALCHEMY_SHARD_URIS`.
+
+Sessions are pinned to a shard through `info["shard"]`, which
+`RoutingSession.get_bind` honors for the sharded tables. The CRUD layer
+pins them with `use_quiz` when it knows the quiz, and with `locate` when it
+only knows the id of a row of the quiz.
+"""
+from bisect import bisect
+from contextlib import contextmanager
+from hashlib import blake2b
+from typing import Any, Iterator, Optional, Type
+from uuid import UUID
+
+from app.db.base_class import Base
+from sqlalchemy import bindparam, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper, Session
+
+DEFAULT_SHARD = "default"
+SHARDED_TABLES = frozenset(
+    {
+        "questions",
+        "answers",
+        "submissions",
+        "submission_counters",
+        "attempts",
+        "solutions",
+        "quiz_score_sketches",
+        "collusion_flags",
+        "audit_events",
+        "outbox_events",
+    }
+)
+VIRTUAL_NODES = 64
+
+
+def ring_position(key: str) -> int:
+    return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def is_sharded(mapper: Optional[Mapper], clause: Any) -> bool:
+    if mapper is not None:
+        return mapper.local_table.name in SHARDED_TABLES
+    table = getattr(clause, "table", None)
+    if table is not None:
+        return table.name in SHARDED_TABLES
+    froms = getattr(clause, "get_final_froms", list)()
+    return any(getattr(f, "name", None) in SHARDED_TABLES for f in froms)
+
+
+class ShardRouter:
+    def __init__(
+        self,
+        engines: dict[str, Engine],
+        overrides: Optional[dict[UUID, str]] = None,
+    ):
+        """
+        Map quizzes to the engines of their shard.
+
+        Each shard owns `VIRTUAL_NODES` points of the ring, and a quiz goes
+        to the owner of the first point after its own position, so adding
+        a shard only moves the quizzes that land on its new points.
+        """
+        self.engines = engines
+        self.overrides = overrides or {}
+        unknown = set(self.overrides.values()) - set(engines)
+        if unknown:
+            raise ValueError(f"SHARD_OVERRIDES names unknown shards {unknown}")
+        ring = sorted(
+            (ring_position(f"{name}#{i}"), name)
+            for name in engines
+            for i in range(VIRTUAL_NODES)
+        )
+        self._positions = [position for position, _ in ring]
+        self._names = [name for _, name in ring]
+
+    def shard_for(self, quiz_id: UUID) -> str:
+        if quiz_id in self.overrides:
+            return self.overrides[quiz_id]
+        index = bisect(self._positions, ring_position(str(quiz_id)))
+        return self._names[index % len(self._names)]
+
+    def engine_for(self, quiz_id: UUID) -> Engine:
+        return self.engines[self.shard_for(quiz_id)]
+
+    def use_quiz(self, db: Session, quiz_id: UUID) -> None:
+        db.info["shard"] = self.shard_for(quiz_id)
+
+    def locate(
+        self, db: Session, model: Type[Base], id: UUID
+    ) -> Optional[str]:
+        """
+        Pin the session to the shard holding the row of `model` with `id`,
+        unless it is pinned already, and return the shard. The shards are
+        probed in turn; the session is left unpinned when none has the row.
+        """
+        if len(self.engines) == 1 or "shard" in db.info:
+            return db.info.get("shard")
+        statement = select(model.id).where(model.id == bindparam("id"))
+        for name in self.engines:
+            db.info["shard"] = name
+            if db.scalar(statement, {"id": id}) is not None:
+                return name
+        del db.info["shard"]
+        return None
+
+    @contextmanager
+    def pin(self, db: Session, name: str) -> Iterator[None]:
+        """
+        Pin the session to the shard `name` meanwhile, restoring the pin it
+        had once done.
+        """
+        pinned = db.info.get("shard")
+        db.info["shard"] = name
+        try:
+            yield
+        finally:
+            if pinned is None:
+                db.info.pop("shard", None)
+            else:
+                db.info["shard"] = pinned
+
+    def each(self, db: Session) -> Iterator[str]:
+        """
+        Pin the session to every shard in turn, restoring the pin it had
+        once done.
+        """
+        for name in self.engines:
+            with self.pin(db, name):
+                yield name
@@ -0,0 +1,210 @@
+"""
+Rebuild of the score sketches of quizzes from their submissions.
+
+`CRUDSubmission.submit` adds every score to the sketch of its quiz as it is
+submitted, but a sketch cannot forget a score. Rebuild the sketches once to
+cover the submissions made before they existed, and again after scores
+changed or left: after regrading, purging users or moving quizzes between
+shards:
+
+    $ python -m app.db.sketches --jobs 4
+    $ python -m app.db.sketches --quiz QUIZ_ID
+
+The submissions of every shard are split into `--partitions` by a hash of
+their id, worker processes summarize each partition into a sketch per quiz,
+and the sketches of the partitions are merged. The partitions only read
+submissions updated until `CUTOFF_MARGIN` before the rebuild started. The
+ones updated since are read while the sketches of the shard are locked
+against submits, and the sketches are replaced in that same transaction,
+so no score is counted twice, or lost unless its submit took longer than
+the margin.
+"""
+from argparse import ArgumentParser
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import starmap
+from logging import INFO, basicConfig, getLogger
+from multiprocessing import get_context
+from typing import Iterator, Optional
+from uuid import UUID
+
+from app.core.sketch import ScoreSketch
+from app.db.base_class import uuid7
+from app.db.session import shards
+from app.models import QuizScoreSketch, Submission
+from sqlalchemy import (
+    Column,
+    String,
+    bindparam,
+    cast,
+    delete,
+    func,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.sql.base import Executable
+
+logger = getLogger(__name__)
+
+CUTOFF_MARGIN = timedelta(minutes=1)
+CHUNK_SIZE = 10_000
+
+NOW = select(func.now())
+SCORES = select(Submission.quiz_id, Submission.score).where(
+    ~Submission.draft, Submission.score.is_not(None)
+)
+PARTITIONS = bindparam("partitions")
+PARTITION_SCORES = SCORES.where(
+    Submission.updated_at < bindparam("cutoff"),
+    # hashtext() is signed, so its remainder is shifted to be positive
+    func.mod(
+        func.mod(func.hashtext(cast(Submission.id, String)), PARTITIONS)
+        + PARTITIONS,
+        PARTITIONS,
+    )
+    == bindparam("partition"),
+)
+LATE_SCORES = SCORES.where(Submission.updated_at >= bindparam("cutoff"))
+# Conflicts with the lock of the upsert of `CRUDSubmission.submit`, not with
+# the reads of the sketches
+LOCK_SKETCHES = text(
+    f"LOCK TABLE {QuizScoreSketch.__tablename__} "
+    "IN SHARE ROW EXCLUSIVE MODE"
+)
+DELETE_SKETCHES = delete(QuizScoreSketch)
+INSERT_SKETCHES = insert(QuizScoreSketch)
+
+
+def of_quizzes(
+    statement: Executable, quiz_id: Column, quiz_ids: Optional[list[UUID]]
+) -> Executable:
+    if quiz_ids is None:
+        return statement
+    return statement.where(quiz_id.in_(quiz_ids))
+
+
+def forget_connections() -> None:
+    # A forked worker must not use the connections of its parent
+    for bind in shards.engines.values():
+        bind.dispose(close=False)
+
+
+def summarize(
+    shard: str,
+    partition: int,
+    partitions: int,
+    cutoff: datetime,
+    quiz_ids: Optional[list[UUID]],
+) -> dict[UUID, ScoreSketch]:
+    """
+    Sketch the scores of one partition of the submissions of a shard.
+    """
+    sketches: dict[UUID, ScoreSketch] = defaultdict(ScoreSketch)
+    with shards.engines[shard].connect() as connection:
+        result = connection.execution_options(yield_per=CHUNK_SIZE).execute(
+            of_quizzes(PARTITION_SCORES, Submission.quiz_id, quiz_ids),
+            {
+                "cutoff": cutoff,
+                "partition": partition,
+                "partitions": partitions,
+            },
+        )
+        for rows in result.partitions():
+            scores = defaultdict(list)
+            for quiz_id, score in rows:
+                scores[quiz_id].append(score)
+            for quiz_id, values in scores.items():
+                sketches[quiz_id].update(values)
+    for sketch in sketches.values():
+        sketch.digest.compress()
+    return dict(sketches)
+
+
+def replace(
+    shard: str,
+    sketches: dict[UUID, ScoreSketch],
+    cutoff: datetime,
+    quiz_ids: Optional[list[UUID]],
+) -> int:
+    with shards.engines[shard].begin() as connection:
+        connection.execute(LOCK_SKETCHES)
+        for quiz_id, score in connection.execute(
+            of_quizzes(LATE_SCORES, Submission.quiz_id, quiz_ids),
+            {"cutoff": cutoff},
+        ):
+            sketches.setdefault(quiz_id, ScoreSketch()).update((score,))
+        connection.execute(
+            of_quizzes(DELETE_SKETCHES, QuizScoreSketch.quiz_id, quiz_ids)
+        )
+        if sketches:
+            connection.execute(
+                INSERT_SKETCHES,
+                [
+                    {
+                        "id": uuid7(),
+                        "quiz_id": quiz_id,
+                        "stripe": 0,
+                        "count": sketch.count,
+                        "total": sketch.total,
+                        "total_squares": sketch.total_squares,
+                        "digest": sketch.digest.to_bytes(),
+                        "pending": [],
+                    }
+                    for quiz_id, sketch in sketches.items()
+                ],
+            )
+    return len(sketches)
+
+
+def run(tasks: list[tuple], jobs: int) -> Iterator[dict[UUID, ScoreSketch]]:
+    if jobs <= 1:
+        yield from starmap(summarize, tasks)
+        return
+    with ProcessPoolExecutor(
+        jobs, mp_context=get_context("fork"), initializer=forget_connections
+    ) as pool:
+        yield from pool.map(summarize, *zip(*tasks))
+
+
+def rebuild(
+    quiz_ids: Optional[list[UUID]] = None,
+    jobs: int = 1,
+    partitions: Optional[int] = None,
+) -> None:
+    """
+    Rebuild the score sketches of `quiz_ids`, or of every quiz, with `jobs`
+    worker processes summarizing `partitions` partitions of every shard.
+    """
+    partitions = partitions or jobs
+    cutoffs = {}
+    for name, bind in shards.engines.items():
+        with bind.connect() as connection:
+            cutoffs[name] = connection.scalar(NOW) - CUTOFF_MARGIN
+    tasks = [
+        (name, partition, partitions, cutoffs[name], quiz_ids)
+        for name in shards.engines
+        for partition in range(partitions)
+    ]
+    merged: dict[str, dict[UUID, ScoreSketch]] = {
+        name: defaultdict(ScoreSketch) for name in shards.engines
+    }
+    for (name, *_), sketches in zip(tasks, run(tasks, jobs)):
+        for quiz_id, sketch in sketches.items():
+            merged[name][quiz_id].merge(sketch)
+    for name, sketches in merged.items():
+        count = replace(name, dict(sketches), cutoffs[name], quiz_ids)
+        logger.info("Rebuilt %d score sketches on %s" % (count, name))
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = ArgumentParser(prog="python -m app.db.sketches")
+    parser.add_argument("--quiz", type=UUID, action="append", dest="quizzes")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument(
+        "--partitions", type=int, help="per shard, defaults to --jobs"
+    )
+    args = parser.parse_args()
+    rebuild(args.quizzes, args.jobs, args.partitions)
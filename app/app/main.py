@@ -1,10 +1,70 @@
+from asyncio import Task, create_task, to_thread
+from typing import Optional
+
 from app.api.v1.api import api_router
 from app.core.config import settings
-from fastapi import FastAPI
+from app.core.metrics import PrometheusMiddleware, render_metrics
+from app.db import audit, drafts, outbox
+from fastapi import FastAPI, Response
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
 )
 
+app.add_middleware(PrometheusMiddleware)
 app.include_router(api_router, prefix=settings.API_V1_STR)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+draft_checkpoints: Optional[Task] = None
+
+
+@app.on_event("startup")
+async def start_draft_checkpoints() -> None:
+    global draft_checkpoints
+    if drafts.store is not None:
+        draft_checkpoints = create_task(drafts.checkpoint_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_draft_checkpoints() -> None:
+    if draft_checkpoints is not None:
+        draft_checkpoints.cancel()
+        await to_thread(drafts.checkpoint)
+
+
+audit_flushes: Optional[Task] = None
+
+
+@app.on_event("startup")
+async def start_audit_flushes() -> None:
+    global audit_flushes
+    audit_flushes = create_task(audit.flush_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_audit_flushes() -> None:
+    if audit_flushes is not None:
+        audit_flushes.cancel()
+    await to_thread(audit.close)
+
+
+outbox_relays: Optional[Task] = None
+
+
+@app.on_event("startup")
+async def start_outbox_relays() -> None:
+    global outbox_relays
+    outbox_relays = create_task(outbox.relay_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_outbox_relays() -> None:
+    if outbox_relays is not None:
+        outbox_relays.cancel()
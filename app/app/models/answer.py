@@ -1,17 +1,26 @@
 from app.db.base_class import Base
-from sqlalchemy import Column, Double, ForeignKey, String
+from sqlalchemy import Boolean, Column, Double, ForeignKey, String
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
 
 class Answer(Base):
     __tablename__ = "answers"
-    question_id = Column(UUID, ForeignKey("questions.id"), index=True)
-    answer_text = Column(String, nullable=False)
-    point = Column(Double, nullable=False)
-    question = relationship(
-        "Question", back_populates="answer", cascade="all, delete"
+    question_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("questions.id", ondelete="CASCADE"),
+        index=True,
     )
+    answer_text = Column(String, nullable=False)
+    # Null for answers created before the column until app.db.backfill
+    # derives it from their point
+    is_correct = Column(Boolean, default=False)
+    point = Column(Double, nullable=False, default=0)
+    question = relationship("Question", back_populates="answer", lazy="select")
     solution = relationship(
-        "Solution", back_populates="answer", cascade="all, delete"
+        "Solution",
+        back_populates="answer",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
     )
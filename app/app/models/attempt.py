@@ -5,6 +5,7 @@ from sqlalchemy import (
     Double,
     ForeignKey,
     Interval,
+    PrimaryKeyConstraint,
     UniqueConstraint,
 )
 from sqlalchemy.dialects.postgresql import UUID
@@ -13,19 +14,49 @@ from sqlalchemy.orm import relationship
 
 class Attempt(Base):
     __tablename__ = "attempts"
-    question_id = Column(UUID, ForeignKey("questions.id"), index=True)
-    submission_id = Column(UUID, ForeignKey("submissions.id"), index=True)
+    question_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("questions.id", ondelete="CASCADE"),
+        index=True,
+    )
+    submission_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("submissions.id", ondelete="CASCADE"),
+        index=True,
+    )
+    # Denormalized from the submission so that authorization and per-quiz
+    # aggregates do not have to join through it. Also the partition key,
+    # see `app.db.partitions`
+    quiz_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("quizzes.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        index=True,
+    )
     draft = Column(Boolean, nullable=False, default=True)
     skipped = Column(Boolean, nullable=False, default=False)
     time_remaining = Column(Interval, nullable=True, default=None)
     score = Column(Double, nullable=True, default=None)
     question = relationship(
-        "Question", back_populates="attempt", cascade="all, delete"
+        "Question", back_populates="attempt", lazy="select"
     )
     submission = relationship(
-        "Submission", back_populates="attempt", cascade="all, delete"
+        "Submission", back_populates="attempt", lazy="select"
     )
     solution = relationship(
-        "Solution", back_populates="attempt", cascade="all, delete"
+        "Solution",
+        back_populates="attempt",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
+    )
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "quiz_id"),
+        UniqueConstraint("question_id", "submission_id", "quiz_id"),
+        {"postgresql_partition_by": "RANGE (quiz_id)"},
     )
-    __table_args__ = (UniqueConstraint("question_id", "submission_id"),)
@@ -0,0 +1,17 @@
+from app.db.base_class import Base
+from sqlalchemy import Column, String
+from sqlalchemy.dialects.postgresql import UUID
+
+
+class AuditEvent(Base):
+    __tablename__ = "audit_events"
+    # An `app.db.audit.AuditAction`, such as `submission.submit`
+    action = Column(String, nullable=False)
+    # No foreign keys: events are written in bulk with `COPY` and are never
+    # updated, so they are not checked against the rows they are about
+    quiz_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    submission_id = Column(UUID(as_uuid=True), nullable=True, index=True)
+    attempt_id = Column(UUID(as_uuid=True), nullable=True)
+    solution_id = Column(UUID(as_uuid=True), nullable=True)
+    answer_id = Column(UUID(as_uuid=True), nullable=True)
@@ -0,0 +1,30 @@
+from app.db.base_class import Base
+from sqlalchemy import Column, Double, ForeignKey, Integer, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+
+
+class CollusionFlag(Base):
+    __tablename__ = "collusion_flags"
+    quiz_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("quizzes.id", ondelete="CASCADE"),
+        index=True,
+    )
+    # The pair is stored once, with the smaller submission id first
+    submission_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("submissions.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    other_submission_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("submissions.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # Jaccard similarity of the answers both submissions chose
+    similarity = Column(Double, nullable=False)
+    shared_incorrect = Column(Integer, nullable=False)
+    __table_args__ = (
+        UniqueConstraint("submission_id", "other_submission_id"),
+    )
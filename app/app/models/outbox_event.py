@@ -0,0 +1,27 @@
+from app.db.base_class import Base
+from sqlalchemy import BigInteger, Column, DateTime, Index, String, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    # An `app.db.outbox.Topic`, such as `submission.submitted`
+    topic = Column(String, nullable=False)
+    # No foreign keys: an event outlives the rows it is about until its
+    # consumers have read it
+    quiz_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), nullable=True, index=True)
+    # The submission or quiz that changed
+    subject_id = Column(UUID(as_uuid=True), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    # Numbered by the relay, in the order it publishes the events of the
+    # shard; `None` until then
+    position = Column(BigInteger, nullable=True, unique=True)
+    published_at = Column(DateTime(timezone=True), nullable=True)
+    __table_args__ = (
+        Index(
+            "ix_outbox_events_unpublished",
+            "id",
+            postgresql_where=text("position IS NULL"),
+        ),
+    )
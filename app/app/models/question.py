@@ -1,21 +1,32 @@
 from app.db.base_class import Base
-from sqlalchemy import Boolean, Column, ForeignKey, Interval, String
+from sqlalchemy import Boolean, Column, Double, ForeignKey, Interval, String
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
 
 class Question(Base):
     __tablename__ = "questions"
-    quiz_id = Column(UUID, ForeignKey("quizzes.id"), index=True)
+    quiz_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("quizzes.id", ondelete="CASCADE"),
+        index=True,
+    )
     question_text = Column(String, nullable=False)
     duration = Column(Interval, nullable=True, default=None)
     resumable = Column(Boolean, nullable=False, default=False)
-    quiz = relationship(
-        "Quiz", back_populates="question", cascade="all, delete"
-    )
+    weight = Column(Double, nullable=False, default=1, server_default="1")
+    quiz = relationship("Quiz", back_populates="question", lazy="select")
     answer = relationship(
-        "Answer", back_populates="question", cascade="all, delete"
+        "Answer",
+        back_populates="question",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
     )
     attempt = relationship(
-        "Attempt", back_populates="question", cascade="all, delete"
+        "Attempt",
+        back_populates="question",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
     )
@@ -1,21 +1,50 @@
+from app.core.scoring import ScoringMethod
 from app.db.base_class import Base
-from sqlalchemy import Boolean, Column, ForeignKey, Interval, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Double,
+    ForeignKey,
+    Interval,
+    String,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
 
 class Quiz(Base):
     __tablename__ = "quizzes"
-    author_id = Column(UUID, ForeignKey("users.id"), index=True)
+    author_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        index=True,
+    )
     title = Column(String, nullable=False)
     published = Column(Boolean, nullable=False, default=False)
     resumable = Column(Boolean, nullable=False, default=False)
     description = Column(String, nullable=True, default=None)
     duration = Column(Interval, nullable=True, default=None)
-    author = relationship("User", back_populates="quiz", cascade="all, delete")
+    scoring = Column(
+        String,
+        nullable=False,
+        default=ScoringMethod.PARTIAL_CREDIT.value,
+        server_default=ScoringMethod.PARTIAL_CREDIT.value,
+    )
+    score_floor = Column(Double, nullable=True, default=None)
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    author = relationship("User", back_populates="quiz", lazy="select")
     question = relationship(
-        "Question", back_populates="quiz", cascade="all, delete"
+        "Question",
+        back_populates="quiz",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
     )
     attempt = relationship(
-        "Submission", back_populates="quiz", cascade="all, delete"
+        "Submission",
+        back_populates="quiz",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
     )
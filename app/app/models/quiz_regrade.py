@@ -0,0 +1,27 @@
+from app.db.base_class import Base
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer
+from sqlalchemy.dialects.postgresql import UUID
+
+
+class QuizRegrade(Base):
+    __tablename__ = "quiz_regrades"
+    quiz_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("quizzes.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # Submitted submissions of the quiz when the regrade (re)started
+    submissions = Column(Integer, nullable=False, default=0)
+    regraded = Column(Integer, nullable=False, default=0)
+    # Submissions are regraded in id order; `None` until the first chunk
+    last_submission_id = Column(UUID(as_uuid=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    __table_args__ = (
+        # At most one running regrade per quiz
+        Index(
+            "ix_quiz_regrades_running",
+            "quiz_id",
+            unique=True,
+            postgresql_where=finished_at.is_(None),
+        ),
+    )
@@ -0,0 +1,29 @@
+from app.db.base_class import Base
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Double,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+
+
+class QuizScoreSketch(Base):
+    __tablename__ = "quiz_score_sketches"
+    quiz_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("quizzes.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    stripe = Column(Integer, nullable=False, default=0)
+    count = Column(BigInteger, nullable=False, default=0)
+    total = Column(Double, nullable=False, default=0)
+    total_squares = Column(Double, nullable=False, default=0)
+    # `TDigest.to_bytes` of the scores folded so far
+    digest = Column(LargeBinary, nullable=True, default=None)
+    # Scores added since the last fold
+    pending = Column(ARRAY(Double), nullable=False, default=list)
+    __table_args__ = (UniqueConstraint("quiz_id", "stripe"),)
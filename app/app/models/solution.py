@@ -1,18 +1,52 @@
 from app.db.base_class import Base
-from sqlalchemy import Column, Double, ForeignKey, UniqueConstraint
+from sqlalchemy import (
+    Column,
+    Double,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    PrimaryKeyConstraint,
+    UniqueConstraint,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
 
 class Solution(Base):
     __tablename__ = "solutions"
-    attempt_id = Column(UUID, ForeignKey("attempts.id"), index=True)
-    answer_id = Column(UUID, ForeignKey("answers.id"), index=True)
-    point = Column(Double, nullable=False)
-    attempt = relationship(
-        "Attempt", back_populates="solution", cascade="all, delete"
+    attempt_id = Column(UUID(as_uuid=True))
+    answer_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("answers.id", ondelete="CASCADE"),
+        index=True,
+    )
+    # Denormalized from the attempt so that authorization and per-quiz
+    # aggregates do not have to join through it. Also the partition key,
+    # see `app.db.partitions`
+    quiz_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("quizzes.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
     )
-    answer = relationship(
-        "Answer", back_populates="solution", cascade="all, delete"
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        index=True,
+    )
+    point = Column(Double, nullable=False)
+    attempt = relationship("Attempt", back_populates="solution", lazy="select")
+    answer = relationship("Answer", back_populates="solution", lazy="select")
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "quiz_id"),
+        # Attempts are only unique with their partition key
+        ForeignKeyConstraint(
+            ["attempt_id", "quiz_id"],
+            ["attempts.id", "attempts.quiz_id"],
+            ondelete="CASCADE",
+        ),
+        # Serves the lookups of the foreign key when attempts are deleted
+        Index("ix_solutions_attempt_id_quiz_id", "attempt_id", "quiz_id"),
+        UniqueConstraint("answer_id", "attempt_id", "quiz_id"),
+        {"postgresql_partition_by": "RANGE (quiz_id)"},
     )
-    __table_args__ = (UniqueConstraint("answer_id", "attempt_id"),)
@@ -6,18 +6,29 @@ from sqlalchemy.orm import relationship
 
 class Submission(Base):
     __tablename__ = "submissions"
-    quiz_id = Column(UUID, ForeignKey("quizzes.id"), index=True)
-    user_id = Column(UUID, ForeignKey("users.id"), index=True)
-    draft = Column(String, nullable=False, default=True)
+    quiz_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("quizzes.id", ondelete="CASCADE"),
+        index=True,
+    )
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        index=True,
+    )
+    draft = Column(Boolean, nullable=False, default=True)
     paused = Column(Boolean, nullable=False, default=False)
     score = Column(Double, nullable=True, default=None)
     time_remaining = Column(Interval, nullable=True, default=None)
-    quiz = relationship(
-        "Quiz", back_populates="attempt", cascade="all, delete"
-    )
-    user = relationship(
-        "User", back_populates="submission", cascade="all, delete"
-    )
+    # The batch of `app.db.archive` holding its attempts and solutions once
+    # they are archived, relative to `ARCHIVE_DIR`
+    archive = Column(String, nullable=True, default=None)
+    quiz = relationship("Quiz", back_populates="attempt", lazy="select")
+    user = relationship("User", back_populates="submission", lazy="select")
     attempt = relationship(
-        "Attempt", back_populates="submission", cascade="all, delete"
+        "Attempt",
+        back_populates="submission",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
     )
@@ -0,0 +1,28 @@
+from app.db.base_class import Base
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    ForeignKey,
+    Integer,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import UUID
+
+
+class SubmissionCounter(Base):
+    __tablename__ = "submission_counters"
+    quiz_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("quizzes.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    count = Column(Integer, nullable=False, default=0)
+    __table_args__ = (
+        UniqueConstraint("quiz_id", "user_id"),
+        CheckConstraint("count >= 0"),
+    )
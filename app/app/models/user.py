@@ -1,5 +1,5 @@
 from app.db.base_class import Base
-from sqlalchemy import Column, String
+from sqlalchemy import Column, DateTime, String
 from sqlalchemy.orm import relationship
 
 
@@ -7,7 +7,18 @@ class User(Base):
     __tablename__ = "users"
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    quiz = relationship("Quiz", back_populates="author", cascade="all, delete")
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    quiz = relationship(
+        "Quiz",
+        back_populates="author",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
+    )
     submission = relationship(
-        "Submission", back_populates="user", cascade="all, delete"
+        "Submission",
+        back_populates="user",
+        cascade="all, delete",
+        lazy="raise_on_sql",
+        passive_deletes=True,
     )
@@ -4,12 +4,27 @@ from app.schemas.attempt import (  # noqa: F401
     AttemptCreate,
     AttemptUpdate,
 )
+from app.schemas.event import OutboxEvent, OutboxPage  # noqa: F401
+from app.schemas.live import (  # noqa: F401
+    LiveSubmitted,
+    LiveTime,
+    SolutionBatch,
+    SolutionBatchResult,
+    SolutionRejection,
+    SolutionSelection,
+)
 from app.schemas.question import (  # noqa: F401
     Question,
     QuestionCreate,
     QuestionUpdate,
 )
-from app.schemas.quiz import Quiz, QuizCreate, QuizUpdate  # noqa: F401
+from app.schemas.quiz import (  # noqa: F401
+    Quiz,
+    QuizCreate,
+    QuizRegrade,
+    QuizScores,
+    QuizUpdate,
+)
 from app.schemas.solution import (  # noqa: F401
     Solution,
     SolutionCreate,
@@ -22,4 +37,4 @@ from app.schemas.submission import (  # noqa: F401
 )
 from app.schemas.token import Token, TokenPayload  # noqa: F401
 from app.schemas.user import User, UserCreate, UserUpdate  # noqa: F401
-from app.schemas.utils import Health, ServerTime  # noqa: F401
+from app.schemas.utils import Health, Readiness, ServerTime  # noqa: F401
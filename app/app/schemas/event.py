@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Any, Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class OutboxEvent(BaseModel):
+    shard: str
+    position: int
+    topic: str
+    quiz_id: UUID
+    user_id: Optional[UUID] = None
+    subject_id: UUID
+    payload: dict[str, Any]
+    created_at: datetime
+    published_at: datetime
+
+
+class OutboxPage(BaseModel):
+    events: list[OutboxEvent]
+    # Pass it back to read the events that follow
+    cursor: str
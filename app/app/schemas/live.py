@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from typing import Literal, Optional
+from uuid import UUID
+
+from app.schemas.solution import Solution
+from app.schemas.submission import Submission
+from pydantic import BaseModel
+
+
+class SolutionSelection(BaseModel):
+    attempt_id: UUID
+    answer_id: UUID
+
+
+class SolutionBatch(BaseModel):
+    add: list[SolutionSelection] = []
+    delete: list[UUID] = []
+
+
+class SolutionRejection(BaseModel):
+    attempt_id: Optional[UUID] = None
+    answer_id: Optional[UUID] = None
+    id: Optional[UUID] = None
+    detail: str
+
+
+class SolutionBatchResult(BaseModel):
+    type: Literal["solutions"] = "solutions"
+    added: list[Solution] = []
+    deleted: list[UUID] = []
+    rejected: list[SolutionRejection] = []
+
+
+class LiveTime(BaseModel):
+    type: Literal["time"] = "time"
+    server_time: datetime
+    time_remaining: Optional[timedelta] = None
+    paused: bool
+
+
+class LiveSubmitted(BaseModel):
+    type: Literal["submitted"] = "submitted"
+    forced: bool
+    submission: Optional[Submission] = None
@@ -3,7 +3,7 @@ from typing import Optional
 from uuid import UUID
 
 from app.schemas.common import IntervalStr
-from pydantic import BaseModel
+from pydantic import BaseModel, NonNegativeFloat
 
 
 class QuestionBase(BaseModel):
@@ -14,12 +14,14 @@ class QuestionCreate(QuestionBase):
     question_text: str
     duration: Optional[IntervalStr] = None
     resumable: Optional[bool] = None
+    weight: NonNegativeFloat = 1
 
 
 class QuestionUpdate(QuestionBase):
     question_text: Optional[str] = None
     duration: Optional[IntervalStr] = None
     resumable: Optional[bool] = None
+    weight: Optional[NonNegativeFloat] = None
 
 
 class Question(QuestionBase):
@@ -28,6 +30,7 @@ class Question(QuestionBase):
     question_text: Optional[str] = None
     duration: Optional[timedelta] = None
     resumable: Optional[bool] = None
+    weight: Optional[float] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
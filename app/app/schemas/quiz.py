@@ -2,8 +2,9 @@ from datetime import datetime, timedelta
 from typing import Optional
 from uuid import UUID
 
+from app.core.scoring import ScoringMethod
 from app.schemas.common import IntervalStr
-from pydantic import BaseModel
+from pydantic import BaseModel, NonPositiveFloat
 
 
 class QuizBase(BaseModel):
@@ -15,6 +16,8 @@ class QuizCreate(QuizBase):
     resumable: bool = False
     description: Optional[str] = None
     duration: Optional[IntervalStr] = None
+    scoring: ScoringMethod = ScoringMethod.PARTIAL_CREDIT
+    score_floor: Optional[NonPositiveFloat] = None
 
 
 class QuizUpdate(QuizBase):
@@ -22,6 +25,8 @@ class QuizUpdate(QuizBase):
     resumable: Optional[bool] = None
     description: Optional[str] = None
     duration: Optional[IntervalStr] = None
+    scoring: Optional[ScoringMethod] = None
+    score_floor: Optional[NonPositiveFloat] = None
 
 
 class Quiz(QuizBase):
@@ -32,6 +37,8 @@ class Quiz(QuizBase):
     resumable: Optional[bool] = None
     description: Optional[str] = None
     duration: Optional[timedelta] = None
+    scoring: Optional[ScoringMethod] = None
+    score_floor: Optional[float] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -41,3 +48,26 @@ class Quiz(QuizBase):
 
 class QuizInDB(Quiz):
     pass
+
+
+class QuizScores(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    stddev: Optional[float] = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    # Keyed by percentile, e.g. "50" for the median
+    percentiles: dict[str, Optional[float]] = {}
+
+
+class QuizRegrade(BaseModel):
+    id: UUID
+    quiz_id: UUID
+    submissions: int
+    regraded: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
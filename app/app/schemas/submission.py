@@ -24,6 +24,7 @@ class Submission(SubmissionBase):
     draft: Optional[bool] = None
     score: Optional[float] = None
     time_remaining: Optional[timedelta] = None
+    attempt_ids: Optional[list[UUID]] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -7,5 +7,10 @@ class Health(BaseModel):
     condition: str
 
 
+class Readiness(Health):
+    database: bool
+    pool_saturated: bool
+
+
 class ServerTime(BaseModel):
     server_time: datetime
@@ -0,0 +1,17 @@
+from runpy import run_path
+
+from prometheus_client import multiprocess
+
+# Keep the defaults shipped with the base image and only add the hooks needed
+# by the prometheus multiprocess collector.
+globals().update(
+    {
+        key: value
+        for key, value in run_path("/gunicorn_conf.py").items()
+        if not key.startswith("__")
+    }
+)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
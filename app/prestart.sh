@@ -1,3 +1,21 @@
 #! /usr/bin/env bash
+# A failed step leaves the schema half migrated, which the next ones must
+# not build on
+set -e
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+# Move attempts and solutions created before partitioning into partitioned
+# tables before Alembic compares them to the models
+python -m app.db.partitions --convert
 alembic revision --autogenerate -m "generate_schema"
 alembic upgrade head
+python -m app.db.shard_schema
+python -m app.db.backfill
+# Create the partitions of the coming months
+python -m app.db.partitions
+# Finish purges of deleted quizzes and users interrupted by a restart
+python -m app.db.purge
+# Resume regrades interrupted by a restart
+python -m app.db.regrade
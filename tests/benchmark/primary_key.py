@@ -0,0 +1,127 @@
+"""
+Insert throughput and primary key index size with random vs time-ordered ids.
+
+Runs against the database in `SQLALCHEMY_URL` using scratch tables shaped
+like `attempts`, so it never touches application data:
+
+    $ PYTHONPATH=app python -m tests.benchmark.primary_key --seed 1000000
+"""
+from argparse import ArgumentParser
+from logging import INFO, Formatter, Logger, StreamHandler, getLogger
+from os import getenv
+from time import perf_counter
+from typing import Callable
+from uuid import UUID, uuid4
+
+from app.db.base_class import uuid7
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Double,
+    Interval,
+    MetaData,
+    Table,
+    create_engine,
+    insert,
+    text,
+)
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from sqlalchemy.engine import Engine
+
+logger: Logger = getLogger(__name__)
+handler: StreamHandler = StreamHandler()
+fmt: Formatter = Formatter("%(asctime)s %(levelname)s %(message)s")
+handler.setFormatter(fmt)
+handler.setLevel(INFO)
+logger.addHandler(handler)
+logger.setLevel(INFO)
+
+GENERATORS: dict[str, Callable[[], UUID]] = {"uuid4": uuid4, "uuid7": uuid7}
+
+
+class PrimaryKeyBenchmark:
+    def __init__(self, engine: Engine, batch_size: int = 10_000) -> None:
+        self.engine = engine
+        self.batch_size = batch_size
+        self.metadata = MetaData()
+
+    def table(self, name: str) -> Table:
+        return Table(
+            f"bench_pk_{name}",
+            self.metadata,
+            Column("id", PGUUID(as_uuid=True), primary_key=True),
+            Column("question_id", PGUUID(as_uuid=True), nullable=False),
+            Column("submission_id", PGUUID(as_uuid=True), nullable=False),
+            Column("draft", Boolean, nullable=False),
+            Column("time_remaining", Interval),
+            Column("score", Double),
+            extend_existing=True,
+        )
+
+    def insert(self, table: Table, generate: Callable[[], UUID], n: int):
+        question_id, submission_id = uuid4(), uuid4()
+        with self.engine.begin() as connection:
+            for start in range(0, n, self.batch_size):
+                rows = [
+                    {
+                        "id": generate(),
+                        "question_id": question_id,
+                        "submission_id": submission_id,
+                        "draft": True,
+                        "time_remaining": None,
+                        "score": None,
+                    }
+                    for _ in range(min(self.batch_size, n - start))
+                ]
+                connection.execute(insert(table), rows)
+
+    def sizes(self, table: Table) -> dict[str, int]:
+        with self.engine.connect() as connection:
+            return {
+                "table_bytes": connection.execute(
+                    text("SELECT pg_relation_size(:name)"),
+                    {"name": table.name},
+                ).scalar(),
+                "pkey_bytes": connection.execute(
+                    text("SELECT pg_relation_size(:name)"),
+                    {"name": f"{table.name}_pkey"},
+                ).scalar(),
+            }
+
+    def run(self, name: str, seed: int, n: int) -> dict[str, float]:
+        table = self.table(name)
+        table.drop(self.engine, checkfirst=True)
+        table.create(self.engine)
+        generate = GENERATORS[name]
+        try:
+            logger.info("Seed %d rows into %s" % (seed, table.name))
+            self.insert(table, generate, seed)
+            start = perf_counter()
+            self.insert(table, generate, n)
+            elapsed = perf_counter() - start
+            return {"rows_per_second": n / elapsed, **self.sizes(table)}
+        finally:
+            table.drop(self.engine)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--url", default=getenv("SQLALCHEMY_URL"))
+    parser.add_argument("--seed", type=int, default=1_000_000)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+    benchmark = PrimaryKeyBenchmark(
+        create_engine(args.url), batch_size=args.batch_size
+    )
+    for name in GENERATORS:
+        result = benchmark.run(name, args.seed, args.rows)
+        logger.info(
+            "%s: %.0f rows/s, table %.1f MiB, primary key %.1f MiB"
+            % (
+                name,
+                result["rows_per_second"],
+                result["table_bytes"] / 2**20,
+                result["pkey_bytes"] / 2**20,
+            )
+        )
@@ -0,0 +1,132 @@
+"""
+Regression benchmark of the CRUD layer and the endpoints of a live exam.
+
+Runs against the database the app is configured with (`POSTGRES_*` or
+`SQLALCHEMY_DATABASE_URI`), creating its own users and quiz and purging
+them afterwards. Record a baseline, then compare later runs against it;
+the comparison exits with status 1 when a metric regressed:
+
+    $ PYTHONPATH=app python -m tests.benchmark.regression run \\
+        --output baseline.json
+    $ PYTHONPATH=app python -m tests.benchmark.regression run \\
+        --output current.json --baseline baseline.json --threshold p50=0.1
+    $ PYTHONPATH=app python -m tests.benchmark.regression compare \\
+        baseline.json current.json
+"""
+from argparse import ArgumentParser, ArgumentTypeError
+from fnmatch import fnmatch
+from logging import INFO, Formatter, Logger, StreamHandler, getLogger
+from sys import exit
+
+from tests.benchmark.regression.harness import (
+    DEFAULT_MIN_DELTA_US,
+    DEFAULT_THRESHOLDS,
+    Harness,
+    compare,
+    load_report,
+    save,
+)
+
+logger: Logger = getLogger(__name__)
+handler: StreamHandler = StreamHandler()
+fmt: Formatter = Formatter("%(asctime)s %(levelname)s %(message)s")
+handler.setFormatter(fmt)
+handler.setLevel(INFO)
+logger.addHandler(handler)
+logger.setLevel(INFO)
+
+
+def threshold(value: str) -> tuple[str, float]:
+    metric, _, limit = value.partition("=")
+    try:
+        return metric, float(limit)
+    except ValueError:
+        raise ArgumentTypeError(f"expected METRIC=RATIO, got {value!r}")
+
+
+def run(args) -> dict:
+    # Imported here so that `compare` works without a database
+    from app.db.session import shards
+    from tests.benchmark.regression.cases import (
+        Dataset,
+        crud_cases,
+        endpoint_cases,
+    )
+
+    harness = Harness(
+        list(shards.engines.values()),
+        iterations=args.iterations,
+        warmup=args.warmup,
+    )
+    data = Dataset()
+    try:
+        for case in crud_cases(data) + endpoint_cases(data):
+            if args.only and not any(fnmatch(case.name, p) for p in args.only):
+                continue
+            result = harness.measure(case)
+            latency = result["latency_us"]
+            logger.info(
+                "%s: p50 %.0f us, p99 %.0f us, %.1f queries, %.1f KiB"
+                % (
+                    case.name,
+                    latency["p50"],
+                    latency["p99"],
+                    result["queries"],
+                    result["alloc_peak_kib"],
+                )
+            )
+    finally:
+        data.close()
+    report = harness.report()
+    save(report, args.output)
+    logger.info("Saved %d cases to %s" % (len(report["cases"]), args.output))
+    return report
+
+
+def check(args, baseline: dict, current: dict) -> None:
+    regressions = compare(
+        baseline,
+        current,
+        thresholds=dict(args.threshold),
+        min_delta_us=args.min_delta_us,
+    )
+    for regression in regressions:
+        logger.error("Regression %s" % regression)
+    if regressions:
+        exit(1)
+    logger.info("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="python -m tests.benchmark.regression")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--baseline")
+    run_parser.add_argument("--iterations", type=int, default=200)
+    run_parser.add_argument("--warmup", type=int, default=20)
+    run_parser.add_argument(
+        "--only", action="append", help="fnmatch pattern of case names"
+    )
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument(
+            "--threshold",
+            type=threshold,
+            action="append",
+            default=[],
+            help="METRIC=RATIO, e.g. p99=0.5; defaults: "
+            + ", ".join(f"{m}={r}" for m, r in DEFAULT_THRESHOLDS.items()),
+        )
+        subparser.add_argument(
+            "--min-delta-us", type=float, default=DEFAULT_MIN_DELTA_US
+        )
+    args = parser.parse_args()
+    if args.command == "run":
+        current = run(args)
+        if args.baseline:
+            check(args, load_report(args.baseline), current)
+    else:
+        check(args, load_report(args.baseline), load_report(args.current))
@@ -0,0 +1,261 @@
+"""
+Benchmark cases for every CRUD class and the endpoints of a live exam.
+
+`Dataset` creates an author with a published, resumable quiz and a
+candidate with a draft submission holding one solution per attempt, then
+purges both users when closed. Every CRUD case takes its own session, the
+way a request does, and every endpoint case goes through the ASGI app
+in-process.
+"""
+from typing import Any, Callable
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.crud import answer as answer_crud
+from app.crud import attempt as attempt_crud
+from app.crud import question as question_crud
+from app.crud import quiz as quiz_crud
+from app.crud import solution as solution_crud
+from app.crud import submission as submission_crud
+from app.crud import user as user_crud
+from app.db.purge import purge_user
+from app.db.session import SessionLocal
+from app.main import app
+from app.schemas import (
+    AnswerCreate,
+    QuestionCreate,
+    QuizCreate,
+    SolutionCreate,
+    SubmissionCreate,
+    UserCreate,
+)
+from fastapi.testclient import TestClient
+from httpx import Response
+from sqlalchemy.orm import Session
+
+from tests.benchmark.regression.harness import Case
+
+QUESTIONS = 5
+ANSWERS = 4
+
+
+class Dataset:
+    def __init__(self) -> None:
+        with SessionLocal() as db:
+            self.author = self.register(db)
+            self.candidate = self.register(db)
+            quiz = quiz_crud.create_with_author(
+                db,
+                obj_in=QuizCreate(title="benchmark", resumable=True),
+                author_id=self.author,
+            )
+            self.quiz = quiz.id
+            self.questions = []
+            self.answers = {}
+            for i in range(QUESTIONS):
+                question = question_crud.create_with_quiz(
+                    db,
+                    obj_in=QuestionCreate(question_text=f"question {i}"),
+                    quiz_id=self.quiz,
+                )
+                self.questions.append(question.id)
+                self.answers[question.id] = [
+                    answer_crud.create_with_question(
+                        db,
+                        obj_in=AnswerCreate(
+                            answer_text=f"answer {j}", is_correct=j == 0
+                        ),
+                        question_id=question.id,
+                    ).id
+                    for j in range(ANSWERS)
+                ]
+            answer_crud.adjust_points_by_quiz(db, quiz_id=self.quiz)
+            quiz_crud.publish(db, quiz_crud.get(db, self.quiz))
+            submission, _ = submission_crud.draft_with_attempts(
+                db,
+                obj_in=SubmissionCreate(),
+                user_id=self.candidate,
+                quiz_id=self.quiz,
+                max_submissions=1,
+            )
+            self.submission = submission.id
+            self.attempts = {
+                attempt.question_id: attempt.id
+                for attempt in attempt_crud.get_multi_by_submission(
+                    db, submission_id=self.submission
+                )
+            }
+            self.solutions = [
+                solution_crud.create_with_answer_attempt(
+                    db,
+                    obj_in=SolutionCreate(point=0),
+                    attempt_id=self.attempts[question_id],
+                    answer_id=self.answers[question_id][0],
+                    quiz_id=self.quiz,
+                    user_id=self.candidate,
+                ).id
+                for question_id in self.questions
+            ]
+        self.question = self.questions[0]
+        self.attempt = self.attempts[self.question]
+        # An answer the candidate has not chosen, to choose and unchoose
+        self.spare_answer = self.answers[self.question][1]
+
+    def register(self, db: Session) -> Any:
+        user = user_crud.create(
+            db,
+            obj_in=UserCreate(
+                email=f"{uuid4().hex}@benchmark.example.com",
+                password="benchmark",
+            ),
+        )
+        return user.id
+
+    def close(self) -> None:
+        purge_user(self.candidate)
+        purge_user(self.author)
+
+
+def with_session(call: Callable[[Session], Any]) -> Callable[[], Any]:
+    def run() -> Any:
+        with SessionLocal() as db:
+            return call(db)
+
+    return run
+
+
+def crud_cases(data: Dataset) -> list[Case]:
+    def toggle_solution(db: Session) -> None:
+        solution = solution_crud.create_with_answer_attempt(
+            db,
+            obj_in=SolutionCreate(point=0),
+            attempt_id=data.attempt,
+            answer_id=data.spare_answer,
+            quiz_id=data.quiz,
+            user_id=data.candidate,
+        )
+        solution_crud.delete(db, id=solution.id)
+
+    def pause_resume(db: Session) -> None:
+        submission_crud.pause(
+            db, id=data.submission, user_id=data.candidate, quiz_id=data.quiz
+        )
+        submission_crud.resume(db, id=data.submission, user_id=data.candidate)
+
+    cases: dict[str, Callable[[Session], Any]] = {
+        "user.get": lambda db: user_crud.get(db, data.candidate),
+        "quiz.get": lambda db: quiz_crud.get(db, data.quiz),
+        "quiz.get_multi_by_author": lambda db: quiz_crud.get_multi_by_author(
+            db, author_id=data.author
+        ),
+        "question.get": lambda db: question_crud.get(db, data.question),
+        "question.get_multi_by_quiz": (
+            lambda db: question_crud.get_multi_by_quiz(db, quiz_id=data.quiz)
+        ),
+        "question.count_by_quiz": lambda db: question_crud.count_by_quiz(
+            db, quiz_id=data.quiz
+        ),
+        "answer.get_multi_by_question": (
+            lambda db: answer_crud.get_multi_by_question(
+                db, question_id=data.question
+            )
+        ),
+        "answer.get_multi_by_quiz": lambda db: answer_crud.get_multi_by_quiz(
+            db, quiz_id=data.quiz
+        ),
+        "submission.get": lambda db: submission_crud.get(db, data.submission),
+        "submission.get_multi_by_user": (
+            lambda db: submission_crud.get_multi_by_user(
+                db, user_id=data.candidate
+            )
+        ),
+        "submission.get_live_state": (
+            lambda db: submission_crud.get_live_state(db, id=data.submission)
+        ),
+        "submission.get_score_sketch": (
+            lambda db: submission_crud.get_score_sketch(db, quiz_id=data.quiz)
+        ),
+        "submission.pause_resume": pause_resume,
+        "attempt.get": lambda db: attempt_crud.get(db, data.attempt),
+        "attempt.get_multi_by_submission": (
+            lambda db: attempt_crud.get_multi_by_submission(
+                db, submission_id=data.submission
+            )
+        ),
+        "solution.get": lambda db: solution_crud.get(db, data.solutions[0]),
+        "solution.get_multi_by_attempt": (
+            lambda db: solution_crud.get_multi_by_attempt(
+                db, attempt_id=data.attempt
+            )
+        ),
+        "solution.create_delete": toggle_solution,
+    }
+    return [
+        Case(f"crud.{name}", with_session(call))
+        for name, call in cases.items()
+    ]
+
+
+def endpoint_cases(data: Dataset) -> list[Case]:
+    client = TestClient(app)
+    v1 = settings.API_V1_STR
+    author = {"Authorization": f"Bearer {create_access_token(data.author)}"}
+    candidate = {
+        "Authorization": f"Bearer {create_access_token(data.candidate)}"
+    }
+
+    def ok(response: Response) -> Any:
+        response.raise_for_status()
+        return response.json()
+
+    def toggle_solution() -> None:
+        solution = ok(
+            client.post(
+                f"{v1}/solution/attempt/{data.attempt}"
+                f"/answer/{data.spare_answer}",
+                headers=candidate,
+            )
+        )
+        ok(client.delete(f"{v1}/solution/{solution['id']}", headers=candidate))
+
+    def pause_resume() -> None:
+        ok(
+            client.put(
+                f"{v1}/submission/pause/{data.submission}", headers=candidate
+            )
+        )
+        ok(
+            client.put(
+                f"{v1}/submission/resume/{data.submission}", headers=candidate
+            )
+        )
+
+    cases: dict[str, Callable[[], Any]] = {
+        "GET /time": lambda: ok(client.get(f"{v1}/time")),
+        "GET /quiz/{id}": lambda: ok(
+            client.get(f"{v1}/quiz/{data.quiz}", headers=author)
+        ),
+        "GET /quiz/scores/{id}": lambda: ok(
+            client.get(f"{v1}/quiz/scores/{data.quiz}", headers=author)
+        ),
+        "GET /question/quiz/{quiz_id}": lambda: ok(
+            client.get(f"{v1}/question/quiz/{data.quiz}", headers=candidate)
+        ),
+        "GET /submission/{id}": lambda: ok(
+            client.get(f"{v1}/submission/{data.submission}", headers=candidate)
+        ),
+        "GET /attempt/submission/{submission_id}": lambda: ok(
+            client.get(
+                f"{v1}/attempt/submission/{data.submission}", headers=candidate
+            )
+        ),
+        "GET /solution/attempt/{attempt_id}": lambda: ok(
+            client.get(
+                f"{v1}/solution/attempt/{data.attempt}", headers=candidate
+            )
+        ),
+        "POST+DELETE /solution": toggle_solution,
+        "PUT /submission/pause+resume": pause_resume,
+    }
+    return [Case(f"api.{name}", call) for name, call in cases.items()]
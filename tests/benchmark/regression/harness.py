@@ -0,0 +1,210 @@
+"""
+Measurement, storage and comparison of benchmark results.
+
+A result file maps every case to its latency distribution in microseconds,
+the number of SQL statements it executes and the peak of the memory it
+allocates per call:
+
+    {
+        "meta": {"iterations": 200, ...},
+        "cases": {
+            "crud.quiz.get": {
+                "latency_us": {"min": .., "mean": .., "p50": .., ...},
+                "queries": 1.0,
+                "alloc_peak_kib": 41.2
+            }
+        }
+    }
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from json import dump, load
+from platform import python_version
+from statistics import fmean, quantiles
+from subprocess import DEVNULL, CalledProcessError, check_output
+from time import perf_counter
+from tracemalloc import get_traced_memory, reset_peak, start, stop
+from typing import Any, Callable, Iterable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Relative increase over the baseline above which a metric regressed
+DEFAULT_THRESHOLDS: dict[str, float] = {
+    "p50": 0.2,
+    "p90": 0.3,
+    "p99": 0.5,
+    "queries": 0.0,
+    "alloc_peak_kib": 0.25,
+}
+# Latency differences below this are noise whatever their relative size
+DEFAULT_MIN_DELTA_US = 20.0
+
+
+@dataclass
+class Case:
+    name: str
+    call: Callable[[], Any]
+
+
+@dataclass
+class Regression:
+    case: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        if not self.baseline:
+            return float("inf")
+        return self.current / self.baseline - 1
+
+    def __str__(self) -> str:
+        return (
+            f"{self.case} {self.metric}: {self.baseline:.1f} -> "
+            f"{self.current:.1f} ({self.change:+.0%})"
+        )
+
+
+class QueryCounter:
+    def __init__(self, engines: Iterable[Engine]):
+        """
+        Count the statements sent to the database through `engines`.
+        """
+        self.count = 0
+        self.engines = list(engines)
+
+    def _increment(self, *args: Any) -> None:
+        self.count += 1
+
+    def __enter__(self) -> "QueryCounter":
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._increment)
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._increment)
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    us = sorted(latency * 1e6 for latency in latencies)
+    percentiles = quantiles(us, n=100, method="inclusive")
+    return {
+        "min": us[0],
+        "mean": fmean(us),
+        "p50": percentiles[49],
+        "p90": percentiles[89],
+        "p99": percentiles[98],
+        "max": us[-1],
+    }
+
+
+@dataclass
+class Harness:
+    engines: list[Engine]
+    iterations: int = 200
+    warmup: int = 20
+    results: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    def measure(self, case: Case) -> dict[str, Any]:
+        """
+        Time `case` over `iterations` calls after `warmup` calls, then count
+        its queries and allocations over separate calls, since tracing
+        allocations slows every call down.
+        """
+        for _ in range(self.warmup):
+            case.call()
+        latencies = []
+        for _ in range(self.iterations):
+            started = perf_counter()
+            case.call()
+            latencies.append(perf_counter() - started)
+        calls = max(self.iterations // 10, 1)
+        with QueryCounter(self.engines) as counter:
+            for _ in range(calls):
+                case.call()
+        peaks = []
+        start()
+        try:
+            for _ in range(calls):
+                current, _ = get_traced_memory()
+                reset_peak()
+                case.call()
+                peaks.append(get_traced_memory()[1] - current)
+        finally:
+            stop()
+        result = {
+            "latency_us": summarize(latencies),
+            "queries": counter.count / calls,
+            "alloc_peak_kib": fmean(peaks) / 1024,
+        }
+        self.results[case.name] = result
+        return result
+
+    def report(self) -> dict[str, Any]:
+        try:
+            commit = check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=DEVNULL
+            ).decode()
+        except (CalledProcessError, OSError):
+            commit = None
+        return {
+            "meta": {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "commit": commit.strip() if commit else None,
+                "python": python_version(),
+                "iterations": self.iterations,
+                "warmup": self.warmup,
+            },
+            "cases": self.results,
+        }
+
+
+def save(report: dict[str, Any], path: str) -> None:
+    with open(path, "w") as file:
+        dump(report, file, indent=2, sort_keys=True)
+
+
+def load_report(path: str) -> dict[str, Any]:
+    with open(path) as file:
+        return load(file)
+
+
+def metrics(result: dict[str, Any]) -> dict[str, float]:
+    return {
+        **result["latency_us"],
+        "queries": result["queries"],
+        "alloc_peak_kib": result["alloc_peak_kib"],
+    }
+
+
+def compare(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    thresholds: Optional[dict[str, float]] = None,
+    min_delta_us: float = DEFAULT_MIN_DELTA_US,
+) -> list[Regression]:
+    """
+    Return the metrics of the cases present in both reports that grew by
+    more than their threshold. Metrics without a threshold are not compared.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    regressions = []
+    for name, result in current["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        before = metrics(baseline["cases"][name])
+        after = metrics(result)
+        for metric, threshold in thresholds.items():
+            if metric not in after or metric not in before:
+                continue
+            delta = after[metric] - before[metric]
+            if metric in result["latency_us"] and delta < min_delta_us:
+                continue
+            if delta > before[metric] * threshold:
+                regressions.append(
+                    Regression(name, metric, before[metric], after[metric])
+                )
+    return regressions
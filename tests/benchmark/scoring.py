@@ -0,0 +1,150 @@
+"""
+Throughput of the vectorized scoring engine on a million attempts.
+
+Builds the answer key of a synthetic quiz and random selections of its
+answers, then times, for every scoring method, grading the selection matrix
+(`Scoring.grade`), grading from the ids the database returns
+(`Scoring.grade_attempts`, which also builds the matrix), and a row at a
+time loop over `--sample` of the attempts as the baseline. Needs no
+database:
+
+    $ PYTHONPATH=app python -m tests.benchmark.scoring --attempts 1000000
+"""
+from argparse import ArgumentParser
+from logging import INFO, Formatter, Logger, StreamHandler, getLogger
+from time import perf_counter
+from uuid import UUID, uuid4
+
+import numpy as np
+from app.core.scoring import AnswerKey, Scoring, ScoringMethod
+
+logger: Logger = getLogger(__name__)
+handler: StreamHandler = StreamHandler()
+fmt: Formatter = Formatter("%(asctime)s %(levelname)s %(message)s")
+handler.setFormatter(fmt)
+handler.setLevel(INFO)
+logger.addHandler(handler)
+logger.setLevel(INFO)
+
+
+class ScoringBenchmark:
+    def __init__(
+        self,
+        attempts: int = 1_000_000,
+        questions: int = 50,
+        answers: int = 4,
+        sample: int = 100_000,
+        seed: int = 0,
+    ) -> None:
+        generator = np.random.default_rng(seed)
+        question_ids = [uuid4() for _ in range(questions)]
+        self.key = AnswerKey(
+            (uuid4(), question_id, index < 1 + position % 2, 1.0)
+            for position, question_id in enumerate(question_ids)
+            for index in range(answers)
+        )
+        answer_ids = list(self.key.answer_index)
+        # Every attempt chooses every answer of its question with
+        # probability 0.4
+        self.questions = generator.integers(questions, size=attempts)
+        chosen = generator.random((attempts, answers)) < 0.4
+        rows, columns = np.nonzero(chosen)
+        self.rows = rows.astype(np.intp)
+        self.answers = (self.questions[rows] * answers + columns).astype(
+            np.intp
+        )
+        self.selection = self.key.select(
+            self.questions, self.rows, self.answers
+        )
+        self.attempts = [
+            (UUID(int=row), question_ids[question])
+            for row, question in enumerate(self.questions.tolist())
+        ]
+        self.chosen = [
+            (self.attempts[row][0], answer_ids[answer])
+            for row, answer in zip(self.rows.tolist(), self.answers.tolist())
+        ]
+        self.sample = min(sample, attempts)
+
+    def loop(self, scoring: Scoring) -> list:
+        """
+        Grade the sample one attempt at a time, the way summing solutions
+        per attempt does.
+        """
+        correct, weights = self.key.correct, self.key.weights
+        scores = []
+        for question, chosen in zip(
+            self.questions[: self.sample].tolist(),
+            self.selection[: self.sample],
+        ):
+            columns = self.key.questions == question
+            correct_chosen = int((chosen & correct & columns).sum())
+            incorrect_chosen = int((chosen & ~correct & columns).sum())
+            if not correct_chosen + incorrect_chosen:
+                scores.append(None)
+                continue
+            correct_count = self.key.correct_counts[question]
+            incorrect_count = self.key.incorrect_counts[question]
+            if scoring.method == ScoringMethod.ALL_OR_NOTHING:
+                score = float(
+                    correct_chosen == correct_count and not incorrect_chosen
+                )
+            else:
+                score = (
+                    correct_chosen / correct_count if correct_count else 0
+                ) - (
+                    incorrect_chosen / incorrect_count
+                    if incorrect_count
+                    else 0
+                )
+            if scoring.floor is not None:
+                score = max(score, scoring.floor)
+            scores.append(score * weights[question])
+        return scores
+
+    def run(self) -> dict[str, tuple[float, float, float]]:
+        results = {}
+        for scoring in (
+            Scoring(ScoringMethod.PARTIAL_CREDIT),
+            Scoring(ScoringMethod.PARTIAL_CREDIT, floor=0.0),
+            Scoring(ScoringMethod.ALL_OR_NOTHING),
+        ):
+            start = perf_counter()
+            scoring.grade(self.key, self.questions, self.selection)
+            matrix = perf_counter() - start
+            start = perf_counter()
+            scores = scoring.grade_attempts(
+                self.key, self.attempts, self.chosen
+            )
+            ids = perf_counter() - start
+            start = perf_counter()
+            expected = self.loop(scoring)
+            loop = (perf_counter() - start) * len(self.attempts) / self.sample
+            assert all(
+                (score is None and other is None) or abs(score - other) < 1e-9
+                for score, other in zip(scores, expected)
+            )
+            name = scoring.method.value
+            if scoring.floor is not None:
+                name += f" floor {scoring.floor:g}"
+            results[name] = (matrix, ids, loop)
+        return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--attempts", type=int, default=1_000_000)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--answers", type=int, default=4)
+    parser.add_argument("--sample", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark = ScoringBenchmark(
+        args.attempts, args.questions, args.answers, args.sample, args.seed
+    )
+    for name, (matrix, ids, loop) in benchmark.run().items():
+        logger.info(
+            "%s: %d attempts, matrix %.3f s, ids %.3f s, "
+            "row at a time %.1f s (estimated)"
+            % (name, args.attempts, matrix, ids, loop)
+        )
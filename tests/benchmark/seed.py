@@ -0,0 +1,538 @@
+"""
+Synthetic production-scale dataset, streamed into Postgres with `COPY`.
+
+Generates users, quizzes with their questions and answers, and submissions
+with their attempts, solutions and counters, bypassing the API: every user
+shares one precomputed bcrypt hash of `--password`, points and scores are
+computed the way the API computes them, and ids are time-ordered like the
+ones the app generates. Quizzes are written `--batch-size` at a time, every
+table of a batch in foreign key order, one transaction per batch, so memory
+stays flat however large the dataset.
+
+The distributions aim at what a live service accumulates: a few authors
+write most quizzes, a few quizzes draw most submissions (Pareto), candidates
+vary in skill, and some submissions are still drafts. Runs against the
+database in `SQLALCHEMY_URL`, next to whatever data it already holds:
+
+    $ PYTHONPATH=app python -m tests.benchmark.seed --users 1000000
+"""
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from logging import INFO, Formatter, Logger, StreamHandler, getLogger
+from multiprocessing import Queue, get_context
+from os import getenv, urandom
+from random import Random
+from time import perf_counter
+from typing import Any, Optional
+
+from passlib.hash import bcrypt
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+logger: Logger = getLogger(__name__)
+handler: StreamHandler = StreamHandler()
+fmt: Formatter = Formatter("%(asctime)s %(levelname)s %(message)s")
+handler.setFormatter(fmt)
+handler.setLevel(INFO)
+logger.addHandler(handler)
+logger.setLevel(INFO)
+
+# Tables in foreign key order with the columns they are copied with
+COLUMNS: dict[str, tuple[str, ...]] = {
+    "users": ("id", "created_at", "updated_at", "email", "hashed_password"),
+    "quizzes": (
+        "id",
+        "created_at",
+        "updated_at",
+        "author_id",
+        "title",
+        "published",
+        "resumable",
+        "description",
+        "duration",
+    ),
+    "questions": (
+        "id",
+        "created_at",
+        "updated_at",
+        "quiz_id",
+        "question_text",
+        "duration",
+        "resumable",
+    ),
+    "answers": (
+        "id",
+        "created_at",
+        "updated_at",
+        "question_id",
+        "answer_text",
+        "is_correct",
+        "point",
+    ),
+    "submissions": (
+        "id",
+        "created_at",
+        "updated_at",
+        "quiz_id",
+        "user_id",
+        "draft",
+        "paused",
+        "score",
+        "time_remaining",
+    ),
+    "submission_counters": (
+        "id",
+        "created_at",
+        "updated_at",
+        "quiz_id",
+        "user_id",
+        "count",
+    ),
+    "attempts": (
+        "id",
+        "created_at",
+        "updated_at",
+        "question_id",
+        "submission_id",
+        "quiz_id",
+        "user_id",
+        "draft",
+        "skipped",
+        "time_remaining",
+        "score",
+    ),
+    "solutions": (
+        "id",
+        "created_at",
+        "updated_at",
+        "attempt_id",
+        "answer_id",
+        "quiz_id",
+        "user_id",
+        "point",
+    ),
+}
+NULL = r"\N"
+
+
+def value(item: Any) -> str:
+    # Ids and timestamps are formatted once and passed as strings
+    if type(item) is str:
+        return item
+    if item is None:
+        return NULL
+    if isinstance(item, bool):
+        return "t" if item else "f"
+    if isinstance(item, datetime):
+        return item.isoformat()
+    return str(item)
+
+
+class Copier:
+    def __init__(self, engine: Engine, skip_fk_checks: bool = False) -> None:
+        """
+        Buffers rows per table in `COPY` text format and sends every buffer
+        over one raw DBAPI connection.
+
+        The generated rows are consistent by construction, so with
+        `skip_fk_checks` the session skips the foreign key triggers, which
+        takes a superuser.
+        """
+        self.connection = engine.raw_connection()
+        cursor = self.connection.cursor()
+        cursor.execute("SET synchronous_commit TO off")
+        if skip_fk_checks:
+            cursor.execute("SET session_replication_role TO replica")
+        cursor.close()
+        self.buffers = {table: StringIO() for table in COLUMNS}
+        self.rows = {table: 0 for table in COLUMNS}
+
+    def add(self, table: str, *row: Any) -> None:
+        self.buffers[table].write("\t".join(map(value, row)) + "\n")
+        self.rows[table] += 1
+
+    def flush(self) -> None:
+        cursor = self.connection.cursor()
+        for table, columns in COLUMNS.items():
+            buffer = self.buffers[table]
+            if not buffer.tell():
+                continue
+            buffer.seek(0)
+            sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+            if hasattr(cursor, "copy_expert"):
+                cursor.copy_expert(sql, buffer)
+            else:
+                # psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+            self.buffers[table] = StringIO()
+        self.connection.commit()
+        cursor.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class Seeder:
+    def __init__(
+        self,
+        engine: Engine,
+        users: int = 100_000,
+        quizzes: Optional[int] = None,
+        submissions: Optional[int] = None,
+        max_questions: int = 10,
+        max_answers: int = 5,
+        days: int = 365,
+        batch_size: int = 1_000,
+        password: str = "password",
+        seed: Optional[int] = None,
+        skip_fk_checks: bool = False,
+    ) -> None:
+        self.engine = engine
+        self.skip_fk_checks = skip_fk_checks
+        self.users = users
+        self.quizzes = quizzes or max(users // 10, 1)
+        self.submissions = submissions or users * 5
+        self.max_questions = max_questions
+        self.max_answers = max_answers
+        self.batch_size = batch_size
+        self.hashed_password = bcrypt.hash(password)
+        self.random_seed = seed
+        self.random = Random(seed)
+        self.run = urandom(4).hex()
+        self.end = datetime.now(timezone.utc)
+        self.start = self.end - timedelta(days=days)
+        self.user_ids: list[str] = []
+
+    def uuid7(self, at: datetime) -> str:
+        milliseconds = int(at.timestamp() * 1000)
+        digits = "%032x" % (
+            (milliseconds & 0xFFFF_FFFF_FFFF) << 80
+            | 0x7 << 76
+            | self.random.getrandbits(12) << 64
+            | 0b10 << 62
+            | self.random.getrandbits(62)
+        )
+        return "-".join(
+            (
+                digits[:8],
+                digits[8:12],
+                digits[12:16],
+                digits[16:20],
+                digits[20:],
+            )
+        )
+
+    def at(self, fraction: float) -> datetime:
+        return self.start + (self.end - self.start) * fraction
+
+    def seed_users(self, copier: Copier) -> None:
+        # Users sign up over the first half of the period
+        for i in range(self.users):
+            created_at = self.at(0.5 * i / self.users)
+            id = self.uuid7(created_at)
+            stamp = created_at.isoformat()
+            self.user_ids.append(id)
+            copier.add(
+                "users",
+                id,
+                stamp,
+                stamp,
+                f"user{i}.{self.run}@seed.example.com",
+                self.hashed_password,
+            )
+            if (i + 1) % (self.batch_size * 50) == 0:
+                copier.flush()
+        copier.flush()
+
+    def seed_quiz(self, copier: Copier, number: int) -> None:
+        random = self.random
+        created_at = self.at(0.5 + 0.5 * number / self.quizzes)
+        quiz_id = self.uuid7(created_at)
+        stamp = created_at.isoformat()
+        # A few prolific authors among the first tenth of the users
+        authors = max(self.users // 10, 1)
+        author_id = self.user_ids[int(authors * random.random() ** 3)]
+        published = random.random() < 0.9
+        resumable = random.random() < 0.5
+        minutes = [
+            random.choice((1, 2, 5, 10))
+            for _ in range(random.randint(1, self.max_questions))
+        ]
+        questions = [
+            (self.uuid7(created_at), f"{duration} minutes", [])
+            for duration in minutes
+        ]
+        quiz_duration = (
+            f"{sum(minutes)} minutes" if random.random() < 0.7 else None
+        )
+        copier.add(
+            "quizzes",
+            quiz_id,
+            stamp,
+            stamp,
+            author_id,
+            f"Quiz {number}",
+            published,
+            resumable,
+            None if random.random() < 0.5 else f"Description of quiz {number}",
+            quiz_duration,
+        )
+        for i, (question_id, duration, answers) in enumerate(questions):
+            copier.add(
+                "questions",
+                question_id,
+                stamp,
+                stamp,
+                quiz_id,
+                f"Question {i} of quiz {number}",
+                duration,
+                resumable,
+            )
+            count = random.randint(2, max(self.max_answers, 2))
+            correct = set(
+                random.sample(range(count), random.choice((1, 1, 2)))
+            )
+            for j in range(count):
+                is_correct = j in correct
+                # Correct answers share +1 and incorrect ones share -1
+                point = (
+                    1 / len(correct)
+                    if is_correct
+                    else -1 / (count - len(correct))
+                )
+                answer_id = self.uuid7(created_at)
+                answers.append((answer_id, is_correct, point))
+                copier.add(
+                    "answers",
+                    answer_id,
+                    stamp,
+                    stamp,
+                    question_id,
+                    f"Answer {j}",
+                    is_correct,
+                    point,
+                )
+        if not published:
+            return
+        mean = self.submissions / self.quizzes
+        # Pareto with shape 1.5 has mean 3
+        participants = min(
+            int(random.paretovariate(1.5) * mean / 3), self.users
+        )
+        for user in random.sample(range(self.users), participants):
+            self.seed_submission(
+                copier, quiz_id, self.user_ids[user], created_at, questions
+            )
+
+    def seed_submission(
+        self,
+        copier: Copier,
+        quiz_id: str,
+        user_id: str,
+        quiz_created_at: datetime,
+        questions: list[tuple[str, str, list]],
+    ) -> None:
+        random = self.random
+        created_at = quiz_created_at + random.random() * (
+            self.end - quiz_created_at
+        )
+        submitted_at = min(
+            created_at + timedelta(minutes=random.randint(1, 60)), self.end
+        )
+        submission_id = self.uuid7(created_at)
+        stamp = created_at.isoformat()
+        submitted_stamp = submitted_at.isoformat()
+        draft = random.random() < 0.1
+        skill = random.betavariate(2, 2)
+        score = None
+        for question_id, duration, answers in questions:
+            attempt_id = self.uuid7(created_at)
+            attempt_score = None
+            if not draft or random.random() < 0.5:
+                correct = [a for a in answers if a[1]]
+                incorrect = [a for a in answers if not a[1]]
+                chosen = [
+                    random.choice(
+                        correct
+                        if not incorrect or random.random() < skill
+                        else incorrect
+                    )
+                ]
+                if random.random() < 0.1:
+                    chosen.append(random.choice(answers))
+                for answer_id, _, point in dict.fromkeys(chosen):
+                    copier.add(
+                        "solutions",
+                        self.uuid7(created_at),
+                        stamp,
+                        stamp,
+                        attempt_id,
+                        answer_id,
+                        quiz_id,
+                        user_id,
+                        point,
+                    )
+                    attempt_score = (attempt_score or 0) + point
+            if not draft:
+                score = (score or 0) + (attempt_score or 0)
+            copier.add(
+                "attempts",
+                attempt_id,
+                stamp,
+                stamp if draft else submitted_stamp,
+                question_id,
+                submission_id,
+                quiz_id,
+                user_id,
+                draft,
+                False,
+                duration,
+                None if draft else attempt_score,
+            )
+        copier.add(
+            "submissions",
+            submission_id,
+            stamp,
+            stamp if draft else submitted_stamp,
+            quiz_id,
+            user_id,
+            draft,
+            False,
+            score,
+            None,
+        )
+        copier.add(
+            "submission_counters",
+            self.uuid7(created_at),
+            stamp,
+            stamp,
+            quiz_id,
+            user_id,
+            1,
+        )
+
+    def seed_quizzes(self, first: int, last: int, worker: int) -> Counter:
+        if self.random_seed is not None:
+            self.random = Random(f"{self.random_seed}:{worker}")
+        copier = Copier(self.engine, self.skip_fk_checks)
+        started = perf_counter()
+        try:
+            for number in range(first, last):
+                self.seed_quiz(copier, number)
+                done = number + 1 - first
+                if done % self.batch_size == 0:
+                    copier.flush()
+                    logger.info(
+                        "Worker %d copied %d of %d quizzes, %d rows/s"
+                        % (
+                            worker,
+                            done,
+                            last - first,
+                            sum(copier.rows.values())
+                            / (perf_counter() - started),
+                        )
+                    )
+            copier.flush()
+        finally:
+            copier.close()
+        return Counter(copier.rows)
+
+    def work(self, first: int, last: int, worker: int, rows: Queue) -> None:
+        # Connections must not be shared with the parent process
+        self.engine.dispose(close=False)
+        rows.put(self.seed_quizzes(first, last, worker))
+
+    def seed(self, jobs: int = 1) -> Counter:
+        """
+        Copy the users, then the quizzes and everything under them, split
+        between `jobs` processes. A quiz only refers to users and to rows
+        of its own, so the processes never wait on each other's rows.
+        """
+        copier = Copier(self.engine, self.skip_fk_checks)
+        try:
+            self.seed_users(copier)
+        finally:
+            copier.close()
+        logger.info("Copied %d users" % self.users)
+        rows = Counter(copier.rows)
+        if jobs == 1:
+            rows += self.seed_quizzes(0, self.quizzes, 0)
+        else:
+            # Forked workers inherit the user ids instead of pickling them
+            context = get_context("fork")
+            queue = context.Queue()
+            bounds = [self.quizzes * i // jobs for i in range(jobs + 1)]
+            workers = [
+                context.Process(
+                    target=self.work, args=(first, last, worker, queue)
+                )
+                for worker, (first, last) in enumerate(zip(bounds, bounds[1:]))
+            ]
+            for process in workers:
+                process.start()
+            for _ in workers:
+                rows += queue.get()
+            for process in workers:
+                process.join()
+                if process.exitcode:
+                    raise RuntimeError(
+                        f"Worker {process.pid} exited with {process.exitcode}"
+                    )
+        with self.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            for table in COLUMNS:
+                connection.execute(text(f"ANALYZE {table}"))
+        return rows
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--url", default=getenv("SQLALCHEMY_URL"))
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument(
+        "--quizzes", type=int, help="defaults to a tenth of the users"
+    )
+    parser.add_argument(
+        "--submissions",
+        type=int,
+        help="expected total, defaults to five per user",
+    )
+    parser.add_argument("--max-questions", type=int, default=10)
+    parser.add_argument("--max-answers", type=int, default=5)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument(
+        "--skip-fk-checks",
+        action="store_true",
+        help="skip foreign key triggers while copying, needs a superuser",
+    )
+    args = parser.parse_args()
+    seeder = Seeder(
+        create_engine(args.url),
+        users=args.users,
+        quizzes=args.quizzes,
+        submissions=args.submissions,
+        max_questions=args.max_questions,
+        max_answers=args.max_answers,
+        days=args.days,
+        batch_size=args.batch_size,
+        password=args.password,
+        seed=args.seed,
+        skip_fk_checks=args.skip_fk_checks,
+    )
+    started = perf_counter()
+    rows = seeder.seed(args.jobs)
+    logger.info(
+        "Seeded %s in %.0f s"
+        % (
+            ", ".join(f"{count} {table}" for table, count in rows.items()),
+            perf_counter() - started,
+        )
+    )
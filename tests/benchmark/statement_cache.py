@@ -0,0 +1,109 @@
+"""
+Per-call Python CPU time of ad hoc vs precompiled CRUD lookups.
+
+The ad hoc variants rebuild their `db.query(...).filter(...)` statement on
+every call, the way the CRUD modules used to; the precompiled variants are
+the module-level statements the CRUD modules use now. Runs inside a
+transaction that is rolled back, against the schema in `SQLALCHEMY_URL`:
+
+    $ PYTHONPATH=app python -m tests.benchmark.statement_cache
+"""
+from argparse import ArgumentParser
+from logging import INFO, Formatter, Logger, StreamHandler, getLogger
+from os import getenv
+from time import process_time
+from typing import Callable
+from uuid import uuid4
+
+from app.crud.submission import COUNT_BY_QUIZ_USER
+from app.crud.user import GET_BY_EMAIL
+from app.db.base_class import uuid7
+from app.models import Submission, User
+from sqlalchemy import bindparam, create_engine, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger: Logger = getLogger(__name__)
+handler: StreamHandler = StreamHandler()
+fmt: Formatter = Formatter("%(asctime)s %(levelname)s %(message)s")
+handler.setFormatter(fmt)
+handler.setLevel(INFO)
+logger.addHandler(handler)
+logger.setLevel(INFO)
+
+GET = select(User).where(User.id == bindparam("id"))
+
+
+class StatementCacheBenchmark:
+    def __init__(self, engine: Engine, calls: int = 10_000) -> None:
+        self.engine = engine
+        self.calls = calls
+
+    def cases(
+        self, user: User, quiz_id
+    ) -> dict[str, tuple[Callable, Callable]]:
+        return {
+            "get": (
+                lambda db: db.query(User).filter(User.id == user.id).first(),
+                lambda db: db.scalars(GET, {"id": user.id}).first(),
+            ),
+            "get_by_email": (
+                lambda db: db.query(User)
+                .filter(User.email == user.email)
+                .first(),
+                lambda db: db.scalars(
+                    GET_BY_EMAIL, {"email": user.email}
+                ).first(),
+            ),
+            "count_by_quiz_user": (
+                lambda db: db.query(Submission)
+                .filter(
+                    Submission.user_id == user.id,
+                    Submission.quiz_id == quiz_id,
+                )
+                .count(),
+                lambda db: db.scalar(
+                    COUNT_BY_QUIZ_USER,
+                    {"quiz_id": quiz_id, "user_id": user.id},
+                ),
+            ),
+        }
+
+    def measure(self, db: Session, call: Callable) -> float:
+        for _ in range(100):
+            call(db)
+        start = process_time()
+        for _ in range(self.calls):
+            call(db)
+        return (process_time() - start) / self.calls
+
+    def run(self) -> dict[str, tuple[float, float]]:
+        with Session(self.engine) as db:
+            user = User(
+                id=uuid7(),
+                email=f"{uuid4().hex}@benchmark.invalid",
+                hashed_password="",
+            )
+            db.add(user)
+            db.flush()
+            results = {
+                name: (self.measure(db, adhoc), self.measure(db, cached))
+                for name, (adhoc, cached) in self.cases(user, uuid4()).items()
+            }
+            db.rollback()
+        return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--url", default=getenv("SQLALCHEMY_URL"))
+    parser.add_argument("--calls", type=int, default=10_000)
+    args = parser.parse_args()
+    benchmark = StatementCacheBenchmark(
+        create_engine(args.url), calls=args.calls
+    )
+    for name, (adhoc, cached) in benchmark.run().items():
+        logger.info(
+            "%s: ad hoc %.1f us, precompiled %.1f us, %.0f%% less CPU"
+            % (name, adhoc * 1e6, cached * 1e6, 100 * (1 - cached / adhoc))
+        )
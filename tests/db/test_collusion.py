@@ -0,0 +1,53 @@
+from unittest import TestCase, main
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+import numpy as np
+from app.db import collusion
+
+
+class AnalyzeTest(TestCase):
+    def analyze(
+        self, submissions: int, selection: np.ndarray, incorrect: np.ndarray
+    ) -> tuple[int, MagicMock]:
+        bind = MagicMock()
+        loaded = ([uuid4() for _ in range(submissions)], selection, incorrect)
+        with patch.object(
+            collusion.shards, "engine_for", return_value=bind
+        ), patch.object(collusion, "load", return_value=loaded):
+            return collusion.analyze(uuid4()), bind
+
+    def assert_cleared(self, bind: MagicMock) -> None:
+        connection = bind.begin.return_value.__enter__.return_value
+        connection.execute.assert_called_once()
+        self.assertIs(
+            connection.execute.call_args.args[0], collusion.DELETE_FLAGS
+        )
+
+    def test_empty_quiz(self) -> None:
+        flags, bind = self.analyze(
+            0, np.zeros((0, 0), dtype=bool), np.zeros(0, dtype=bool)
+        )
+        self.assertEqual(flags, 0)
+        self.assert_cleared(bind)
+
+    def test_quiz_without_submissions(self) -> None:
+        flags, bind = self.analyze(
+            0, np.zeros((0, 8), dtype=bool), np.ones(8, dtype=bool)
+        )
+        self.assertEqual(flags, 0)
+        self.assert_cleared(bind)
+
+    def test_only_common_patterns(self) -> None:
+        submissions = collusion.MAX_GROUP + 1
+        selection = np.zeros((submissions, 8), dtype=bool)
+        selection[:, :4] = True
+        flags, bind = self.analyze(
+            submissions, selection, np.ones(8, dtype=bool)
+        )
+        self.assertEqual(flags, 0)
+        self.assert_cleared(bind)
+
+
+if __name__ == "__main__":
+    main()